@@ -0,0 +1,128 @@
+"""Time the hot lookup queries before and after adding the ORM indexes.
+
+Seeds ``--rows`` friends and friend requests (plus one profile per ten rows),
+runs each lookup with the secondary indexes dropped, then adds them back with
+``orm.create_missing_indexes`` and runs the lookups again.
+
+    PYTHONPATH=src python benchmarks/friend_lookups.py --rows 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+
+from sqlalchemy import create_engine, insert, select, text
+
+from user_service.adapters import orm
+
+QUERIES = {
+    "friends by sender_id": lambda ids: select(orm.friends.c.receiver_id).where(
+        orm.friends.c.sender_id == random.choice(ids["users"])
+    ),
+    "friends by receiver_id": lambda ids: select(orm.friends.c.sender_id).where(
+        orm.friends.c.receiver_id == random.choice(ids["users"])
+    ),
+    "friend_requests by receiver_id": lambda ids: select(
+        orm.friend_requests.c.id
+    ).where(orm.friend_requests.c.receiver_id == random.choice(ids["users"])),
+    "friend_requests by message_id": lambda ids: select(orm.friend_requests.c.id).where(
+        orm.friend_requests.c.message_id == random.choice(ids["messages"])
+    ),
+    "profiles by user_id": lambda ids: select(orm.profiles.c.id).where(
+        orm.profiles.c.user_id == random.choice(ids["users"])
+    ),
+}
+
+
+def seed(engine, rows, chunk_size=10_000):
+    user_ids = [str(uuid.uuid4()) for _ in range(max(rows // 10, 2))]
+    message_ids = []
+
+    with engine.begin() as conn:
+        for start in range(0, len(user_ids), chunk_size):
+            conn.execute(
+                insert(orm.profiles),
+                [
+                    {"id": str(uuid.uuid4()), "user_id": user_id, "friends": 0}
+                    for user_id in user_ids[start : start + chunk_size]
+                ],
+            )
+
+        for table in (orm.friends, orm.friend_requests):
+            for start in range(0, rows, chunk_size):
+                batch = []
+                for offset in range(min(chunk_size, rows - start)):
+                    message_id = str(uuid.uuid4())
+                    message_ids.append(message_id)
+                    batch.append(
+                        {
+                            "id": str(uuid.uuid4()),
+                            "message_id": message_id,
+                            "sender_id": user_ids[(start + offset) % len(user_ids)],
+                            "receiver_id": str(uuid.uuid4()),
+                        }
+                    )
+                conn.execute(insert(table), batch)
+
+    return {"users": user_ids, "messages": message_ids}
+
+
+def drop_secondary_indexes(engine):
+    with engine.begin() as conn:
+        for table in orm.metadata.sorted_tables:
+            for index in table.indexes:
+                index.drop(conn)
+
+
+def run_queries(engine, ids, repeat):
+    timings = {}
+    with engine.connect() as conn:
+        for name, build in QUERIES.items():
+            samples = []
+            for _ in range(repeat):
+                statement = build(ids)
+                started = time.perf_counter()
+                conn.execute(statement).all()
+                samples.append((time.perf_counter() - started) * 1000)
+            timings[name] = statistics.median(samples)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument(
+        "--uri",
+        help="scratch database URI (its tables are dropped), defaults to a temporary "
+        "SQLite file",
+    )
+    args = parser.parse_args()
+
+    uri = args.uri or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_engine(uri)
+    orm.metadata.drop_all(engine)
+    orm.metadata.create_all(engine)
+    drop_secondary_indexes(engine)
+
+    started = time.perf_counter()
+    ids = seed(engine, args.rows)
+    print(f"seeded {args.rows} rows in {time.perf_counter() - started:.1f}s")
+
+    without_indexes = run_queries(engine, ids, args.repeat)
+    with engine.begin() as conn:
+        orm.create_missing_indexes(conn)
+        if engine.dialect.name == "sqlite":
+            conn.execute(text("ANALYZE"))
+    with_indexes = run_queries(engine, ids, args.repeat)
+
+    print(f"{'query':<32}{'no index (ms)':>16}{'indexed (ms)':>16}")
+    for name in QUERIES:
+        print(f"{name:<32}{without_indexes[name]:>16.3f}{with_indexes[name]:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
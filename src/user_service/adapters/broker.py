@@ -0,0 +1,317 @@
+import abc
+import asyncio
+import dataclasses
+import sqlite3
+import threading
+import time
+from typing import Any, Iterable, Optional
+from urllib.parse import urlparse
+
+from user_service import config
+from user_service.adapters import outbox
+from user_service.domains import events
+
+
+@dataclasses.dataclass
+class Delivery:
+    event: events.Event
+    tag: Any
+    attempts: int = 1
+
+
+class AbstractBroker(abc.ABC):
+    async def publish(self, event: events.Event):
+        await self.publish_many([event])
+
+    @abc.abstractmethod
+    async def publish_many(self, new_events: Iterable[events.Event]):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def consume(self) -> Delivery:
+        """Wait for the next event and return it until it is acked or nacked."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def ack(self, delivery: Delivery):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def nack(self, delivery: Delivery):
+        """Hand the event back to the broker so it is delivered again."""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class InMemoryBroker(AbstractBroker):
+    """Broker backed by an asyncio queue; only shared within one process.
+
+    It is not durable: the relay removes events from the outbox once they are
+    published, so events still in the queue are lost if the process exits.
+    Use it for development and tests only.
+    """
+
+    def __init__(self):
+        self._queue = asyncio.Queue()
+
+    async def publish_many(self, new_events: Iterable[events.Event]):
+        for event in new_events:
+            self._queue.put_nowait(Delivery(event=event, tag=event._id, attempts=0))
+
+    async def consume(self) -> Delivery:
+        delivery = await self._queue.get()
+        delivery.attempts += 1
+        return delivery
+
+    async def ack(self, delivery: Delivery):
+        self._queue.task_done()
+
+    async def nack(self, delivery: Delivery):
+        self._queue.task_done()
+        self._queue.put_nowait(delivery)
+
+
+class SqliteBroker(AbstractBroker):
+    """Broker backed by a SQLite file that several processes can share.
+
+    A consumed event stays in the file, hidden for ``visibility_timeout``
+    seconds, until it is acked. If its consumer dies, it becomes visible again
+    and is redelivered.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        poll_interval: float = 0.5,
+        visibility_timeout: float = 60,
+    ):
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "id TEXT NOT NULL, "
+            "event_type TEXT NOT NULL, "
+            "payload TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "visible_at REAL NOT NULL DEFAULT 0)"
+        )
+
+    def _publish_many(self, rows):
+        with self._lock:
+            self._connection.executemany(
+                "INSERT INTO events (id, event_type, payload) VALUES (?, ?, ?)",
+                [(row["id"], row["event_type"], row["payload"]) for row in rows],
+            )
+
+    def _claim(self):
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute(
+                    "SELECT seq, id, event_type, payload, attempts FROM events "
+                    "WHERE visible_at <= ? ORDER BY seq LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is not None:
+                    self._connection.execute(
+                        "UPDATE events SET attempts = attempts + 1, visible_at = ? "
+                        "WHERE seq = ?",
+                        (now + self.visibility_timeout, row[0]),
+                    )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+        return row
+
+    def _execute(self, statement, parameters):
+        with self._lock:
+            self._connection.execute(statement, parameters)
+
+    async def publish_many(self, new_events: Iterable[events.Event]):
+        rows = [outbox.encode(event) for event in new_events]
+        if rows:
+            await asyncio.to_thread(self._publish_many, rows)
+
+    async def consume(self) -> Delivery:
+        while True:
+            row = await asyncio.to_thread(self._claim)
+            if row is not None:
+                seq, id, event_type, payload, attempts = row
+                return Delivery(
+                    event=outbox.decode(id, event_type, payload),
+                    tag=seq,
+                    attempts=attempts + 1,
+                )
+            await asyncio.sleep(self.poll_interval)
+
+    async def ack(self, delivery: Delivery):
+        await asyncio.to_thread(
+            self._execute, "DELETE FROM events WHERE seq = ?", (delivery.tag,)
+        )
+
+    async def nack(self, delivery: Delivery):
+        await asyncio.to_thread(
+            self._execute,
+            "UPDATE events SET visible_at = 0 WHERE seq = ?",
+            (delivery.tag,),
+        )
+
+    async def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class RedisBroker(AbstractBroker):
+    """Broker on a Redis stream read through a consumer group.
+
+    An entry stays pending in the group until it is acked. Before reading new
+    entries, a consumer claims those left pending for ``claim_idle_ms`` by a
+    consumer that died, so they are redelivered instead of stranded.
+
+    ``client`` is anything with the ``redis.asyncio.Redis`` stream commands
+    (``xgroup_create``, ``xadd``, ``xreadgroup``, ``xautoclaim``,
+    ``xpending_range``, ``xack``), so a local stand-in can replace a real
+    server.
+    """
+
+    def __init__(
+        self,
+        client,
+        stream: str = "user-service:events",
+        group: str = "user-service-workers",
+        consumer: Optional[str] = None,
+        block_ms: int = 5000,
+        claim_idle_ms: Optional[int] = None,
+    ):
+        settings = config.get_redis_broker_config()
+        self.client = client
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer or settings["consumer"]
+        self.block_ms = block_ms
+        self.claim_idle_ms = (
+            claim_idle_ms if claim_idle_ms is not None else settings["claim_idle_ms"]
+        )
+        self._group_created = False
+        self._claim_cursor = "0-0"
+        self._next_claim_at = 0.0
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisBroker":
+        import redis.asyncio
+
+        return cls(redis.asyncio.Redis.from_url(url), **kwargs)
+
+    async def _ensure_group(self):
+        if self._group_created:
+            return
+        try:
+            await self.client.xgroup_create(
+                self.stream, self.group, id="0", mkstream=True
+            )
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_created = True
+
+    async def publish_many(self, new_events: Iterable[events.Event]):
+        for event in new_events:
+            fields = outbox.encode(event)
+            fields["attempts"] = "0"
+            await self.client.xadd(self.stream, fields)
+
+    def _delivery(self, entry_id, fields, delivered: int) -> Delivery:
+        fields = {_decode(key): _decode(value) for key, value in fields.items()}
+        return Delivery(
+            event=outbox.decode(fields["id"], fields["event_type"], fields["payload"]),
+            tag=entry_id,
+            attempts=int(fields.get("attempts", 0)) + delivered,
+        )
+
+    async def _claim_stale(self) -> Optional[Delivery]:
+        """Claim one entry another consumer left pending for too long."""
+        if time.monotonic() < self._next_claim_at:
+            return None
+        response = await self.client.xautoclaim(
+            self.stream,
+            self.group,
+            self.consumer,
+            min_idle_time=self.claim_idle_ms,
+            start_id=self._claim_cursor,
+            count=1,
+        )
+        self._claim_cursor = _decode(response[0])
+        for entry_id, fields in response[1]:
+            if not fields:
+                # Trimmed from the stream while pending; nothing to redeliver.
+                await self.client.xack(self.stream, self.group, entry_id)
+                continue
+            pending = await self.client.xpending_range(
+                self.stream, self.group, min=entry_id, max=entry_id, count=1
+            )
+            delivered = pending[0]["times_delivered"] if pending else 2
+            return self._delivery(entry_id, fields, delivered)
+        if self._claim_cursor == "0-0":
+            # Scanned the whole pending list; look again once entries read
+            # after this could have gone stale.
+            self._next_claim_at = time.monotonic() + self.claim_idle_ms / 1000
+        return None
+
+    async def consume(self) -> Delivery:
+        await self._ensure_group()
+        while True:
+            delivery = await self._claim_stale()
+            if delivery is not None:
+                return delivery
+            response = await self.client.xreadgroup(
+                self.group,
+                self.consumer,
+                {self.stream: ">"},
+                count=1,
+                block=self.block_ms,
+            )
+            for _, entries in response or []:
+                for entry_id, fields in entries:
+                    return self._delivery(entry_id, fields, delivered=1)
+
+    async def ack(self, delivery: Delivery):
+        await self.client.xack(self.stream, self.group, delivery.tag)
+
+    async def nack(self, delivery: Delivery):
+        fields = outbox.encode(delivery.event)
+        fields["attempts"] = str(delivery.attempts)
+        await self.client.xadd(self.stream, fields)
+        await self.ack(delivery)
+
+    async def close(self):
+        close = getattr(self.client, "aclose", None) or getattr(
+            self.client, "close", None
+        )
+        if close is not None:
+            await close()
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def from_url(url: str) -> AbstractBroker:
+    """Build a broker from ``memory://``, ``sqlite:///<path>`` or ``redis://...``."""
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return InMemoryBroker()
+    if scheme == "sqlite":
+        return SqliteBroker(url[len("sqlite:///") :])
+    if scheme in ("redis", "rediss"):
+        return RedisBroker.from_url(url)
+    raise ValueError(f"Unsupported broker url {url}")
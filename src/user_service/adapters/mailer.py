@@ -0,0 +1,87 @@
+import abc
+import asyncio
+import contextlib
+import logging
+import os
+from collections import defaultdict, deque
+from typing import Iterable, Optional, Tuple
+
+from user_service import config
+
+logger = logging.getLogger(__name__)
+
+
+class AbstractMailer(abc.ABC):
+    @abc.abstractmethod
+    async def send(self, address: str, content: str):
+        """Queue ``content`` for ``address``; delivery happens in the background."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def send_sync(self, address: str, content: str):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class FileMailer(AbstractMailer):
+    """Appends each message as a line of ``<directory>/<address>.txt``.
+
+    Messages sent within ``flush_interval`` seconds of each other are written
+    together by a background task, up to ``batch_size`` per thread hop and
+    one file open per address, so handlers never wait on file I/O.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+    ):
+        settings = config.get_mailer_config()
+        self.directory = directory or settings["directory"]
+        self.batch_size = batch_size or settings["batch_size"]
+        self.flush_interval = (
+            flush_interval if flush_interval is not None else settings["flush_interval"]
+        )
+        self._pending = deque()
+        self._task: Optional[asyncio.Task] = None
+
+    def _write(self, messages: Iterable[Tuple[str, str]]):
+        contents = defaultdict(list)
+        for address, content in messages:
+            contents[address].append(f"{content}\n")
+        for address, lines in contents.items():
+            with open(os.path.join(self.directory, f"{address}.txt"), "a") as file:
+                file.write("".join(lines))
+
+    async def send(self, address: str, content: str):
+        self._pending.append((address, content))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_later())
+
+    def send_sync(self, address: str, content: str):
+        self._write([(address, content)])
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        while self._pending:
+            batch = [
+                self._pending.popleft()
+                for _ in range(min(self.batch_size, len(self._pending)))
+            ]
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except Exception:
+                logger.exception("Exception delivering %d emails", len(batch))
+
+    async def close(self):
+        if self._task is not None and not self._task.done():
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+        self._task = None
+        await self.flush()
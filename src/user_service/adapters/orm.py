@@ -9,10 +9,15 @@ from sqlalchemy import (
     Integer,
     Boolean,
     Date,
+    Text,
     TIMESTAMP,
     ForeignKey,
+    Index,
     event,
+    inspect,
 )
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.orm import registry, relationship
 
 from user_service.domains import models
@@ -22,12 +27,11 @@ logger = logging.getLogger(__name__)
 
 mapper_registry = registry()
 metadata = MetaData()
-engine = create_engine(config.get_mysql_uri())
 
 users = Table(
     "users",
     metadata,
-    Column("message_id", String(255)),
+    Column("message_id", String(255), index=True),
     Column("id", String(255), primary_key=True),
     Column("username", String(255), unique=True),
     Column("email", String(255), unique=True),
@@ -35,6 +39,7 @@ users = Table(
     Column("secret_token", String(255), unique=True),
     Column("two_factor_auth_enabled", Boolean),
     Column("locked", Boolean),
+    Column("token_version", Integer, nullable=False, default=0, server_default="0"),
     Column("created_time", TIMESTAMP),
     Column("updated_time", TIMESTAMP),
 )
@@ -42,9 +47,9 @@ users = Table(
 profiles = Table(
     "profiles",
     metadata,
-    Column("message_id", String(255)),
+    Column("message_id", String(255), index=True),
     Column("id", String(255), primary_key=True),
-    Column("user_id", String(255), ForeignKey("users.id"), nullable=False),
+    Column("user_id", String(255), ForeignKey("users.id"), nullable=False, index=True),
     Column("first_name", String(255)),
     Column("last_name", String(255)),
     Column("backup_email", String(255)),
@@ -54,28 +59,61 @@ profiles = Table(
     Column("friends", Integer),
     Column("created_time", TIMESTAMP),
     Column("updated_time", TIMESTAMP),
+    # One profile per user, so a redelivered RegisteredEvent cannot add another.
+    Index("uq_profiles_user_id", "user_id", unique=True),
 )
 
 friend_requests = Table(
     "friend_requests",
     metadata,
-    Column("message_id", String(255)),
+    Column("message_id", String(255), index=True),
     Column("id", String(255), primary_key=True),
     Column("sender_id", String(255)),
-    Column("receiver_id", String(255)),
+    Column("receiver_id", String(255), index=True),
     Column("created_time", TIMESTAMP),
     Column("updated_time", TIMESTAMP),
+    Index(
+        "ix_friend_requests_sender_id_receiver_id",
+        "sender_id",
+        "receiver_id",
+        unique=True,
+    ),
 )
 
 friends = Table(
     "friends",
     metadata,
-    Column("message_id", String(255)),
+    Column("message_id", String(255), index=True),
     Column("id", String(255), primary_key=True),
     Column("sender_id", String(255)),
     Column("receiver_id", String(255)),
     Column("created_time", TIMESTAMP),
     Column("updated_time", TIMESTAMP),
+    Index("ix_friends_sender_id_receiver_id", "sender_id", "receiver_id", unique=True),
+    Index("ix_friends_receiver_id_sender_id", "receiver_id", "sender_id"),
+)
+
+refresh_tokens = Table(
+    "refresh_tokens",
+    metadata,
+    Column("id", String(36), primary_key=True),
+    Column("user_id", String(255), ForeignKey("users.id"), nullable=False, index=True),
+    Column("token_hash", String(64), nullable=False),
+    Column("token_version", Integer, nullable=False),
+    Column("device", String(255)),
+    Column("created_time", TIMESTAMP),
+    Column("updated_time", TIMESTAMP),
+    Column("expires_time", TIMESTAMP, nullable=False),
+)
+
+outbox = Table(
+    "outbox",
+    metadata,
+    Column("id", String(255), primary_key=True),
+    Column("event_type", String(255), nullable=False),
+    Column("payload", Text, nullable=False),
+    Column("attempts", Integer, nullable=False, default=0, server_default="0"),
+    Column("created_time", TIMESTAMP, index=True),
 )
 
 _mappers_initialized = False
@@ -97,11 +135,79 @@ def start_mappers():
     mapper_registry.map_imperatively(models.Profile, profiles)
     mapper_registry.map_imperatively(models.FriendRequest, friend_requests)
     mapper_registry.map_imperatively(models.Friend, friends)
-    mapper_registry.metadata.create_all(bind=engine)
+    mapper_registry.map_imperatively(models.RefreshToken, refresh_tokens)
 
     _mappers_initialized = True
 
 
+def clear_mappers():
+    global _mappers_initialized
+
+    mapper_registry.dispose()
+    _mappers_initialized = False
+
+
+def make_engine(uri: str = None):
+    return create_engine(uri or config.get_mysql_uri(), **config.get_engine_config())
+
+
+def make_async_engine(uri: str = None):
+    return create_async_engine(
+        uri or config.get_async_mysql_uri(), **config.get_engine_config()
+    )
+
+
+def create_missing_columns(connection):
+    """Add columns declared in ``metadata`` that an existing table lacks.
+
+    Like ``create_missing_indexes``, this keeps databases created before a
+    column was declared working; new columns need a server default.
+    """
+    inspector = inspect(connection)
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+
+            logger.info("Adding column %s to %s", column.name, table.name)
+            ddl = CreateColumn(column).compile(dialect=connection.dialect)
+            connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+
+
+def create_missing_indexes(connection):
+    """Add indexes declared in ``metadata`` that an existing database lacks.
+
+    ``create_all`` only creates indexes together with new tables, so databases
+    created before an index was declared are brought up to date here.
+    """
+    inspector = inspect(connection)
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+
+            logger.info("Creating index %s on %s", index.name, table.name)
+            try:
+                index.create(connection)
+            except Exception:
+                logger.exception("Could not create index %s", index.name)
+
+
+async def create_tables(engine):
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+        await conn.run_sync(create_missing_columns)
+        await conn.run_sync(create_missing_indexes)
+
+
 def receive_load(model, _):
     model.events = []
 
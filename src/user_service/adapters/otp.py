@@ -0,0 +1,44 @@
+import threading
+from typing import Optional
+
+import pyotp
+
+from user_service import config
+from user_service.adapters import cache
+
+
+class OTPService:
+    """Generates and verifies TOTP codes for user secrets.
+
+    ``pyotp.TOTP`` instances are kept in a bounded LRU cache keyed by secret.
+    A code that verified is remembered in memory until it can no longer be
+    valid, and is rejected if it is presented again.
+    """
+
+    def __init__(self, maxsize: Optional[int] = None, interval: int = 30):
+        settings = config.get_otp_config()
+        maxsize = maxsize or settings["maxsize"]
+        self.interval = interval
+        self._totps = cache.TTLCache(maxsize, ttl=float("inf"))
+        self._used_codes = cache.TTLCache(maxsize, ttl=interval * 2)
+        self._lock = threading.Lock()
+
+    def _totp(self, secret: str) -> pyotp.TOTP:
+        totp = self._totps.get(secret)
+        if totp is None:
+            totp = pyotp.TOTP(secret, interval=self.interval)
+            self._totps.set(secret, totp)
+        return totp
+
+    def now(self, secret: str) -> str:
+        return self._totp(secret).now()
+
+    def verify(self, secret: str, code: str) -> bool:
+        totp = self._totp(secret)
+        with self._lock:
+            if self._used_codes.get((secret, code)) is not None:
+                return False
+            if not totp.verify(code):
+                return False
+            self._used_codes.set((secret, code), True)
+            return True
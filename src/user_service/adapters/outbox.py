@@ -0,0 +1,102 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Type
+
+from sqlalchemy import delete, insert, select, update
+
+from user_service.adapters import orm
+from user_service.domains import events
+
+
+def _event_types() -> Dict[str, Type[events.Event]]:
+    event_types = {}
+    pending = [events.Event]
+    while pending:
+        event_type = pending.pop()
+        event_types[event_type.__name__] = event_type
+        pending.extend(event_type.__subclasses__())
+    return event_types
+
+
+def encode(event: events.Event) -> Dict[str, str]:
+    return {
+        "id": event._id,
+        "event_type": type(event).__name__,
+        "payload": event.model_dump_json(),
+    }
+
+
+def decode(
+    id: str,
+    event_type: str,
+    payload: str,
+    event_types: Optional[Dict[str, Type[events.Event]]] = None,
+) -> events.Event:
+    event_types = event_types or _event_types()
+    event = event_types[event_type].model_validate_json(payload)
+    event._id = id
+    return event
+
+
+def to_row(event: events.Event) -> dict:
+    return {**encode(event), "created_time": datetime.now()}
+
+
+def from_row(row, event_types: Optional[Dict[str, Type[events.Event]]] = None):
+    return decode(row.id, row.event_type, row.payload, event_types)
+
+
+async def add(session, new_events: Iterable[events.Event]):
+    rows = [to_row(event) for event in new_events]
+    if rows:
+        await session.execute(insert(orm.outbox), rows)
+
+
+async def claim(
+    session, limit: int, max_attempts: Optional[int] = None
+) -> List[events.Event]:
+    """Lock and return the oldest ``limit`` pending events.
+
+    Rows locked by another relay are skipped, so several processes can drain
+    the same outbox without handing out an event twice. Events that already
+    failed ``max_attempts`` times are left alone.
+    """
+    query = (
+        select(orm.outbox)
+        .order_by(orm.outbox.c.created_time)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    if max_attempts is not None:
+        query = query.where(orm.outbox.c.attempts < max_attempts)
+    results = await session.execute(query)
+    event_types = _event_types()
+    return [from_row(row, event_types) for row in results]
+
+
+async def remove(session, claimed_events: Iterable[events.Event]):
+    ids = [event._id for event in claimed_events]
+    if ids:
+        await session.execute(delete(orm.outbox).where(orm.outbox.c.id.in_(ids)))
+
+
+async def record_failures(
+    session, failed_events: Iterable[events.Event], max_attempts: int
+) -> List[str]:
+    """Count a failed attempt for each event, keeping it in the outbox.
+
+    Returns the ids of the events that have now failed ``max_attempts`` times.
+    """
+    ids = [event._id for event in failed_events]
+    if not ids:
+        return []
+    await session.execute(
+        update(orm.outbox)
+        .where(orm.outbox.c.id.in_(ids))
+        .values(attempts=orm.outbox.c.attempts + 1)
+    )
+    results = await session.execute(
+        select(orm.outbox.c.id).where(
+            orm.outbox.c.id.in_(ids), orm.outbox.c.attempts >= max_attempts
+        )
+    )
+    return list(results.scalars())
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from passlib.context import CryptContext
+from passlib.registry import get_crypt_handler
+
+from user_service import config
+
+logger = logging.getLogger(__name__)
+
+SCHEMES = ("bcrypt", "argon2")
+
+
+class PasswordHasherSaturated(Exception):
+    pass
+
+
+def calibrate_bcrypt_rounds(
+    target_seconds: float,
+    min_rounds: int = 10,
+    max_rounds: int = 16,
+    sample_rounds: int = 8,
+) -> int:
+    """Return the highest bcrypt cost whose hash fits in ``target_seconds``.
+
+    A hash is timed at ``sample_rounds`` (best of three) and every extra round
+    doubles the work. The result is clamped to ``[min_rounds, max_rounds]``.
+    """
+    context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=sample_rounds)
+    elapsed = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        context.hash("calibration")
+        elapsed = min(elapsed, time.perf_counter() - start)
+
+    rounds = min_rounds
+    while (
+        rounds < max_rounds
+        and elapsed * 2 ** (rounds + 1 - sample_rounds) <= target_seconds
+    ):
+        rounds += 1
+    return rounds
+
+
+def make_context(settings: Optional[Dict[str, Any]] = None) -> CryptContext:
+    """Build the hashing policy from ``config.get_password_hash_config()``.
+
+    Both schemes stay verifiable; hashes of the one not configured, or with a
+    lower bcrypt cost than configured, are reported by ``needs_update`` so
+    they get rehashed on the next login.
+    """
+    settings = settings or config.get_password_hash_config()
+    scheme = settings["scheme"]
+    if scheme not in SCHEMES:
+        raise ValueError(f"Unsupported password hash scheme {scheme}")
+    # passlib loads a backend on first use, so without this check a missing
+    # one only shows when the first user registers.
+    if not get_crypt_handler(scheme).has_backend():
+        raise ValueError(
+            f"Password hash scheme {scheme} has no backend installed"
+            + (", install the argon2 extra" if scheme == "argon2" else "")
+        )
+
+    options = {
+        "argon2__memory_cost": settings["argon2_memory_cost"],
+        "argon2__time_cost": settings["argon2_time_cost"],
+        "argon2__parallelism": settings["argon2_parallelism"],
+    }
+    rounds = settings["rounds"]
+    if rounds is None and scheme == "bcrypt" and settings["target_ms"]:
+        rounds = calibrate_bcrypt_rounds(
+            settings["target_ms"] / 1000,
+            settings["min_rounds"],
+            settings["max_rounds"],
+        )
+    if rounds is not None:
+        options["bcrypt__default_rounds"] = rounds
+        options["bcrypt__min_rounds"] = rounds
+
+    logger.info("Hashing passwords with %s, bcrypt rounds %s", scheme, rounds)
+    return CryptContext(
+        schemes=[scheme] + [other for other in SCHEMES if other != scheme],
+        deprecated="auto",
+        **options,
+    )
+
+
+class PasswordHasher:
+    """Runs password hashing and verification on a bounded worker pool.
+
+    bcrypt releases the GIL while hashing, so a thread pool is enough for the
+    work to spread across cores. At most ``max_workers + max_pending`` jobs are
+    accepted at once; anything beyond that is rejected with
+    ``PasswordHasherSaturated`` instead of queueing without bound.
+
+    The ``*_sync`` variants block until the job is done and are for the sync
+    bus only; called from a running event loop they raise instead of stalling
+    it for the whole hash.
+    """
+
+    def __init__(
+        self,
+        context: Optional[CryptContext] = None,
+        max_workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+    ):
+        settings = config.get_password_hasher_config()
+        self.context = context or make_context()
+        self.max_workers = max_workers or settings["max_workers"]
+        self.max_pending = (
+            max_pending if max_pending is not None else settings["max_pending"]
+        )
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_pending)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="password-hasher"
+        )
+
+    def _submit(self, fn, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            logger.warning("Password hasher saturated, rejecting job")
+            raise PasswordHasherSaturated("Password hasher is saturated")
+
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    @staticmethod
+    def _check_not_on_event_loop():
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        raise RuntimeError(
+            "Blocking password hasher call on an event loop, await the async API"
+        )
+
+    def _result(self, fn, *args):
+        self._check_not_on_event_loop()
+        return self._submit(fn, *args).result()
+
+    async def hash(self, secret: str) -> str:
+        return await asyncio.wrap_future(self._submit(self.context.hash, secret))
+
+    async def verify(self, secret: str, hashed: str) -> bool:
+        return await asyncio.wrap_future(
+            self._submit(self.context.verify, secret, hashed)
+        )
+
+    async def verify_and_update(
+        self, secret: str, hashed: str
+    ) -> Tuple[bool, Optional[str]]:
+        """Verify ``secret``, also returning a new hash if ``hashed`` is outdated."""
+        return await asyncio.wrap_future(
+            self._submit(self.context.verify_and_update, secret, hashed)
+        )
+
+    async def hash_many(self, secrets: Sequence[str]) -> List[str]:
+        hashed = []
+        for start in range(0, len(secrets), self.max_workers):
+            chunk = secrets[start : start + self.max_workers]
+            hashed.extend(
+                await asyncio.gather(*(self.hash(secret) for secret in chunk))
+            )
+        return hashed
+
+    def hash_sync(self, secret: str) -> str:
+        return self._result(self.context.hash, secret)
+
+    def hash_many_sync(self, secrets: Sequence[str]) -> List[str]:
+        self._check_not_on_event_loop()
+        hashed = []
+        for start in range(0, len(secrets), self.max_workers):
+            chunk = secrets[start : start + self.max_workers]
+            futures = [self._submit(self.context.hash, secret) for secret in chunk]
+            hashed.extend(future.result() for future in futures)
+        return hashed
+
+    def verify_sync(self, secret: str, hashed: str) -> bool:
+        return self._result(self.context.verify, secret, hashed)
+
+    def verify_and_update_sync(
+        self, secret: str, hashed: str
+    ) -> Tuple[bool, Optional[str]]:
+        return self._result(self.context.verify_and_update, secret, hashed)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,278 @@
+import abc
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Callable, Optional
+from urllib.parse import urlparse
+
+from user_service import config
+
+
+class TooManyAttempts(Exception):
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AbstractRateLimitBackend(abc.ABC):
+    """Counts hits per key over a sliding window of ``window`` seconds.
+
+    Backends whose ``supports_sync`` is false only implement the coroutines,
+    so they cannot serve the sync message bus.
+    """
+
+    supports_sync = False
+
+    @abc.abstractmethod
+    async def hit(self, key: str, window: float) -> int:
+        """Record a hit on ``key`` and return the hits in the last ``window``."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def count(self, key: str, window: float) -> int:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def reset(self, key: str):
+        raise NotImplementedError
+
+    def hit_sync(self, key: str, window: float) -> int:
+        raise NotImplementedError(f"{type(self).__name__} is async only")
+
+    def count_sync(self, key: str, window: float) -> int:
+        raise NotImplementedError(f"{type(self).__name__} is async only")
+
+    def reset_sync(self, key: str):
+        raise NotImplementedError(f"{type(self).__name__} is async only")
+
+    async def close(self):
+        pass
+
+
+class InMemoryRateLimitBackend(AbstractRateLimitBackend):
+    """Keeps the hit timestamps of each key in-process.
+
+    Only shared within one worker. At most ``max_hits`` timestamps are kept
+    per key and at most ``maxsize`` keys, least recently hit evicted first,
+    so a flood of distinct keys or hits cannot grow it without bound.
+    """
+
+    supports_sync = True
+
+    def __init__(
+        self,
+        maxsize: int = 100000,
+        max_hits: int = 1000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.max_hits = max_hits
+        self._clock = clock
+        self._hits = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, hits: deque, window: float):
+        oldest = self._clock() - window
+        while hits and hits[0] <= oldest:
+            hits.popleft()
+
+    def hit_sync(self, key: str, window: float) -> int:
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                hits = self._hits[key] = deque(maxlen=self.max_hits)
+            self._hits.move_to_end(key)
+            self._expire(hits, window)
+            hits.append(self._clock())
+            while len(self._hits) > self.maxsize:
+                self._hits.popitem(last=False)
+            return len(hits)
+
+    def count_sync(self, key: str, window: float) -> int:
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                return 0
+            self._expire(hits, window)
+            return len(hits)
+
+    def reset_sync(self, key: str):
+        with self._lock:
+            self._hits.pop(key, None)
+
+    async def hit(self, key: str, window: float) -> int:
+        return self.hit_sync(key, window)
+
+    async def count(self, key: str, window: float) -> int:
+        return self.count_sync(key, window)
+
+    async def reset(self, key: str):
+        self.reset_sync(key)
+
+
+class RedisRateLimitBackend(AbstractRateLimitBackend):
+    """Keeps the hits of each key in a Redis sorted set scored by time.
+
+    Shared by every worker talking to the same server. ``client`` is anything
+    with the ``redis.asyncio.Redis`` sorted set commands, so a local stand-in
+    can replace a real server.
+    """
+
+    def __init__(self, client, prefix: str = "user-service:rate-limit:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisRateLimitBackend":
+        import redis.asyncio
+
+        return cls(redis.asyncio.Redis.from_url(url), **kwargs)
+
+    async def hit(self, key: str, window: float) -> int:
+        key = self.prefix + key
+        now = time.time()
+        # One MULTI/EXEC round trip, so concurrent hits on a key are counted
+        # atomically.
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zremrangebyscore(key, 0, now - window)
+            pipe.zadd(key, {str(uuid.uuid4()): now})
+            pipe.expire(key, max(1, int(window)))
+            pipe.zcard(key)
+            *_, hits = await pipe.execute()
+        return hits
+
+    async def count(self, key: str, window: float) -> int:
+        key = self.prefix + key
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zremrangebyscore(key, 0, time.time() - window)
+            pipe.zcard(key)
+            _, hits = await pipe.execute()
+        return hits
+
+    async def reset(self, key: str):
+        await self.client.delete(self.prefix + key)
+
+    async def close(self):
+        close = getattr(self.client, "aclose", None) or getattr(
+            self.client, "close", None
+        )
+        if close is not None:
+            await close()
+
+
+def from_url(url: str, **kwargs) -> AbstractRateLimitBackend:
+    """Build a backend from ``memory://`` or ``redis://...``."""
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return InMemoryRateLimitBackend(**kwargs)
+    if scheme in ("redis", "rediss"):
+        return RedisRateLimitBackend.from_url(url)
+    raise ValueError(f"Unsupported rate limit backend url {url}")
+
+
+class LoginRateLimiter:
+    """Throttles logins per client IP and per login name, and tracks failures.
+
+    ``check`` runs before any database or bcrypt work and rejects a login
+    once its IP made ``max_attempts_per_ip`` attempts, or its login name
+    failed ``max_failures_per_name`` times, within ``window`` seconds.
+    ``record_failure`` reports when a user failed ``lock_after_failures``
+    times within ``lock_window`` seconds so the caller can lock the account;
+    ``0`` disables locking.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[AbstractRateLimitBackend] = None,
+        window: Optional[float] = None,
+        max_attempts_per_ip: Optional[int] = None,
+        max_failures_per_name: Optional[int] = None,
+        lock_after_failures: Optional[int] = None,
+        lock_window: Optional[float] = None,
+    ):
+        settings = config.get_login_rate_limit_config()
+        self.backend = backend or from_url(
+            settings["backend_url"], maxsize=settings["maxsize"]
+        )
+        self.window = window or settings["window"]
+        self.max_attempts_per_ip = (
+            max_attempts_per_ip or settings["max_attempts_per_ip"]
+        )
+        self.max_failures_per_name = (
+            max_failures_per_name or settings["max_failures_per_name"]
+        )
+        self.lock_after_failures = (
+            lock_after_failures
+            if lock_after_failures is not None
+            else settings["lock_after_failures"]
+        )
+        self.lock_window = lock_window or settings["lock_window"]
+
+    @staticmethod
+    def _ip_key(client_ip: str) -> str:
+        return f"login:ip:{client_ip}"
+
+    @staticmethod
+    def _name_key(name: str) -> str:
+        return f"login:name:{name.strip().lower()}"
+
+    @staticmethod
+    def _user_key(user_id: str) -> str:
+        return f"login:user:{user_id}"
+
+    def _too_many_attempts(self) -> TooManyAttempts:
+        return TooManyAttempts("Too many login attempts", retry_after=self.window)
+
+    async def check(self, name: str, client_ip: Optional[str] = None):
+        if client_ip is not None:
+            attempts = await self.backend.hit(self._ip_key(client_ip), self.window)
+            if attempts > self.max_attempts_per_ip:
+                raise self._too_many_attempts()
+        failures = await self.backend.count(self._name_key(name), self.window)
+        if failures >= self.max_failures_per_name:
+            raise self._too_many_attempts()
+
+    async def record_failure(self, name: str, user_id: Optional[str] = None) -> bool:
+        """Record a failed login and return whether the user should be locked."""
+        await self.backend.hit(self._name_key(name), self.window)
+        if user_id is None or not self.lock_after_failures:
+            return False
+        failures = await self.backend.hit(self._user_key(user_id), self.lock_window)
+        return failures >= self.lock_after_failures
+
+    async def record_success(self, name: str, user_id: str):
+        await asyncio.gather(
+            self.backend.reset(self._name_key(name)),
+            self.backend.reset(self._user_key(user_id)),
+        )
+
+    async def reset_failures(self, user_id: str):
+        await self.backend.reset(self._user_key(user_id))
+
+    def check_sync(self, name: str, client_ip: Optional[str] = None):
+        if client_ip is not None:
+            attempts = self.backend.hit_sync(self._ip_key(client_ip), self.window)
+            if attempts > self.max_attempts_per_ip:
+                raise self._too_many_attempts()
+        failures = self.backend.count_sync(self._name_key(name), self.window)
+        if failures >= self.max_failures_per_name:
+            raise self._too_many_attempts()
+
+    def record_failure_sync(self, name: str, user_id: Optional[str] = None) -> bool:
+        self.backend.hit_sync(self._name_key(name), self.window)
+        if user_id is None or not self.lock_after_failures:
+            return False
+        failures = self.backend.hit_sync(self._user_key(user_id), self.lock_window)
+        return failures >= self.lock_after_failures
+
+    def record_success_sync(self, name: str, user_id: str):
+        self.backend.reset_sync(self._name_key(name))
+        self.backend.reset_sync(self._user_key(user_id))
+
+    def reset_failures_sync(self, user_id: str):
+        self.backend.reset_sync(self._user_key(user_id))
+
+    async def close(self):
+        await self.backend.close()
@@ -1,9 +1,70 @@
 import abc
-from typing import Type, List
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Type
+
+from sqlalchemy import delete, literal, select, update
 
 from user_service.domains import models
 
 
+def _increment_statement(model_type, field, amount, **kwargs):
+    """``UPDATE ... SET field = field + amount`` evaluated by the database.
+
+    A list, tuple or set filter value matches any of its items (``IN``). The
+    session is not synchronised, so instances of ``model_type`` already loaded
+    in it keep their old value until they are refreshed.
+    """
+    criteria = [
+        (
+            getattr(model_type, key).in_(value)
+            if isinstance(value, (list, tuple, set))
+            else getattr(model_type, key) == value
+        )
+        for key, value in kwargs.items()
+    ]
+    values = {field: getattr(model_type, field) + amount}
+    if hasattr(model_type, "updated_time"):
+        values["updated_time"] = datetime.now()
+    return (
+        update(model_type)
+        .where(*criteria)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _delete_statement(model_type, *args, **kwargs):
+    """``DELETE FROM ... WHERE ...``; matching rows are not loaded first."""
+    return (
+        delete(model_type)
+        .filter(*args)
+        .filter_by(**kwargs)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _exists_statement(model_type, *args, **kwargs):
+    """``SELECT 1 FROM ... WHERE ... LIMIT 1``; no row is loaded or mapped."""
+    return (
+        select(literal(1))
+        .select_from(model_type)
+        .filter(*args)
+        .filter_by(**kwargs)
+        .limit(1)
+    )
+
+
+def _fields_statement(model_type, fields, *args, limit=None, **kwargs):
+    statement = (
+        select(*(getattr(model_type, field) for field in fields))
+        .filter(*args)
+        .filter_by(**kwargs)
+    )
+    if limit is not None:
+        statement = statement.limit(limit)
+    return statement
+
+
 class AbstractRepository(abc.ABC):
     def __init__(self) -> None:
         self.seen = set()
@@ -29,6 +90,74 @@ class AbstractRepository(abc.ABC):
                 self.seen.add(result)
         return results
 
+    def get_by_id(
+        self,
+        model_type: Type[models.BaseModel],
+        id: str,
+        for_update: bool = False,
+    ) -> Optional[models.BaseModel]:
+        """Primary key lookup that answers from the identity map when it can.
+
+        With ``for_update`` the row is read with ``SELECT ... FOR UPDATE`` and
+        stays locked until the transaction ends.
+        """
+        result = self._get_by_id(model_type, id, for_update)
+        if result is not None:
+            self.seen.add(result)
+        return result
+
+    def get_one(
+        self,
+        model_type: Type[models.BaseModel],
+        *args,
+        **kwargs,
+    ) -> Optional[models.BaseModel]:
+        result = self._get_one(model_type, *args, **kwargs)
+        if result is not None:
+            self.seen.add(result)
+        return result
+
+    def exists(
+        self,
+        model_type: Type[models.BaseModel],
+        *args,
+        **kwargs,
+    ) -> bool:
+        return self._exists(model_type, *args, **kwargs)
+
+    def get_fields(
+        self,
+        model_type: Type[models.BaseModel],
+        fields: Sequence[str],
+        *args,
+        limit: Optional[int] = None,
+        **kwargs,
+    ) -> List[Dict[str, Any]]:
+        """Return only ``fields`` of matching rows, without loading entities."""
+        return self._get_fields(model_type, fields, *args, limit=limit, **kwargs)
+
+    def increment(
+        self,
+        model_type: Type[models.BaseModel],
+        field: str,
+        amount: int = 1,
+        **kwargs,
+    ):
+        """Add ``amount`` to ``field`` on every row matching ``kwargs``.
+
+        A list, tuple or set value matches any of its items.
+        """
+        self._increment(model_type, field, amount, **kwargs)
+
+    def delete(
+        self,
+        model_type: Type[models.BaseModel],
+        *args,
+        **kwargs,
+    ):
+        """Delete every row matching the criteria in one statement."""
+        self._delete(model_type, *args, **kwargs)
+
     @abc.abstractmethod
     def _add(
         self,
@@ -47,6 +176,16 @@ class AbstractRepository(abc.ABC):
     ):
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def _increment(
+        self,
+        model_type: Type[models.BaseModel],
+        field: str,
+        amount: int,
+        **kwargs,
+    ):
+        raise NotImplementedError
+
     @abc.abstractmethod
     def _get(
         self,
@@ -56,6 +195,53 @@ class AbstractRepository(abc.ABC):
     ) -> List[models.BaseModel]:
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def _get_by_id(
+        self,
+        model_type: Type[models.BaseModel],
+        id: str,
+        for_update: bool = False,
+    ) -> Optional[models.BaseModel]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _delete(
+        self,
+        model_type: Type[models.BaseModel],
+        *args,
+        **kwargs,
+    ):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _get_one(
+        self,
+        model_type: Type[models.BaseModel],
+        *args,
+        **kwargs,
+    ) -> Optional[models.BaseModel]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _exists(
+        self,
+        model_type: Type[models.BaseModel],
+        *args,
+        **kwargs,
+    ) -> bool:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _get_fields(
+        self,
+        model_type: Type[models.BaseModel],
+        fields: Sequence[str],
+        *args,
+        limit: Optional[int] = None,
+        **kwargs,
+    ) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
 
 class SqlAlchemyRepository(AbstractRepository):
     def __init__(self, session):
@@ -68,10 +254,332 @@ class SqlAlchemyRepository(AbstractRepository):
     def _remove(self, model: models.BaseModel):
         self.session.delete(model)
 
+    def _increment(
+        self,
+        model_type: Type[models.BaseModel],
+        field: str,
+        amount: int,
+        **kwargs,
+    ):
+        self.session.execute(_increment_statement(model_type, field, amount, **kwargs))
+
     def _get(
         self,
         model_type: Type[models.BaseModel],
         *args,
         **kwargs,
     ) -> List[models.BaseModel]:
-        return self.session.query(model_type).filter_by(**kwargs).all()
+        return self.session.query(model_type).filter(*args).filter_by(**kwargs).all()
+
+    def _get_by_id(
+        self,
+        model_type: Type[models.BaseModel],
+        id: str,
+        for_update: bool = False,
+    ) -> Optional[models.BaseModel]:
+        return self.session.get(
+            model_type, id, with_for_update=True if for_update else None
+        )
+
+    def _delete(
+        self,
+        model_type: Type[models.BaseModel],
+        *args,
+        **kwargs,
+    ):
+        self.session.execute(_delete_statement(model_type, *args, **kwargs))
+
+    def _get_one(
+        self,
+        model_type: Type[models.BaseModel],
+        *args,
+        **kwargs,
+    ) -> Optional[models.BaseModel]:
+        return self.session.query(model_type).filter(*args).filter_by(**kwargs).first()
+
+    def _exists(
+        self,
+        model_type: Type[models.BaseModel],
+        *args,
+        **kwargs,
+    ) -> bool:
+        return (
+            self.session.execute(_exists_statement(model_type, *args, **kwargs)).first()
+            is not None
+        )
+
+    def _get_fields(
+        self,
+        model_type: Type[models.BaseModel],
+        fields: Sequence[str],
+        *args,
+        limit: Optional[int] = None,
+        **kwargs,
+    ) -> List[Dict[str, Any]]:
+        results = self.session.execute(
+            _fields_statement(model_type, fields, *args, limit=limit, **kwargs)
+        )
+        return [dict(row) for row in results.mappings()]
+
+
+class AbstractAsyncRepository(abc.ABC):
+    def __init__(self) -> None:
+        self.seen = set()
+
+    def add(self, model: models.BaseModel):
+        self._add(model)
+        self.seen.add(model)
+
+    async def remove(self, model: models.BaseModel):
+        await self._remove(model)
+
+    async def get(
+        self,
+        model_type: Type[models.BaseModel],
+        *args,
+        **kwargs,
+    ) -> List[models.BaseModel]:
+        results = await self._get(model_type, *args, **kwargs)
+        if results:
+            for result in results:
+                self.seen.add(result)
+        return results
+
+    async def get_by_id(
+        self,
+        model_type: Type[models.BaseModel],
+        id: str,
+        for_update: bool = False,
+    ) -> Optional[models.BaseModel]:
+        """Primary key lookup that answers from the identity map when it can.
+
+        With ``for_update`` the row is read with ``SELECT ... FOR UPDATE`` and
+        stays locked until the transaction ends.
+        """
+        result = await self._get_by_id(model_type, id, for_update)
+        if result is not None:
+            self.seen.add(result)
+        return result
+
+    async def get_one(
+        self,
+        model_type: Type[models.BaseModel],
+        *args,
+        **kwargs,
+    ) -> Optional[models.BaseModel]:
+        result = await self._get_one(model_type, *args, **kwargs)
+        if result is not None:
+            self.seen.add(result)
+        return result
+
+    async def exists(
+        self,
+        model_type: Type[models.BaseModel],
+        *args,
+        **kwargs,
+    ) -> bool:
+        return await self._exists(model_type, *args, **kwargs)
+
+    async def get_fields(
+        self,
+        model_type: Type[models.BaseModel],
+        fields: Sequence[str],
+        *args,
+        limit: Optional[int] = None,
+        **kwargs,
+    ) -> List[Dict[str, Any]]:
+        """Return only ``fields`` of matching rows, without loading entities."""
+        return await self._get_fields(model_type, fields, *args, limit=limit, **kwargs)
+
+    async def increment(
+        self,
+        model_type: Type[models.BaseModel],
+        field: str,
+        amount: int = 1,
+        **kwargs,
+    ):
+        """Add ``amount`` to ``field`` on every row matching ``kwargs``.
+
+        A list, tuple or set value matches any of its items.
+        """
+        await self._increment(model_type, field, amount, **kwargs)
+
+    async def delete(
+        self,
+        model_type: Type[models.BaseModel],
+        *args,
+        **kwargs,
+    ):
+        """Delete every row matching the criteria in one statement."""
+        await self._delete(model_type, *args, **kwargs)
+
+    @abc.abstractmethod
+    def _add(
+        self,
+        model: models.BaseModel,
+        *args,
+        **kwargs,
+    ):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def _remove(
+        self,
+        model: models.BaseModel,
+        *args,
+        **kwargs,
+    ):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def _increment(
+        self,
+        model_type: Type[models.BaseModel],
+        field: str,
+        amount: int,
+        **kwargs,
+    ):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def _get(
+        self,
+        model_type: Type[models.BaseModel],
+        *args,
+        **kwargs,
+    ) -> List[models.BaseModel]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def _get_by_id(
+        self,
+        model_type: Type[models.BaseModel],
+        id: str,
+        for_update: bool = False,
+    ) -> Optional[models.BaseModel]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def _delete(
+        self,
+        model_type: Type[models.BaseModel],
+        *args,
+        **kwargs,
+    ):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def _get_one(
+        self,
+        model_type: Type[models.BaseModel],
+        *args,
+        **kwargs,
+    ) -> Optional[models.BaseModel]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def _exists(
+        self,
+        model_type: Type[models.BaseModel],
+        *args,
+        **kwargs,
+    ) -> bool:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def _get_fields(
+        self,
+        model_type: Type[models.BaseModel],
+        fields: Sequence[str],
+        *args,
+        limit: Optional[int] = None,
+        **kwargs,
+    ) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+
+class AsyncSqlAlchemyRepository(AbstractAsyncRepository):
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
+
+    def _add(self, model: models.BaseModel):
+        self.session.add(model)
+
+    async def _remove(self, model: models.BaseModel):
+        await self.session.delete(model)
+
+    async def _increment(
+        self,
+        model_type: Type[models.BaseModel],
+        field: str,
+        amount: int,
+        **kwargs,
+    ):
+        await self.session.execute(
+            _increment_statement(model_type, field, amount, **kwargs)
+        )
+
+    async def _get(
+        self,
+        model_type: Type[models.BaseModel],
+        *args,
+        **kwargs,
+    ) -> List[models.BaseModel]:
+        results = await self.session.execute(
+            select(model_type).filter(*args).filter_by(**kwargs)
+        )
+        return results.scalars().all()
+
+    async def _get_by_id(
+        self,
+        model_type: Type[models.BaseModel],
+        id: str,
+        for_update: bool = False,
+    ) -> Optional[models.BaseModel]:
+        return await self.session.get(
+            model_type, id, with_for_update=True if for_update else None
+        )
+
+    async def _delete(
+        self,
+        model_type: Type[models.BaseModel],
+        *args,
+        **kwargs,
+    ):
+        await self.session.execute(_delete_statement(model_type, *args, **kwargs))
+
+    async def _get_one(
+        self,
+        model_type: Type[models.BaseModel],
+        *args,
+        **kwargs,
+    ) -> Optional[models.BaseModel]:
+        results = await self.session.execute(
+            select(model_type).filter(*args).filter_by(**kwargs).limit(1)
+        )
+        return results.scalars().first()
+
+    async def _exists(
+        self,
+        model_type: Type[models.BaseModel],
+        *args,
+        **kwargs,
+    ) -> bool:
+        results = await self.session.execute(
+            _exists_statement(model_type, *args, **kwargs)
+        )
+        return results.first() is not None
+
+    async def _get_fields(
+        self,
+        model_type: Type[models.BaseModel],
+        fields: Sequence[str],
+        *args,
+        limit: Optional[int] = None,
+        **kwargs,
+    ) -> List[Dict[str, Any]]:
+        results = await self.session.execute(
+            _fields_statement(model_type, fields, *args, limit=limit, **kwargs)
+        )
+        return [dict(row) for row in results.mappings()]
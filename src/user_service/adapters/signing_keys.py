@@ -0,0 +1,160 @@
+import base64
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Sequence
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+from jwt.algorithms import ECAlgorithm, OKPAlgorithm
+from jwt.exceptions import InvalidTokenError
+
+from user_service import config
+
+logger = logging.getLogger(__name__)
+
+
+class SigningKey:
+    """One asymmetric key and the JWK other services verify it with.
+
+    ``kid`` is the RFC 7638 thumbprint of the public key, so every worker
+    loading the same PEM agrees on it.
+    """
+
+    def __init__(self, key):
+        if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+            self.algorithm = "EdDSA"
+            jwk = OKPAlgorithm.to_jwk(key, as_dict=True)
+            members = ("crv", "kty", "x")
+        elif isinstance(
+            key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)
+        ) and isinstance(key.curve, ec.SECP256R1):
+            self.algorithm = "ES256"
+            jwk = ECAlgorithm.to_jwk(key, as_dict=True)
+            members = ("crv", "kty", "x", "y")
+        else:
+            raise ValueError(f"Unsupported signing key {type(key).__name__}")
+
+        self.private_key = key if hasattr(key, "sign") else None
+        self.public_key = key.public_key() if self.private_key else key
+        thumbprint = json.dumps(
+            {member: jwk[member] for member in members},
+            separators=(",", ":"),
+            sort_keys=True,
+        )
+        self.kid = (
+            base64.urlsafe_b64encode(hashlib.sha256(thumbprint.encode()).digest())
+            .rstrip(b"=")
+            .decode()
+        )
+        self.jwk = {
+            **{member: jwk[member] for member in members},
+            "kid": self.kid,
+            "alg": self.algorithm,
+            "use": "sig",
+        }
+
+    @classmethod
+    def generate(cls, algorithm: str = "EdDSA") -> "SigningKey":
+        if algorithm == "EdDSA":
+            return cls(ed25519.Ed25519PrivateKey.generate())
+        if algorithm == "ES256":
+            return cls(ec.generate_private_key(ec.SECP256R1()))
+        raise ValueError(f"Unsupported signing algorithm {algorithm}")
+
+    @classmethod
+    def from_pem(cls, data: bytes) -> "SigningKey":
+        """Load a private key, or a public key that is only kept to verify."""
+        try:
+            return cls(serialization.load_pem_private_key(data, password=None))
+        except ValueError:
+            return cls(serialization.load_pem_public_key(data))
+
+
+class SigningKeySet:
+    """Signs access tokens with the first key and verifies with any of them.
+
+    Rotation is done through ``JWT_SIGNING_KEYS``: publish the new key by
+    appending it, move it to the front once the JWKS caches of other
+    services have expired, and drop the old one once its last token has.
+    Tokens carry the ``kid`` of their key so verification is a dict lookup.
+    """
+
+    def __init__(
+        self,
+        keys: Sequence[SigningKey],
+        issuer: Optional[str] = None,
+        jwks_max_age: Optional[int] = None,
+    ):
+        settings = config.get_jwt_config()
+        if not keys or keys[0].private_key is None:
+            raise ValueError("The first signing key must be a private key")
+        self.keys = {key.kid: key for key in keys}
+        self.active = keys[0]
+        self.issuer = issuer or settings["issuer"]
+        self.jwks_max_age = (
+            jwks_max_age if jwks_max_age is not None else settings["jwks_max_age"]
+        )
+        # Serialized once; the set only changes with a restart.
+        self.jwks = json.dumps(
+            {"keys": [key.jwk for key in self.keys.values()]},
+            separators=(",", ":"),
+        ).encode()
+        self.jwks_etag = f'"{hashlib.sha256(self.jwks).hexdigest()[:32]}"'
+
+    @classmethod
+    def from_config(cls, **kwargs) -> "SigningKeySet":
+        settings = config.get_jwt_config()
+        keys = []
+        for path in settings["signing_keys"]:
+            with open(path, "rb") as file:
+                keys.append(SigningKey.from_pem(file.read()))
+        if not keys:
+            if not settings["allow_ephemeral_key"]:
+                # Tokens signed by a per-process key fail on every other
+                # worker and after a restart, so this is a deployment error.
+                raise ValueError(
+                    "JWT_SIGNING_KEYS is not set; set JWT_ALLOW_EPHEMERAL_KEY=true "
+                    "to sign with a generated key in development"
+                )
+            logger.warning(
+                "JWT_SIGNING_KEYS is not set; tokens are signed with a key "
+                "generated for this process only"
+            )
+            keys.append(SigningKey.generate(settings["algorithm"]))
+        return cls(keys, **kwargs)
+
+    def encode(self, claims: Dict[str, Any], expires_delta: timedelta) -> str:
+        claims = {
+            **claims,
+            "iss": self.issuer,
+            "exp": datetime.now(timezone.utc) + expires_delta,
+        }
+        return jwt.encode(
+            claims,
+            self.active.private_key,
+            algorithm=self.active.algorithm,
+            headers={"kid": self.active.kid},
+        )
+
+    def decode(self, token: str) -> Optional[Dict[str, Any]]:
+        """Return the claims of ``token``, or ``None`` if it does not verify."""
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+            # The header is not verified yet; a non-string kid is not a key.
+            if not isinstance(kid, str):
+                return None
+            key = self.keys.get(kid)
+            if key is None:
+                return None
+            return jwt.decode(
+                token,
+                key.public_key,
+                algorithms=[key.algorithm],
+                issuer=self.issuer,
+                options={"require": ["exp", "iss"]},
+            )
+        except InvalidTokenError:
+            return None
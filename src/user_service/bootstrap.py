@@ -1,43 +1,241 @@
+import asyncio
+import dataclasses
+import functools
 import inspect
-from user_service.adapters import orm
-from user_service.service_layer import message_bus, unit_of_work
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from user_service import config
+from user_service.adapters import broker as event_broker
+from user_service.adapters import (
+    cache,
+    mailer,
+    orm,
+    otp,
+    password_hasher,
+    rate_limiter,
+    signing_keys,
+)
+from user_service.service_layer import (
+    message_bus,
+    outbox_relay,
+    reconciliation,
+    unit_of_work,
+    worker,
+)
 import typing as t
 
-from user_service.service_layer.handlers import command, event
+from user_service.service_layer.handlers import (
+    command,
+    event,
+    async_command,
+    async_event,
+)
+
+
+@dataclasses.dataclass
+class Container:
+    engine: AsyncEngine
+    hasher: password_hasher.PasswordHasher
+    principal_cache: cache.TTLCache
+    token_cache: cache.TTLCache
+    key_set: signing_keys.SigningKeySet
+    login_limiter: rate_limiter.LoginRateLimiter
+    email_sender: mailer.AbstractMailer
+    bus: message_bus.AsyncMessageBus
+    relay: outbox_relay.OutboxRelay
+    broker: t.Optional[event_broker.AbstractBroker] = None
+    event_worker: t.Optional[worker.EventWorker] = None
+    reconciler: t.Optional[reconciliation.FriendCountReconciler] = None
+
+    def cache_metrics(self) -> t.Dict[str, t.Dict[str, int]]:
+        return {
+            "principal_cache": self.principal_cache.metrics(),
+            "token_cache": self.token_cache.metrics(),
+        }
+
+    async def dispose(self):
+        await self.relay.stop()
+        if self.reconciler is not None:
+            await self.reconciler.stop()
+        if self.event_worker is not None:
+            await self.event_worker.stop()
+        if self.broker is not None:
+            await self.broker.close()
+        await self.login_limiter.close()
+        await self.email_sender.close()
+        self.hasher.shutdown()
+        await self.engine.dispose()
+
+
+async def create_container(engine: t.Optional[AsyncEngine] = None) -> Container:
+    if engine is None:
+        engine = orm.make_async_engine()
+    await orm.create_tables(engine)
+
+    session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+    uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(session_factory, use_outbox=True)
+    hasher = password_hasher.PasswordHasher(
+        await asyncio.to_thread(password_hasher.make_context)
+    )
+    principal_cache = cache.TTLCache(**config.get_principal_cache_config())
+    token_cache = cache.TTLCache(**config.get_token_cache_config())
+    key_set = signing_keys.SigningKeySet.from_config()
+    login_limiter = rate_limiter.LoginRateLimiter()
+    email_sender = mailer.FileMailer()
+    bus = bootstrap(
+        uow=uow,
+        hasher=hasher,
+        principal_cache=principal_cache,
+        login_limiter=login_limiter,
+        email_sender=email_sender,
+        use_async=True,
+    )
+
+    broker = None
+    event_worker = None
+    broker_url = config.get_event_broker_url()
+    if broker_url:
+        broker = event_broker.from_url(broker_url)
+        if isinstance(broker, event_broker.InMemoryBroker):
+            event_worker = worker.EventWorker(broker, bus)
+            event_worker.start()
+
+    relay = outbox_relay.OutboxRelay(session_factory, bus, broker=broker)
+    uow.outbox_listeners.append(relay.notify)
+    relay.start()
+
+    reconciler = None
+    if config.get_reconciliation_config()["interval"] > 0:
+        reconciler = reconciliation.FriendCountReconciler(uow)
+        reconciler.start()
+
+    return Container(
+        engine=engine,
+        hasher=hasher,
+        principal_cache=principal_cache,
+        token_cache=token_cache,
+        key_set=key_set,
+        login_limiter=login_limiter,
+        email_sender=email_sender,
+        bus=bus,
+        relay=relay,
+        broker=broker,
+        event_worker=event_worker,
+        reconciler=reconciler,
+    )
 
 
 def bootstrap(
     start_orm: bool = True,
-    uow: t.Type[unit_of_work.AbstractUnitOfWork] = unit_of_work.SqlAlchemyUnitOfWork,
-) -> message_bus.MessageBus:
+    uow: t.Optional[
+        t.Union[
+            t.Type[unit_of_work.AbstractUnitOfWork],
+            t.Type[unit_of_work.AbstractAsyncUnitOfWork],
+        ]
+    ] = None,
+    hasher: t.Optional[password_hasher.PasswordHasher] = None,
+    principal_cache: t.Optional[cache.TTLCache] = None,
+    login_limiter: t.Optional[rate_limiter.LoginRateLimiter] = None,
+    otp_service: t.Optional[otp.OTPService] = None,
+    email_sender: t.Optional[mailer.AbstractMailer] = None,
+    use_async: bool = False,
+) -> t.Union[message_bus.MessageBus, message_bus.AsyncMessageBus]:
     if start_orm:
         orm.start_mappers()
 
+    if uow is None:
+        if use_async:
+            uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(
+                async_sessionmaker(bind=orm.make_async_engine(), expire_on_commit=False)
+            )
+        else:
+            uow = unit_of_work.SqlAlchemyUnitOfWork(
+                sessionmaker(bind=orm.make_engine())
+            )
+
     if isinstance(uow, type):
         uow = uow()
 
-    dependencies = {"uow": uow}
-    injected_event_handlers = {
-        event_type: [
-            inject_dependencies(handler, dependencies) for handler in event_handlers
-        ]
-        for event_type, event_handlers in event.EVENT_HANDLERS.items()
-    }
-    injected_command_handlers = {
-        command_type: inject_dependencies(handler, dependencies)
-        for command_type, handler in command.COMMAND_HANDLERS.items()
+    if hasher is None:
+        hasher = password_hasher.PasswordHasher()
+
+    if principal_cache is None:
+        principal_cache = cache.TTLCache(**config.get_principal_cache_config())
+
+    if login_limiter is None:
+        login_limiter = rate_limiter.LoginRateLimiter()
+    if not use_async and not login_limiter.backend.supports_sync:
+        raise ValueError(
+            f"{type(login_limiter.backend).__name__} is async only; the sync "
+            "message bus needs a memory:// LOGIN_RATE_LIMIT_URL"
+        )
+
+    if otp_service is None:
+        otp_service = otp.OTPService()
+
+    if email_sender is None:
+        email_sender = mailer.FileMailer()
+
+    if use_async:
+        bus_type = message_bus.AsyncMessageBus
+        event_handlers = async_event.EVENT_HANDLERS
+        command_handlers = async_command.COMMAND_HANDLERS
+        batch_event_handlers = async_event.BATCH_EVENT_HANDLERS
+        batch_command_handlers = async_command.BATCH_COMMAND_HANDLERS
+        shared_transaction_events = async_event.SHARED_TRANSACTION_EVENTS
+    else:
+        bus_type = message_bus.MessageBus
+        event_handlers = event.EVENT_HANDLERS
+        command_handlers = command.COMMAND_HANDLERS
+        batch_event_handlers = event.BATCH_EVENT_HANDLERS
+        batch_command_handlers = command.BATCH_COMMAND_HANDLERS
+        shared_transaction_events = event.SHARED_TRANSACTION_EVENTS
+
+    dependencies = {
+        "uow": uow,
+        "hasher": hasher,
+        "principal_cache": principal_cache,
+        "login_limiter": login_limiter,
+        "otp_service": otp_service,
+        "email_sender": email_sender,
     }
 
-    return message_bus.MessageBus(
+    return bus_type(
         uow=uow,
-        event_handlers=injected_event_handlers,
-        command_handlers=injected_command_handlers,
+        event_handlers=compile_dispatch_table(event_handlers, dependencies),
+        command_handlers=compile_dispatch_table(command_handlers, dependencies),
+        batch_event_handlers=compile_dispatch_table(batch_event_handlers, dependencies),
+        batch_command_handlers=compile_dispatch_table(
+            batch_command_handlers, dependencies
+        ),
+        shared_transaction_events=shared_transaction_events,
     )
 
 
+def compile_dispatch_table(handlers, dependencies) -> message_bus.DispatchTable:
+    return message_bus.DispatchTable(
+        {
+            message_type: tuple(
+                inject_dependencies(handler, dependencies)
+                for handler in (
+                    message_handlers
+                    if isinstance(message_handlers, (list, tuple))
+                    else [message_handlers]
+                )
+            )
+            for message_type, message_handlers in handlers.items()
+        }
+    )
+
+
+@functools.cache
+def handler_parameters(handler) -> t.FrozenSet[str]:
+    return frozenset(inspect.signature(handler).parameters)
+
+
 def inject_dependencies(handler, dependencies):
-    params = inspect.signature(handler).parameters
+    params = handler_parameters(handler)
     deps = {
         name: dependency for name, dependency in dependencies.items() if name in params
     }
-    return lambda message: handler(message, **deps)
+    return functools.partial(handler, **deps)
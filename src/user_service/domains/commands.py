@@ -1,8 +1,11 @@
+from typing import Optional
+
 from user_service.domains import Message
 from user_service.entrypoints.schemas import (
     friend_schemas,
     register_schemas,
     reset_password_schemas,
+    session_schemas,
     user_schemas,
 )
 
@@ -26,6 +29,17 @@ class VerifyTwoFactorAuthCommand(Command, user_schemas.VerifyTwoFactorAuthBase):
 class LoginCommand(Command):
     username: str
     password: str
+    client_ip: Optional[str] = None
+    device: Optional[str] = None
+
+
+class RefreshAccessTokenCommand(Command, session_schemas.RefreshTokenBase):
+    """"""
+
+
+class RevokeSessionCommand(Command):
+    user_id: str
+    session_id: str
 
 
 class ResetPasswordCommand(Command, reset_password_schemas.ResetPasswordBase):
@@ -42,6 +42,7 @@ class User(BaseModel):
         secret_token: str,
         two_factor_auth_enabled: bool = False,
         locked: bool = False,
+        token_version: int = 0,
     ):
         super().__init__(message_id)
         self.username = username
@@ -50,6 +51,7 @@ class User(BaseModel):
         self.secret_token = secret_token
         self.two_factor_auth_enabled = two_factor_auth_enabled
         self.locked = locked
+        self.token_version = token_version
 
     def __repr__(self):
         return f"<User {self.id}>"
@@ -68,6 +70,21 @@ class User(BaseModel):
     def change_password(self, password):
         self.password = password
 
+    def revoke_tokens(self):
+        self.token_version += 1
+
+    def lock(self):
+        self.locked = True
+        self.revoke_tokens()
+
+    def unlock(self):
+        self.locked = False
+
+
+# What authorizing a request needs of a user; the principal cache holds only
+# these.
+PRINCIPAL_FIELDS = ("id", "two_factor_auth_enabled", "locked", "token_version")
+
 
 class Profile(BaseModel):
     def __init__(
@@ -146,3 +163,42 @@ class Friend(BaseModel):
 
     def __hash__(self):
         return hash(self.id)
+
+
+class RefreshToken(BaseModel):
+    """A login session on one device, renewed through its refresh token.
+
+    Only a digest of the current token is stored; ``rotate`` replaces it each
+    time the token is used. ``token_version`` is the user's token version at
+    login, so revoking the user's tokens also ends their sessions.
+    """
+
+    def __init__(
+        self,
+        message_id: str,
+        user_id: str,
+        token_version: int,
+        device: str = None,
+    ):
+        super().__init__(message_id)
+        self.user_id = user_id
+        self.token_version = token_version
+        self.device = device
+        self.token_hash = None
+        self.expires_time = None
+
+    def __repr__(self):
+        return f"<RefreshToken {self.id}>"
+
+    def __eq__(self, other):
+        if not isinstance(other, RefreshToken):
+            return False
+        return other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def rotate(self, token_hash: str, expires_time: datetime):
+        self.token_hash = token_hash
+        self.expires_time = expires_time
+        self.updated_time = datetime.now()
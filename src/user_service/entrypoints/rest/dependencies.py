@@ -1,20 +1,19 @@
-from typing import Annotated, Dict, Any
-from datetime import datetime, timedelta, timezone
+from typing import Annotated, Dict, Any, Optional
+from datetime import timedelta
+import hashlib
+import hmac
 import string
+import time
 
-import jwt
-from jwt.exceptions import InvalidTokenError
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from icecream import ic
 
-from user_service import bootstrap
-from user_service.config import SECRET_KEY
-from user_service.domains import models
+from user_service import config
+from user_service.adapters import cache, signing_keys
+from user_service.service_layer import message_bus
 from user_service import views
 
-bus = bootstrap.bootstrap()
-
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 
@@ -42,37 +41,91 @@ def validate_password(password: str):
     return True
 
 
-def create_access_token(data: dict, expires_delta: timedelta | None = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.now(timezone.utc) + expires_delta
-    else:
-        expire = datetime.now(timezone.utc) + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm="HS256")
-    return encoded_jwt
+def get_bus(request: Request) -> message_bus.AsyncMessageBus:
+    return request.app.state.container.bus
+
+
+def get_principal_cache(request: Request) -> cache.TTLCache:
+    return request.app.state.container.principal_cache
+
+
+def get_token_cache(request: Request) -> cache.TTLCache:
+    return request.app.state.container.token_cache
+
+
+def get_key_set(request: Request) -> signing_keys.SigningKeySet:
+    return request.app.state.container.key_set
+
+
+def principal_claims(principal: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "sub": principal["id"],
+        "locked": principal["locked"],
+        "2fa": principal["two_factor_auth_enabled"],
+        "ver": principal["token_version"],
+    }
+
+
+def create_access_token(
+    data: dict,
+    key_set: signing_keys.SigningKeySet,
+    expires_delta: timedelta | None = None,
+):
+    return key_set.encode(data, expires_delta or timedelta(minutes=15))
+
+
+def decode_access_token(
+    token: str, token_cache: cache.TTLCache, key_set: signing_keys.SigningKeySet
+) -> Optional[Dict[str, Any]]:
+    """Return the claims of ``token``, or ``None`` if it does not verify.
 
+    Verified tokens are cached by digest until they expire, so a token is
+    only decoded and its signature checked the first time it is seen.
+    """
+    digest = hashlib.sha256(token.encode()).digest()
+    claims = token_cache.get(digest)
+    if claims is not None:
+        return claims
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
+    claims = key_set.decode(token)
+    if claims is None:
+        return None
+
+    token_cache.set(
+        digest, claims, ttl=min(token_cache.ttl, claims["exp"] - time.time())
+    )
+    return claims
+
+
+async def get_current_user(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    bus: Annotated[message_bus.AsyncMessageBus, Depends(get_bus)],
+    principal_cache: Annotated[cache.TTLCache, Depends(get_principal_cache)],
+    token_cache: Annotated[cache.TTLCache, Depends(get_token_cache)],
+    key_set: Annotated[signing_keys.SigningKeySet, Depends(get_key_set)],
+):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except InvalidTokenError:
+    claims = decode_access_token(token, token_cache, key_set)
+    if claims is None or claims.get("sub") is None:
         raise credentials_exception
-    users = views.fetch_models_from_database(
-        model_type=models.User, uow=bus.uow, id=user_id
-    )
 
-    if not users:
+    user_id = claims["sub"]
+    user = principal_cache.get(user_id)
+    if user is None:
+        user = await views.fetch_principal(bus.uow, user_id)
+        if user is None:
+            raise credentials_exception
+        principal_cache.set(user_id, user)
+
+    # Locking a user or resetting their password bumps the version, which
+    # revokes every token issued before.
+    if user["token_version"] != claims.get("ver", 0):
         raise credentials_exception
-    return users[0]
+    return user
 
 
 async def get_current_unlock_user(
@@ -81,3 +134,20 @@ async def get_current_unlock_user(
     if current_user["locked"]:
         raise HTTPException(status_code=400, detail="Account locked")
     return current_user
+
+
+def get_batch_partner(x_api_key: Annotated[Optional[str], Header()] = None) -> str:
+    """Authenticate a partner by one of the ``BATCH_API_KEYS``.
+
+    Batches are for partner onboarding only; with no keys configured every
+    call is rejected.
+    """
+    if x_api_key is not None:
+        for api_key in config.get_batch_config()["api_keys"]:
+            if hmac.compare_digest(x_api_key.encode(), api_key.encode()):
+                return api_key
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid API key",
+        headers={"WWW-Authenticate": "ApiKey"},
+    )
@@ -1,17 +1,54 @@
+import contextlib
+
 import fastapi
+from user_service import bootstrap
+from user_service.adapters import password_hasher
+from user_service.entrypoints.rest import responses
 from user_service.entrypoints.rest.routers import (
+    batch,
     friend,
     register,
     login,
+    metrics,
     user,
     reset_password,
+    session,
+    well_known,
 )
 
 
-app = fastapi.FastAPI(docs_url=None, redoc_url="/docs")
+@contextlib.asynccontextmanager
+async def lifespan(app: fastapi.FastAPI):
+    container = await bootstrap.create_container()
+    app.state.container = container
+    yield
+    await container.dispose()
+
+
+app = fastapi.FastAPI(
+    docs_url=None,
+    redoc_url="/docs",
+    lifespan=lifespan,
+    default_response_class=responses.DefaultResponse,
+)
 
 app.include_router(register.router)
 app.include_router(login.router)
 app.include_router(user.router)
 app.include_router(reset_password.router)
+app.include_router(session.router)
 app.include_router(friend.router)
+app.include_router(batch.router)
+app.include_router(well_known.router)
+app.include_router(metrics.router)
+
+
+@app.exception_handler(password_hasher.PasswordHasherSaturated)
+async def password_hasher_saturated_handler(
+    request: fastapi.Request, exc: password_hasher.PasswordHasherSaturated
+):
+    return responses.DefaultResponse(
+        status_code=fastapi.status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"},
+    )
@@ -0,0 +1,86 @@
+from typing import Annotated
+
+import fastapi
+import pydantic
+
+from .. import dependencies
+from user_service import config
+from user_service.adapters import password_hasher
+from user_service.domains import commands
+from user_service.entrypoints.schemas import batch_schemas
+from user_service.service_layer import message_bus
+from user_service.service_layer.handlers import command
+
+router = fastapi.APIRouter()
+
+COMMAND_TYPES = {
+    "register": (commands.RegisterCommand, fastapi.status.HTTP_204_NO_CONTENT),
+    "friend_request": (commands.FriendRequestCommand, fastapi.status.HTTP_201_CREATED),
+}
+
+ERROR_STATUS_CODES = {
+    command.EmailExisted: fastapi.status.HTTP_409_CONFLICT,
+    command.UsernameExisted: fastapi.status.HTTP_409_CONFLICT,
+    command.FriendRequestExisted: fastapi.status.HTTP_409_CONFLICT,
+    password_hasher.PasswordHasherSaturated: fastapi.status.HTTP_503_SERVICE_UNAVAILABLE,
+}
+
+
+@router.post("/batch", status_code=fastapi.status.HTTP_200_OK)
+async def handle_batch(
+    batch: batch_schemas.BatchRequest,
+    bus: Annotated[message_bus.AsyncMessageBus, fastapi.Depends(dependencies.get_bus)],
+    partner: Annotated[str, fastapi.Depends(dependencies.get_batch_partner)],
+) -> batch_schemas.BatchResponse:
+    max_registrations = config.get_batch_config()["max_registrations"]
+    registrations = sum(item.type == "register" for item in batch.commands)
+    if registrations > max_registrations:
+        raise fastapi.HTTPException(
+            status_code=fastapi.status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {max_registrations} registrations per batch",
+        )
+
+    results = [None] * len(batch.commands)
+    indexes = []
+    cmds = []
+    for index, item in enumerate(batch.commands):
+        command_type, _ = COMMAND_TYPES[item.type]
+        try:
+            cmd = command_type(**item.payload)
+            if isinstance(cmd, commands.RegisterCommand):
+                dependencies.validate_password(cmd.password)
+        except pydantic.ValidationError as e:
+            results[index] = batch_schemas.BatchResultSchema(
+                index=index,
+                status_code=fastapi.status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=str(e),
+            )
+            continue
+        except dependencies.InvalidPassword as e:
+            results[index] = batch_schemas.BatchResultSchema(
+                index=index,
+                status_code=fastapi.status.HTTP_400_BAD_REQUEST,
+                detail=str(e),
+            )
+            continue
+
+        indexes.append(index)
+        cmds.append(cmd)
+
+    errors = await bus.handle_many(cmds)
+
+    for index, error in zip(indexes, errors):
+        if error is None:
+            _, status_code = COMMAND_TYPES[batch.commands[index].type]
+            detail = None
+        elif type(error) in ERROR_STATUS_CODES:
+            status_code = ERROR_STATUS_CODES[type(error)]
+            detail = str(error)
+        else:
+            status_code = fastapi.status.HTTP_500_INTERNAL_SERVER_ERROR
+            detail = "Internal server error"
+        results[index] = batch_schemas.BatchResultSchema(
+            index=index, status_code=status_code, detail=detail
+        )
+
+    return batch_schemas.BatchResponse(results=results)
@@ -2,16 +2,15 @@ from typing import Annotated, List, Dict, Any
 
 import fastapi
 
-from .. import dependencies
-from user_service import bootstrap
-from user_service.domains import commands, models
+from .. import dependencies, responses
+from user_service.domains import commands
 from user_service.entrypoints.schemas import (
     friend_schemas,
 )
+from user_service.service_layer import message_bus
+from user_service.service_layer.handlers.command import FriendRequestExisted
 from user_service import views
 
-bus = bootstrap.bootstrap()
-
 router = fastapi.APIRouter()
 
 
@@ -21,12 +20,17 @@ router = fastapi.APIRouter()
 )
 async def send_friend_request(
     cmd: commands.FriendRequestCommand,
+    bus: Annotated[message_bus.AsyncMessageBus, fastapi.Depends(dependencies.get_bus)],
 ) -> friend_schemas.FriendRequestResponse:
-    bus.handle(cmd)
+    try:
+        await bus.handle(cmd)
+
+    except FriendRequestExisted as e:
+        raise fastapi.HTTPException(
+            status_code=fastapi.status.HTTP_409_CONFLICT, detail=str(e)
+        )
 
-    friend_request = views.fetch_models_from_database(
-        model_type=models.FriendRequest, uow=bus.uow, message_id=cmd._id
-    )[0]
+    friend_request = (await views.fetch_friend_requests(bus.uow, message_id=cmd._id))[0]
 
     return friend_schemas.FriendRequestResponse(friend_request=friend_request)
 
@@ -38,15 +42,16 @@ async def send_friend_request(
 async def get_friend_requests(
     current_user: Annotated[
         Dict[str, Any], fastapi.Depends(dependencies.get_current_unlock_user)
-    ]
+    ],
+    bus: Annotated[message_bus.AsyncMessageBus, fastapi.Depends(dependencies.get_bus)],
 ) -> friend_schemas.FriendRequestsResponse:
-    friend_requests = views.fetch_models_from_database(
-        model_type=models.FriendRequest,
-        uow=bus.uow,
-        receiver_id=current_user["id"],
+    friend_requests = await views.fetch_friend_requests(
+        bus.uow, receiver_id=current_user["id"]
     )
 
-    return friend_schemas.FriendRequestsResponse(friend_requests=friend_requests)
+    return responses.trusted_response(
+        friend_schemas.FriendRequestsResponse, friend_requests=friend_requests
+    )
 
 
 @router.post(
@@ -55,8 +60,9 @@ async def get_friend_requests(
 )
 async def accept_friend_request(
     cmd: commands.AcceptFriendRequestCommand,
+    bus: Annotated[message_bus.AsyncMessageBus, fastapi.Depends(dependencies.get_bus)],
 ):
-    bus.handle(cmd)
+    await bus.handle(cmd)
 
     return fastapi.status.HTTP_201_CREATED
 
@@ -65,7 +71,10 @@ async def accept_friend_request(
     "/friend-requests/{id}/decline",
     status_code=fastapi.status.HTTP_204_NO_CONTENT,
 )
-async def decline_friend_request(cmd: commands.DeclineFriendRequestCommand):
-    bus.handle(cmd)
+async def decline_friend_request(
+    cmd: commands.DeclineFriendRequestCommand,
+    bus: Annotated[message_bus.AsyncMessageBus, fastapi.Depends(dependencies.get_bus)],
+):
+    await bus.handle(cmd)
 
     return fastapi.status.HTTP_204_NO_CONTENT
@@ -5,34 +5,44 @@ import fastapi.security
 import fastapi.responses
 
 from .. import dependencies
-from user_service import bootstrap
-from user_service.domains import commands, models
+from user_service.adapters import rate_limiter, signing_keys
+from user_service.domains import commands
 from user_service.entrypoints.schemas import login_schemas
 from user_service.service_layer.handlers import command
-from user_service import views
-
-bus = bootstrap.bootstrap()
+from user_service.service_layer import message_bus
 
 router = fastapi.APIRouter()
 
 
 @router.post("/login", status_code=fastapi.status.HTTP_200_OK)
 async def login(
-    form_data: Annotated[fastapi.security.OAuth2PasswordRequestForm, fastapi.Depends()]
+    request: fastapi.Request,
+    form_data: Annotated[fastapi.security.OAuth2PasswordRequestForm, fastapi.Depends()],
+    bus: Annotated[message_bus.AsyncMessageBus, fastapi.Depends(dependencies.get_bus)],
+    key_set: Annotated[
+        signing_keys.SigningKeySet, fastapi.Depends(dependencies.get_key_set)
+    ],
 ) -> login_schemas.LoginResponse:
     try:
         cmd = commands.LoginCommand(
-            username=form_data.username, password=form_data.password
+            username=form_data.username,
+            password=form_data.password,
+            client_ip=request.client.host if request.client else None,
+            device=request.headers.get("user-agent"),
         )
-        bus.handle(cmd)
-        users = views.fetch_models_from_database(
-            model_type=models.User, uow=bus.uow, username=form_data.username
+        principal = await bus.handle(cmd)
+
+    except rate_limiter.TooManyAttempts as e:
+        raise fastapi.HTTPException(
+            status_code=fastapi.status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after))},
+        )
+
+    except command.AccountLocked:
+        raise fastapi.HTTPException(
+            status_code=fastapi.status.HTTP_403_FORBIDDEN, detail="Account locked"
         )
-        if not users:
-            users = views.fetch_models_from_database(
-                model_type=models.User, uow=bus.uow, email=form_data.username
-            )
-        user = users[0]
 
     except command.IncorrectCredentials as e:
         raise fastapi.HTTPException(
@@ -51,7 +61,13 @@ async def login(
             },
         )
 
-    access_token = dependencies.create_access_token(data={"sub": user["id"]})
-    token = login_schemas.Token(access_token=access_token, token_type="bearer")
+    access_token = dependencies.create_access_token(
+        data=dependencies.principal_claims(principal), key_set=key_set
+    )
+    token = login_schemas.Token(
+        access_token=access_token,
+        token_type="bearer",
+        refresh_token=principal["refresh_token"],
+    )
 
     return login_schemas.LoginResponse(token=token)
@@ -0,0 +1,10 @@
+from typing import Dict
+
+import fastapi
+
+router = fastapi.APIRouter()
+
+
+@router.get("/metrics/caches", status_code=fastapi.status.HTTP_200_OK)
+async def get_cache_metrics(request: fastapi.Request) -> Dict[str, Dict[str, int]]:
+    return request.app.state.container.cache_metrics()
@@ -1,12 +1,12 @@
+from typing import Annotated
+
 import fastapi
 
 from .. import dependencies
 from user_service.domains import commands
-from user_service import bootstrap
+from user_service.service_layer import message_bus
 from user_service.service_layer.handlers import command
 
-bus = bootstrap.bootstrap()
-
 router = fastapi.APIRouter()
 
 
@@ -14,7 +14,10 @@ router = fastapi.APIRouter()
     "/register",
     status_code=fastapi.status.HTTP_204_NO_CONTENT,
 )
-async def register(cmd: commands.RegisterCommand):
+async def register(
+    cmd: commands.RegisterCommand,
+    bus: Annotated[message_bus.AsyncMessageBus, fastapi.Depends(dependencies.get_bus)],
+):
     try:
         dependencies.validate_password(cmd.password)
     except dependencies.InvalidPassword as e:
@@ -24,7 +27,7 @@ async def register(cmd: commands.RegisterCommand):
 
     try:
         cmd = commands.RegisterCommand(**cmd.model_dump())
-        bus.handle(cmd)
+        await bus.handle(cmd)
 
     except (command.EmailExisted, command.UsernameExisted) as e:
         raise fastapi.HTTPException(
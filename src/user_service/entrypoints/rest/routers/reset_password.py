@@ -1,11 +1,12 @@
+from typing import Annotated
+
 import fastapi
 
-from user_service import bootstrap
+from .. import dependencies
 from user_service.domains import commands
+from user_service.service_layer import message_bus
 from user_service.service_layer.handlers.command import IncorrectCredentials
 
-bus = bootstrap.bootstrap()
-
 router = fastapi.APIRouter()
 
 
@@ -13,9 +14,12 @@ router = fastapi.APIRouter()
     "/reset-password",
     status_code=fastapi.status.HTTP_200_OK,
 )
-async def reset_password(cmd: commands.ResetPasswordCommand):
+async def reset_password(
+    cmd: commands.ResetPasswordCommand,
+    bus: Annotated[message_bus.AsyncMessageBus, fastapi.Depends(dependencies.get_bus)],
+):
     try:
-        bus.handle(cmd)
+        await bus.handle(cmd)
 
     except IncorrectCredentials as e:
         raise fastapi.HTTPException(
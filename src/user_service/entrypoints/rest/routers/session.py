@@ -0,0 +1,81 @@
+from typing import Annotated, Any, Dict
+
+import fastapi
+
+from .. import dependencies, responses
+from user_service.adapters import signing_keys
+from user_service.domains import commands
+from user_service.entrypoints.schemas import login_schemas, session_schemas
+from user_service.service_layer import message_bus
+from user_service.service_layer.handlers import command
+from user_service import views
+
+router = fastapi.APIRouter()
+
+
+@router.post("/token/refresh", status_code=fastapi.status.HTTP_200_OK)
+async def refresh_access_token(
+    cmd: commands.RefreshAccessTokenCommand,
+    bus: Annotated[message_bus.AsyncMessageBus, fastapi.Depends(dependencies.get_bus)],
+    key_set: Annotated[
+        signing_keys.SigningKeySet, fastapi.Depends(dependencies.get_key_set)
+    ],
+) -> login_schemas.LoginResponse:
+    try:
+        principal = await bus.handle(cmd)
+
+    except command.InvalidRefreshToken as e:
+        raise fastapi.HTTPException(
+            status_code=fastapi.status.HTTP_401_UNAUTHORIZED,
+            detail=str(e),
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    access_token = dependencies.create_access_token(
+        data=dependencies.principal_claims(principal), key_set=key_set
+    )
+    token = login_schemas.Token(
+        access_token=access_token,
+        token_type="bearer",
+        refresh_token=principal["refresh_token"],
+    )
+
+    return login_schemas.LoginResponse(token=token)
+
+
+@router.get("/sessions", status_code=fastapi.status.HTTP_200_OK)
+async def get_sessions(
+    current_user: Annotated[
+        Dict[str, Any], fastapi.Depends(dependencies.get_current_unlock_user)
+    ],
+    bus: Annotated[message_bus.AsyncMessageBus, fastapi.Depends(dependencies.get_bus)],
+) -> session_schemas.SessionsResponse:
+    sessions = await views.fetch_sessions(
+        bus.uow, current_user["id"], current_user["token_version"]
+    )
+
+    return responses.trusted_response(
+        session_schemas.SessionsResponse, sessions=sessions
+    )
+
+
+@router.delete(
+    "/sessions/{id}",
+    status_code=fastapi.status.HTTP_204_NO_CONTENT,
+)
+async def revoke_session(
+    id: str,
+    current_user: Annotated[
+        Dict[str, Any], fastapi.Depends(dependencies.get_current_unlock_user)
+    ],
+    bus: Annotated[message_bus.AsyncMessageBus, fastapi.Depends(dependencies.get_bus)],
+):
+    try:
+        await bus.handle(
+            commands.RevokeSessionCommand(user_id=current_user["id"], session_id=id)
+        )
+
+    except command.SessionNotFound as e:
+        raise fastapi.HTTPException(
+            status_code=fastapi.status.HTTP_404_NOT_FOUND, detail=str(e)
+        )
@@ -1,17 +1,15 @@
-from typing import Annotated, Dict, Any
+from typing import Annotated, Dict, Any, Optional
 
 import fastapi
 import fastapi.security
 
-from .. import dependencies
-from user_service import bootstrap
-from user_service.domains import commands, models
+from .. import dependencies, responses
+from user_service.domains import commands
+from user_service.service_layer import message_bus
 from user_service.service_layer.handlers.command import InvalidOTP
 from user_service.entrypoints.schemas import user_schemas
 from user_service import views
 
-bus = bootstrap.bootstrap()
-
 router = fastapi.APIRouter()
 
 oauth2_scheme = fastapi.security.OAuth2PasswordBearer(tokenUrl="login")
@@ -24,20 +22,34 @@ class UserNotFound(Exception):
 @router.get("/users/{id}", status_code=fastapi.status.HTTP_200_OK)
 async def get_user(
     current_user: Annotated[
-        # models.User
         Dict[str, Any],
         fastapi.Depends(dependencies.get_current_unlock_user),
-    ]
+    ],
+    bus: Annotated[message_bus.AsyncMessageBus, fastapi.Depends(dependencies.get_bus)],
 ) -> user_schemas.UserReponse:
-    return user_schemas.UserReponse(user=current_user)
+    try:
+        user = await views.fetch_user(bus.uow, id=current_user["id"])
+        if user is None:
+            raise UserNotFound("User not found")
+
+    except UserNotFound as e:
+        raise fastapi.HTTPException(
+            status_code=fastapi.status.HTTP_404_NOT_FOUND, detail=str(e)
+        )
+
+    return user_schemas.UserReponse(user=user)
 
 
 @router.post(
     "/users/{id}/setup-2fa",
     status_code=fastapi.status.HTTP_202_ACCEPTED,
 )
-async def setup_two_factor_auth(id: str, cmd: commands.SetupTwoFactorAuthCommand):
-    bus.handle(cmd)
+async def setup_two_factor_auth(
+    id: str,
+    cmd: commands.SetupTwoFactorAuthCommand,
+    bus: Annotated[message_bus.AsyncMessageBus, fastapi.Depends(dependencies.get_bus)],
+):
+    await bus.handle(cmd)
 
     return fastapi.status.HTTP_202_ACCEPTED
 
@@ -46,9 +58,13 @@ async def setup_two_factor_auth(id: str, cmd: commands.SetupTwoFactorAuthCommand
     "/users/{id}/verify-2fa",
     status_code=fastapi.status.HTTP_200_OK,
 )
-async def verify_two_factor_auth(id: str, cmd: commands.VerifyTwoFactorAuthCommand):
+async def verify_two_factor_auth(
+    id: str,
+    cmd: commands.VerifyTwoFactorAuthCommand,
+    bus: Annotated[message_bus.AsyncMessageBus, fastapi.Depends(dependencies.get_bus)],
+):
     try:
-        bus.handle(cmd)
+        await bus.handle(cmd)
 
     except InvalidOTP as e:
         raise fastapi.HTTPException(
@@ -62,11 +78,12 @@ async def verify_two_factor_auth(id: str, cmd: commands.VerifyTwoFactorAuthComma
     "/users/{id}/profile",
     status_code=fastapi.status.HTTP_200_OK,
 )
-async def get_user_profile(id: str) -> user_schemas.ProfileReponse:
+async def get_user_profile(
+    id: str,
+    bus: Annotated[message_bus.AsyncMessageBus, fastapi.Depends(dependencies.get_bus)],
+) -> user_schemas.ProfileReponse:
     try:
-        user_profile = views.fetch_models_from_database(
-            model_type=models.Profile, uow=bus.uow, user_id=id
-        )[0]
+        user_profile = await views.fetch_profile(bus.uow, user_id=id)
         if user_profile is None:
             raise UserNotFound("User not found")
 
@@ -81,16 +98,21 @@ async def get_user_profile(id: str) -> user_schemas.ProfileReponse:
 @router.get(
     "/users/{id}/friends",
     status_code=fastapi.status.HTTP_200_OK,
+    response_model=user_schemas.FriendsResponse,
 )
-async def get_user_friends(id: str) -> user_schemas.FriendsResponse:
-    users_1 = views.fetch_models_from_database(
-        model_type=models.Friend, uow=bus.uow, sender_id=id
+async def get_user_friends(
+    id: str,
+    bus: Annotated[message_bus.AsyncMessageBus, fastapi.Depends(dependencies.get_bus)],
+    after: Optional[str] = None,
+    limit: Annotated[int, fastapi.Query(ge=1, le=1000)] = 100,
+):
+    # Read in full before the response starts, so a failing query is a 500
+    # rather than a 200 with a truncated body; a page is at most 1000 ids.
+    friend_ids = await views.fetch_friend_ids(
+        uow=bus.uow, user_id=id, after=after, limit=limit
     )
-    users_2 = views.fetch_models_from_database(
-        model_type=models.Friend, uow=bus.uow, receiver_id=id
-    )
-    friends = [user["receiver_id"] for user in users_1] + [
-        user["sender_id"] for user in users_2
-    ]
+    next_cursor = friend_ids[-1] if len(friend_ids) == limit else None
 
-    return user_schemas.FriendsResponse(friends=friends)
+    return responses.trusted_response(
+        user_schemas.FriendsResponse, friends=friend_ids, next=next_cursor
+    )
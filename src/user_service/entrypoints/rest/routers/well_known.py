@@ -0,0 +1,29 @@
+from typing import Annotated, Optional
+
+import fastapi
+
+from .. import dependencies
+from user_service.adapters import signing_keys
+
+router = fastapi.APIRouter()
+
+
+@router.get("/.well-known/jwks.json", status_code=fastapi.status.HTTP_200_OK)
+async def get_jwks(
+    key_set: Annotated[
+        signing_keys.SigningKeySet, fastapi.Depends(dependencies.get_key_set)
+    ],
+    if_none_match: Annotated[Optional[str], fastapi.Header()] = None,
+):
+    headers = {
+        "Cache-Control": f"public, max-age={key_set.jwks_max_age}",
+        "ETag": key_set.jwks_etag,
+    }
+    if if_none_match == key_set.jwks_etag:
+        return fastapi.Response(
+            status_code=fastapi.status.HTTP_304_NOT_MODIFIED, headers=headers
+        )
+
+    return fastapi.Response(
+        content=key_set.jwks, media_type="application/json", headers=headers
+    )
@@ -0,0 +1,24 @@
+from typing import Any, Dict, List, Literal, Optional
+
+import pydantic
+
+MAX_BATCH_SIZE = 1000
+
+
+class BatchCommandSchema(pydantic.BaseModel):
+    type: Literal["register", "friend_request"]
+    payload: Dict[str, Any]
+
+
+class BatchRequest(pydantic.BaseModel):
+    commands: List[BatchCommandSchema] = pydantic.Field(max_length=MAX_BATCH_SIZE)
+
+
+class BatchResultSchema(pydantic.BaseModel):
+    index: int
+    status_code: int
+    detail: Optional[str] = None
+
+
+class BatchResponse(pydantic.BaseModel):
+    results: List[BatchResultSchema]
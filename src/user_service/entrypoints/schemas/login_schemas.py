@@ -1,9 +1,12 @@
+from typing import Optional
+
 import pydantic
 
 
 class Token(pydantic.BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
 
 
 class LoginResponse(pydantic.BaseModel):
@@ -0,0 +1,24 @@
+from typing import List, Optional
+from datetime import datetime
+
+import pydantic
+
+
+class RefreshTokenBase(pydantic.BaseModel):
+    refresh_token: str
+
+
+class SessionSchema(pydantic.BaseModel):
+    model_config = pydantic.ConfigDict(from_attributes=True)
+
+    id: str
+    device: Optional[str] = None
+    created_time: datetime
+    updated_time: datetime
+    expires_time: datetime
+
+
+class SessionsResponse(pydantic.BaseModel):
+    model_config = pydantic.ConfigDict(from_attributes=True)
+
+    sessions: List[SessionSchema]
@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 import pydantic
 
@@ -59,3 +59,4 @@ class FriendsResponse(pydantic.BaseModel):
     model_config = pydantic.ConfigDict(from_attributes=True)
 
     friends: List[str]
+    next: Optional[str] = None
@@ -0,0 +1,44 @@
+import argparse
+import asyncio
+import logging
+
+from user_service import bootstrap
+from user_service.service_layer import worker
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Consume domain events from EVENT_BROKER_URL and handle them."
+    )
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument(
+        "--ack-mode",
+        choices=[worker.ACK_AFTER_HANDLING, worker.ACK_BEFORE_HANDLING],
+        default=None,
+    )
+    return parser.parse_args()
+
+
+async def run(concurrency: int = None, ack_mode: str = None):
+    container = await bootstrap.create_container()
+    if container.broker is None:
+        await container.dispose()
+        raise SystemExit("EVENT_BROKER_URL is not set")
+
+    event_worker = worker.EventWorker(
+        container.broker, container.bus, concurrency=concurrency, ack_mode=ack_mode
+    )
+    try:
+        await event_worker.run()
+    finally:
+        await container.dispose()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    asyncio.run(run(concurrency=args.concurrency, ack_mode=args.ack_mode))
+
+
+if __name__ == "__main__":
+    main()
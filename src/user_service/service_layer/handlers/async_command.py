@@ -0,0 +1,329 @@
+from typing import Any, Dict, Callable, List, Optional, Type
+from sqlalchemy.exc import IntegrityError
+from user_service.domains import commands, events, models
+from user_service.adapters import cache, mailer, otp, password_hasher, rate_limiter
+from user_service.service_layer import unit_of_work
+from user_service.service_layer.handlers.command import (
+    IncorrectCredentials,
+    AccountLocked,
+    TwoFactorAuthNotEnabled,
+    InvalidOTP,
+    FriendRequestExisted,
+    InvalidRefreshToken,
+    SessionNotFound,
+    LOGIN_FIELDS,
+    PRINCIPAL_FIELDS,
+    accept_new_friend_requests,
+    accept_new_users,
+    friend_request_conflicts,
+    is_replayed,
+    issue_refresh_token,
+    login_users,
+    make_principal,
+    match_login_user,
+    new_friend_request,
+    new_user,
+    raise_if_reset_not_allowed,
+    raise_if_session_expired,
+    raise_if_user_cannot_refresh,
+    raise_if_user_exists,
+    random_valid_password,
+    stale_sessions,
+    translate_user_integrity_error,
+    user_conflicts,
+)
+
+
+async def register(
+    cmd: commands.RegisterCommand,
+    uow: unit_of_work.AbstractAsyncUnitOfWork,
+    hasher: password_hasher.PasswordHasher,
+):
+    async with uow:
+        conflicts = await uow.repo.get_fields(
+            models.User, ("email", "username"), user_conflicts([cmd]), limit=2
+        )
+    raise_if_user_exists(cmd, conflicts)
+
+    # Hashed outside the unit of work, so no connection is held while the
+    # request waits for a hasher thread.
+    user = new_user(cmd, await hasher.hash(cmd.password))
+
+    async with uow:
+        uow.repo.add(user)
+        try:
+            await uow.commit()
+        except IntegrityError as e:
+            raise translate_user_integrity_error(cmd, e)
+
+
+async def setup_two_factor_auth(
+    cmd: commands.SetupTwoFactorAuthCommand,
+    uow: unit_of_work.AbstractAsyncUnitOfWork,
+    otp_service: otp.OTPService,
+    email_sender: mailer.AbstractMailer,
+):
+    async with uow:
+        users = await uow.repo.get_fields(
+            models.User, ("email", "secret_token"), id=cmd.user_id, limit=1
+        )
+    user = users[0]
+
+    await email_sender.send(user["email"], otp_service.now(user["secret_token"]))
+
+
+async def verify_two_factor_auth(
+    cmd: commands.VerifyTwoFactorAuthCommand,
+    uow: unit_of_work.AbstractAsyncUnitOfWork,
+    principal_cache: cache.TTLCache,
+    otp_service: otp.OTPService,
+):
+    async with uow:
+        user = await uow.repo.get_by_id(models.User, cmd.user_id)
+
+        if not otp_service.verify(user.secret_token, cmd.otp_code):
+            raise InvalidOTP("Invalid OTP code")
+
+        user.enable_two_factor_auth()
+
+        await uow.commit()
+
+    principal_cache.invalidate(cmd.user_id)
+
+
+async def login(
+    cmd: commands.LoginCommand,
+    uow: unit_of_work.AbstractAsyncUnitOfWork,
+    hasher: password_hasher.PasswordHasher,
+    principal_cache: cache.TTLCache,
+    login_limiter: rate_limiter.LoginRateLimiter,
+) -> Dict[str, Any]:
+    await login_limiter.check(cmd.username, cmd.client_ip)
+
+    async with uow:
+        users = await uow.repo.get_fields(
+            models.User, LOGIN_FIELDS, login_users(cmd), limit=2
+        )
+    user = match_login_user(cmd, users)
+
+    if user is None:
+        await login_limiter.record_failure(cmd.username)
+        raise IncorrectCredentials("Incorrect username or password")
+
+    verified, new_hash = await hasher.verify_and_update(cmd.password, user["password"])
+    if not verified:
+        locks = await login_limiter.record_failure(cmd.username, user["id"])
+        if locks and not user["locked"]:
+            async with uow:
+                locked_user = await uow.repo.get_by_id(models.User, user["id"])
+                locked_user.lock()
+                await uow.commit()
+            principal_cache.invalidate(user["id"])
+        raise IncorrectCredentials("Incorrect username or password")
+
+    # Checked only once the password verified, so a locked account answers a
+    # wrong password like any other and does not reveal that it is locked.
+    if user["locked"]:
+        raise AccountLocked(user["id"])
+
+    await login_limiter.record_success(cmd.username, user["id"])
+
+    if new_hash is not None:
+        async with uow:
+            rehashed_user = await uow.repo.get_by_id(models.User, user["id"])
+            rehashed_user.change_password(new_hash)
+            await uow.commit()
+        principal_cache.invalidate(user["id"])
+
+    if not user["two_factor_auth_enabled"]:
+        raise TwoFactorAuthNotEnabled(user["id"])
+
+    async with uow:
+        await uow.repo.delete(
+            models.RefreshToken,
+            stale_sessions(user["token_version"]),
+            user_id=user["id"],
+        )
+        session = models.RefreshToken(
+            cmd._id, user["id"], user["token_version"], cmd.device
+        )
+        refresh_token = issue_refresh_token(session)
+        uow.repo.add(session)
+        await uow.commit()
+
+    return make_principal(user, refresh_token)
+
+
+async def refresh_access_token(
+    cmd: commands.RefreshAccessTokenCommand,
+    uow: unit_of_work.AbstractAsyncUnitOfWork,
+) -> Dict[str, Any]:
+    session_id, _, secret = cmd.refresh_token.partition(".")
+    async with uow:
+        # Locked so concurrent refreshes with one token are serialised and
+        # only the first one rotates the session.
+        session = await uow.repo.get_by_id(
+            models.RefreshToken, session_id, for_update=True
+        )
+        raise_if_session_expired(session)
+
+        if is_replayed(session, secret):
+            # The token may have leaked: end the session.
+            await uow.repo.remove(session)
+            await uow.commit()
+            raise InvalidRefreshToken("Invalid refresh token")
+
+        users = await uow.repo.get_fields(
+            models.User, PRINCIPAL_FIELDS, id=session.user_id, limit=1
+        )
+        raise_if_user_cannot_refresh(session, users)
+
+        refresh_token = issue_refresh_token(session)
+        await uow.commit()
+
+    return make_principal(users[0], refresh_token)
+
+
+async def revoke_session(
+    cmd: commands.RevokeSessionCommand,
+    uow: unit_of_work.AbstractAsyncUnitOfWork,
+):
+    async with uow:
+        session = await uow.repo.get_by_id(models.RefreshToken, cmd.session_id)
+        if session is None or session.user_id != cmd.user_id:
+            raise SessionNotFound(f"Session {cmd.session_id} not found")
+
+        await uow.repo.remove(session)
+        await uow.commit()
+
+
+async def reset_password(
+    cmd: commands.ResetPasswordCommand,
+    uow: unit_of_work.AbstractAsyncUnitOfWork,
+    hasher: password_hasher.PasswordHasher,
+    principal_cache: cache.TTLCache,
+    login_limiter: rate_limiter.LoginRateLimiter,
+    email_sender: mailer.AbstractMailer,
+):
+    async with uow:
+        users = await uow.repo.get_fields(
+            models.User, ("id", "username"), email=cmd.email, limit=1
+        )
+    raise_if_reset_not_allowed(cmd, users)
+
+    new_password = random_valid_password()
+    new_hashed_password = await hasher.hash(new_password)
+
+    async with uow:
+        user = await uow.repo.get_by_id(models.User, users[0]["id"])
+        user.change_password(new_hashed_password)
+        user.unlock()
+        user.revoke_tokens()
+
+        await uow.commit()
+
+    principal_cache.invalidate(user.id)
+    await login_limiter.reset_failures(user.id)
+
+    await email_sender.send(user.email, new_password)
+
+
+async def create_friend_request(
+    cmd: commands.FriendRequestCommand,
+    uow: unit_of_work.AbstractAsyncUnitOfWork,
+):
+    async with uow:
+        uow.repo.add(new_friend_request(cmd))
+
+        try:
+            await uow.commit()
+        except IntegrityError:
+            raise FriendRequestExisted("Friend request already existed")
+
+
+async def accept_friend_request(
+    cmd: commands.AcceptFriendRequestCommand,
+    uow: unit_of_work.AbstractAsyncUnitOfWork,
+):
+    async with uow:
+        friend_request = await uow.repo.get_by_id(
+            models.FriendRequest, cmd.friend_request.id
+        )
+
+        friend_request.events.append(
+            events.AcceptedFriendRequestEvent(friend_request_id=cmd.friend_request.id)
+        )
+
+        await uow.commit()
+
+
+async def decline_friend_request(
+    cmd: commands.DeclineFriendRequestCommand,
+    uow: unit_of_work.AbstractAsyncUnitOfWork,
+):
+    async with uow:
+        friend_request = await uow.repo.get_by_id(
+            models.FriendRequest, cmd.friend_request.id
+        )
+
+        await uow.repo.remove(friend_request)
+
+        await uow.commit()
+
+
+async def register_many(
+    cmds: List[commands.RegisterCommand],
+    uow: unit_of_work.AbstractAsyncUnitOfWork,
+    hasher: password_hasher.PasswordHasher,
+) -> List[Optional[Exception]]:
+    async with uow:
+        conflicts = await uow.repo.get_fields(
+            models.User, ("email", "username"), user_conflicts(cmds)
+        )
+    errors, accepted = accept_new_users(cmds, conflicts)
+
+    # Hashed outside the unit of work, so no connection is held for the
+    # whole batch of hashes.
+    hashed_passwords = await hasher.hash_many([cmd.password for cmd in accepted])
+
+    async with uow:
+        for cmd, hashed_password in zip(accepted, hashed_passwords):
+            uow.repo.add(new_user(cmd, hashed_password))
+        await uow.commit()
+
+    return errors
+
+
+async def create_friend_requests(
+    cmds: List[commands.FriendRequestCommand],
+    uow: unit_of_work.AbstractAsyncUnitOfWork,
+) -> List[Optional[Exception]]:
+    async with uow:
+        conflicts = await uow.repo.get(
+            models.FriendRequest, friend_request_conflicts(cmds)
+        )
+        errors, accepted = accept_new_friend_requests(cmds, conflicts)
+        for friend_request in accepted:
+            uow.repo.add(friend_request)
+        await uow.commit()
+
+    return errors
+
+
+COMMAND_HANDLERS = {
+    commands.RegisterCommand: register,
+    commands.SetupTwoFactorAuthCommand: setup_two_factor_auth,
+    commands.VerifyTwoFactorAuthCommand: verify_two_factor_auth,
+    commands.LoginCommand: login,
+    commands.ResetPasswordCommand: reset_password,
+    commands.FriendRequestCommand: create_friend_request,
+    commands.AcceptFriendRequestCommand: accept_friend_request,
+    commands.DeclineFriendRequestCommand: decline_friend_request,
+    commands.RefreshAccessTokenCommand: refresh_access_token,
+    commands.RevokeSessionCommand: revoke_session,
+}  # type: Dict[Type[commands.Command], Callable]
+
+BATCH_COMMAND_HANDLERS = {
+    commands.RegisterCommand: register_many,
+    commands.FriendRequestCommand: create_friend_requests,
+}  # type: Dict[Type[commands.Command], Callable]
@@ -1,15 +1,20 @@
-from typing import Dict, Callable, Type
+from typing import Any, Dict, Callable, List, Optional, Sequence, Tuple, Type
+import hashlib
+import hmac
+import re
+import secrets
 import string
 import random
-from datetime import datetime
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from user_service import config
 from user_service.domains import commands, events, models
+from user_service.adapters import cache, mailer, otp, password_hasher, rate_limiter
 from user_service.service_layer import unit_of_work
-from passlib.context import CryptContext
 import pyotp
 from icecream import ic
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 
 class UsernameExisted(Exception):
     pass
@@ -27,10 +32,219 @@ class TwoFactorAuthNotEnabled(Exception):
     pass
 
 
+class AccountLocked(Exception):
+    pass
+
+
 class InvalidOTP(Exception):
     pass
 
 
+class FriendRequestExisted(Exception):
+    pass
+
+
+class InvalidRefreshToken(Exception):
+    pass
+
+
+class SessionNotFound(Exception):
+    pass
+
+
+# The helpers below hold everything the sync handlers here and the async
+# ones in ``async_command`` have in common, so the two only differ in
+# awaiting the unit of work, the repository and the adapters.
+
+
+def user_conflicts(cmds: Sequence[commands.RegisterCommand]):
+    """Criteria for the users that took an email or username of ``cmds``."""
+    return or_(
+        models.User.email.in_({cmd.email for cmd in cmds}),
+        models.User.username.in_({cmd.username for cmd in cmds}),
+    )
+
+
+def raise_if_user_exists(
+    cmd: commands.RegisterCommand, conflicts: List[Dict[str, Any]]
+):
+    if any(conflict["email"] == cmd.email for conflict in conflicts):
+        raise EmailExisted(f"Email {cmd.email} already existed")
+    if any(conflict["username"] == cmd.username for conflict in conflicts):
+        raise UsernameExisted(f"Username {cmd.username} already existed")
+
+
+def accept_new_users(
+    cmds: Sequence[commands.RegisterCommand], conflicts: List[Dict[str, Any]]
+) -> Tuple[List[Optional[Exception]], List[commands.RegisterCommand]]:
+    """Return the error of each of ``cmds`` and the ones free to register.
+
+    A command also conflicts with an earlier command of the same batch.
+    """
+    errors = [None] * len(cmds)
+    accepted = []
+    emails = {conflict["email"] for conflict in conflicts}
+    usernames = {conflict["username"] for conflict in conflicts}
+    for index, cmd in enumerate(cmds):
+        if cmd.email in emails:
+            errors[index] = EmailExisted(f"Email {cmd.email} already existed")
+        elif cmd.username in usernames:
+            errors[index] = UsernameExisted(f"Username {cmd.username} already existed")
+        else:
+            emails.add(cmd.email)
+            usernames.add(cmd.username)
+            accepted.append(cmd)
+    return errors, accepted
+
+
+def new_user(cmd: commands.RegisterCommand, hashed_password: str) -> models.User:
+    user = models.User(
+        cmd._id, cmd.username, cmd.email, hashed_password, pyotp.random_base32()
+    )
+    user.events.append(
+        events.RegisteredEvent(
+            user_id=user.id,
+            first_name=cmd.first_name,
+            last_name=cmd.last_name,
+            backup_email=cmd.backup_email,
+            gender=cmd.gender,
+            date_of_birth=cmd.date_of_birth,
+        )
+    )
+    return user
+
+
+def translate_user_integrity_error(
+    cmd: commands.RegisterCommand, error: IntegrityError
+) -> Exception:
+    """Map a unique constraint violation on ``users`` to the domain error.
+
+    This catches the registrations that race past ``raise_if_user_exists``.
+    The violated key is named last in both MySQL and SQLite messages.
+    """
+    keys = re.findall(r"(?:users\.|key ')(email|username)\b", str(error.orig))
+    if keys and keys[-1] == "email":
+        return EmailExisted(f"Email {cmd.email} already existed")
+    if keys and keys[-1] == "username":
+        return UsernameExisted(f"Username {cmd.username} already existed")
+    return error
+
+
+PRINCIPAL_FIELDS = models.PRINCIPAL_FIELDS
+LOGIN_FIELDS = PRINCIPAL_FIELDS + ("username", "email", "password")
+
+
+def login_users(cmd: commands.LoginCommand):
+    """Criteria for the users ``cmd.username`` may name."""
+    return or_(
+        models.User.username == cmd.username,
+        models.User.email == cmd.username,
+    )
+
+
+def match_login_user(
+    cmd: commands.LoginCommand, users: List[Dict[str, Any]]
+) -> Optional[Dict[str, Any]]:
+    """Pick the user ``cmd.username`` names, preferring a username match.
+
+    ``users`` are the rows matched by ``login_users``.
+    """
+    for field in ("username", "email"):
+        for user in users:
+            if user[field] == cmd.username:
+                return user
+    return None
+
+
+def hash_refresh_secret(secret: str) -> str:
+    return hmac.new(
+        config.SECRET_KEY.encode(), secret.encode(), hashlib.sha256
+    ).hexdigest()
+
+
+def stale_sessions(token_version: int):
+    """Criteria for a user's sessions that can no longer be refreshed."""
+    return or_(
+        models.RefreshToken.expires_time <= datetime.now(),
+        models.RefreshToken.token_version != token_version,
+    )
+
+
+def issue_refresh_token(session: models.RefreshToken) -> str:
+    """Rotate ``session`` to a new secret and return its refresh token."""
+    secret = secrets.token_urlsafe(32)
+    ttl = timedelta(days=config.get_refresh_token_config()["ttl_days"])
+    session.rotate(hash_refresh_secret(secret), datetime.now() + ttl)
+    return f"{session.id}.{secret}"
+
+
+def raise_if_session_expired(session: Optional[models.RefreshToken]):
+    if session is None or session.expires_time <= datetime.now():
+        raise InvalidRefreshToken("Invalid refresh token")
+
+
+def is_replayed(session: models.RefreshToken, secret: str) -> bool:
+    """Whether ``secret`` is one ``session`` already rotated away from."""
+    return not hmac.compare_digest(session.token_hash, hash_refresh_secret(secret))
+
+
+def raise_if_user_cannot_refresh(
+    session: models.RefreshToken, users: List[Dict[str, Any]]
+):
+    if (
+        not users
+        or users[0]["locked"]
+        or users[0]["token_version"] != session.token_version
+    ):
+        raise InvalidRefreshToken("Invalid refresh token")
+
+
+def make_principal(user: Dict[str, Any], refresh_token: str) -> Dict[str, Any]:
+    principal = {field: user[field] for field in PRINCIPAL_FIELDS}
+    principal["refresh_token"] = refresh_token
+    return principal
+
+
+def raise_if_reset_not_allowed(
+    cmd: commands.ResetPasswordCommand, users: List[Dict[str, Any]]
+):
+    if not users or users[0]["username"] != cmd.username:
+        raise IncorrectCredentials("Incorrect email or username")
+
+
+def new_friend_request(cmd: commands.FriendRequestCommand) -> models.FriendRequest:
+    return models.FriendRequest(message_id=cmd._id, **cmd.model_dump())
+
+
+def friend_request_conflicts(cmds: Sequence[commands.FriendRequestCommand]):
+    """Criteria for the friend requests that may already pair ``cmds``."""
+    return and_(
+        models.FriendRequest.sender_id.in_({cmd.sender_id for cmd in cmds}),
+        models.FriendRequest.receiver_id.in_({cmd.receiver_id for cmd in cmds}),
+    )
+
+
+def accept_new_friend_requests(
+    cmds: Sequence[commands.FriendRequestCommand],
+    conflicts: List[models.FriendRequest],
+) -> Tuple[List[Optional[Exception]], List[models.FriendRequest]]:
+    """Return the error of each of ``cmds`` and the friend requests to add."""
+    errors = [None] * len(cmds)
+    accepted = []
+    pairs = {
+        (friend_request.sender_id, friend_request.receiver_id)
+        for friend_request in conflicts
+    }
+    for index, cmd in enumerate(cmds):
+        if (cmd.sender_id, cmd.receiver_id) in pairs:
+            errors[index] = FriendRequestExisted("Friend request already existed")
+            continue
+
+        pairs.add((cmd.sender_id, cmd.receiver_id))
+        accepted.append(new_friend_request(cmd))
+    return errors, accepted
+
+
 def random_valid_password(length=12):
     lowercase_letters = string.ascii_lowercase
     uppercase_letters = string.ascii_uppercase
@@ -50,110 +264,193 @@ def random_valid_password(length=12):
 def register(
     cmd: commands.RegisterCommand,
     uow: unit_of_work.AbstractUnitOfWork,
+    hasher: password_hasher.PasswordHasher,
 ):
     with uow:
-        users = uow.repo.get(models.User, email=cmd.email)
-        if users:
-            raise EmailExisted(f"Email {cmd.email} already existed")
-        users = uow.repo.get(models.User, username=cmd.username)
-        if users:
-            raise UsernameExisted(f"Username {cmd.username} already existed")
-
-        hashed_password = pwd_context.hash(cmd.password)
-        secret_token = pyotp.random_base32()
-
-        user = models.User(
-            cmd._id, cmd.username, cmd.email, hashed_password, secret_token
+        conflicts = uow.repo.get_fields(
+            models.User, ("email", "username"), user_conflicts([cmd]), limit=2
         )
-        uow.repo.add(user)
+    raise_if_user_exists(cmd, conflicts)
 
-        user.events.append(
-            events.RegisteredEvent(
-                user_id=user.id,
-                first_name=cmd.first_name,
-                last_name=cmd.last_name,
-                backup_email=cmd.backup_email,
-                gender=cmd.gender,
-                date_of_birth=cmd.date_of_birth,
-            )
-        )
+    # Hashed outside the unit of work, so no connection is held while the
+    # request waits for a hasher thread.
+    user = new_user(cmd, hasher.hash_sync(cmd.password))
 
-        uow.commit()
+    with uow:
+        uow.repo.add(user)
+        try:
+            uow.commit()
+        except IntegrityError as e:
+            raise translate_user_integrity_error(cmd, e)
 
 
 def setup_two_factor_auth(
     cmd: commands.SetupTwoFactorAuthCommand,
     uow: unit_of_work.AbstractUnitOfWork,
+    otp_service: otp.OTPService,
+    email_sender: mailer.AbstractMailer,
 ):
     with uow:
-        users = uow.repo.get(models.User, id=cmd.user_id)
-        user = users[0]
-        otp_code = pyotp.TOTP(user.secret_token).now()
-        email_address = f"mock_emails/{user.email}.txt"
+        users = uow.repo.get_fields(
+            models.User, ("email", "secret_token"), id=cmd.user_id, limit=1
+        )
+    user = users[0]
 
-    with open(email_address, "a") as file:
-        file.write(f"{otp_code}\n")
+    email_sender.send_sync(user["email"], otp_service.now(user["secret_token"]))
 
 
 def verify_two_factor_auth(
     cmd: commands.VerifyTwoFactorAuthCommand,
     uow: unit_of_work.AbstractUnitOfWork,
+    principal_cache: cache.TTLCache,
+    otp_service: otp.OTPService,
 ):
     with uow:
-        users = uow.repo.get(models.User, id=cmd.user_id)
-        user = users[0]
+        user = uow.repo.get_by_id(models.User, cmd.user_id)
 
-        if not pyotp.TOTP(user.secret_token).verify(cmd.otp_code):
+        if not otp_service.verify(user.secret_token, cmd.otp_code):
             raise InvalidOTP("Invalid OTP code")
 
         user.enable_two_factor_auth()
 
         uow.commit()
 
+    principal_cache.invalidate(cmd.user_id)
+
 
 def login(
     cmd: commands.LoginCommand,
     uow: unit_of_work.AbstractUnitOfWork,
-):
+    hasher: password_hasher.PasswordHasher,
+    principal_cache: cache.TTLCache,
+    login_limiter: rate_limiter.LoginRateLimiter,
+) -> Dict[str, Any]:
+    login_limiter.check_sync(cmd.username, cmd.client_ip)
+
     with uow:
-        users = uow.repo.get(models.User, username=cmd.username)
+        users = uow.repo.get_fields(
+            models.User, LOGIN_FIELDS, login_users(cmd), limit=2
+        )
+    user = match_login_user(cmd, users)
+
+    if user is None:
+        login_limiter.record_failure_sync(cmd.username)
+        raise IncorrectCredentials("Incorrect username or password")
+
+    verified, new_hash = hasher.verify_and_update_sync(cmd.password, user["password"])
+    if not verified:
+        locks = login_limiter.record_failure_sync(cmd.username, user["id"])
+        if locks and not user["locked"]:
+            with uow:
+                locked_user = uow.repo.get_by_id(models.User, user["id"])
+                locked_user.lock()
+                uow.commit()
+            principal_cache.invalidate(user["id"])
+        raise IncorrectCredentials("Incorrect username or password")
+
+    # Checked only once the password verified, so a locked account answers a
+    # wrong password like any other and does not reveal that it is locked.
+    if user["locked"]:
+        raise AccountLocked(user["id"])
+
+    login_limiter.record_success_sync(cmd.username, user["id"])
+
+    if new_hash is not None:
+        with uow:
+            rehashed_user = uow.repo.get_by_id(models.User, user["id"])
+            rehashed_user.change_password(new_hash)
+            uow.commit()
+        principal_cache.invalidate(user["id"])
+
+    if not user["two_factor_auth_enabled"]:
+        raise TwoFactorAuthNotEnabled(user["id"])
 
-        if not users:
-            users = uow.repo.get(models.User, email=cmd.username)
+    with uow:
+        uow.repo.delete(
+            models.RefreshToken,
+            stale_sessions(user["token_version"]),
+            user_id=user["id"],
+        )
+        session = models.RefreshToken(
+            cmd._id, user["id"], user["token_version"], cmd.device
+        )
+        refresh_token = issue_refresh_token(session)
+        uow.repo.add(session)
+        uow.commit()
+
+    return make_principal(user, refresh_token)
 
-        if not users:
-            raise IncorrectCredentials("Incorrect username or password")
 
-        user = users[0]
-        if not pwd_context.verify(cmd.password, user.password):
-            raise IncorrectCredentials("Incorrect username or password")
+def refresh_access_token(
+    cmd: commands.RefreshAccessTokenCommand,
+    uow: unit_of_work.AbstractUnitOfWork,
+) -> Dict[str, Any]:
+    session_id, _, secret = cmd.refresh_token.partition(".")
+    with uow:
+        # Locked so concurrent refreshes with one token are serialised and
+        # only the first one rotates the session.
+        session = uow.repo.get_by_id(models.RefreshToken, session_id, for_update=True)
+        raise_if_session_expired(session)
+
+        if is_replayed(session, secret):
+            # The token may have leaked: end the session.
+            uow.repo.remove(session)
+            uow.commit()
+            raise InvalidRefreshToken("Invalid refresh token")
+
+        users = uow.repo.get_fields(
+            models.User, PRINCIPAL_FIELDS, id=session.user_id, limit=1
+        )
+        raise_if_user_cannot_refresh(session, users)
+
+        refresh_token = issue_refresh_token(session)
+        uow.commit()
+
+    return make_principal(users[0], refresh_token)
+
+
+def revoke_session(
+    cmd: commands.RevokeSessionCommand,
+    uow: unit_of_work.AbstractUnitOfWork,
+):
+    with uow:
+        session = uow.repo.get_by_id(models.RefreshToken, cmd.session_id)
+        if session is None or session.user_id != cmd.user_id:
+            raise SessionNotFound(f"Session {cmd.session_id} not found")
 
-        if not user.two_factor_auth_enabled:
-            raise TwoFactorAuthNotEnabled(user.id)
+        uow.repo.remove(session)
+        uow.commit()
 
 
 def reset_password(
     cmd: commands.ResetPasswordCommand,
     uow: unit_of_work.AbstractUnitOfWork,
+    hasher: password_hasher.PasswordHasher,
+    principal_cache: cache.TTLCache,
+    login_limiter: rate_limiter.LoginRateLimiter,
+    email_sender: mailer.AbstractMailer,
 ):
     with uow:
-        users = uow.repo.get(models.User, email=cmd.email)
-        if not users:
-            raise IncorrectCredentials("Incorrect email or username")
+        users = uow.repo.get_fields(
+            models.User, ("id", "username"), email=cmd.email, limit=1
+        )
+    raise_if_reset_not_allowed(cmd, users)
 
-        user = users[0]
-        if user.username != cmd.username:
-            raise IncorrectCredentials("Incorrect email or username")
+    new_password = random_valid_password()
+    new_hashed_password = hasher.hash_sync(new_password)
 
-        new_password = random_valid_password()
-        new_hashed_password = pwd_context.hash(new_password)
+    with uow:
+        user = uow.repo.get_by_id(models.User, users[0]["id"])
         user.change_password(new_hashed_password)
-        email_address = f"mock_emails/{user.email}.txt"
+        user.unlock()
+        user.revoke_tokens()
 
         uow.commit()
 
-    with open(email_address, "a") as file:
-        file.write(f"{new_password}\n")
+    principal_cache.invalidate(user.id)
+    login_limiter.reset_failures_sync(user.id)
+
+    email_sender.send_sync(user.email, new_password)
 
 
 def create_friend_request(
@@ -161,10 +458,12 @@ def create_friend_request(
     uow: unit_of_work.AbstractUnitOfWork,
 ):
     with uow:
-        friend_request = models.FriendRequest(message_id=cmd._id, **cmd.model_dump())
-        uow.repo.add(friend_request)
+        uow.repo.add(new_friend_request(cmd))
 
-        uow.commit()
+        try:
+            uow.commit()
+        except IntegrityError:
+            raise FriendRequestExisted("Friend request already existed")
 
 
 def accept_friend_request(
@@ -172,9 +471,7 @@ def accept_friend_request(
     uow: unit_of_work.AbstractUnitOfWork,
 ):
     with uow:
-        friend_requests = uow.repo.get(models.FriendRequest, id=cmd.friend_request.id)
-
-        friend_request = friend_requests[0]
+        friend_request = uow.repo.get_by_id(models.FriendRequest, cmd.friend_request.id)
 
         friend_request.events.append(
             events.AcceptedFriendRequestEvent(friend_request_id=cmd.friend_request.id)
@@ -188,15 +485,50 @@ def decline_friend_request(
     uow: unit_of_work.AbstractUnitOfWork,
 ):
     with uow:
-        friend_requests = uow.repo.get(models.FriendRequest, id=cmd.friend_request_id)
-
-        friend_request = friend_requests[0]
+        friend_request = uow.repo.get_by_id(models.FriendRequest, cmd.friend_request.id)
 
         uow.repo.remove(friend_request)
 
         uow.commit()
 
 
+def register_many(
+    cmds: List[commands.RegisterCommand],
+    uow: unit_of_work.AbstractUnitOfWork,
+    hasher: password_hasher.PasswordHasher,
+) -> List[Optional[Exception]]:
+    with uow:
+        conflicts = uow.repo.get_fields(
+            models.User, ("email", "username"), user_conflicts(cmds)
+        )
+    errors, accepted = accept_new_users(cmds, conflicts)
+
+    # Hashed outside the unit of work, so no connection is held for the
+    # whole batch of hashes.
+    hashed_passwords = hasher.hash_many_sync([cmd.password for cmd in accepted])
+
+    with uow:
+        for cmd, hashed_password in zip(accepted, hashed_passwords):
+            uow.repo.add(new_user(cmd, hashed_password))
+        uow.commit()
+
+    return errors
+
+
+def create_friend_requests(
+    cmds: List[commands.FriendRequestCommand],
+    uow: unit_of_work.AbstractUnitOfWork,
+) -> List[Optional[Exception]]:
+    with uow:
+        conflicts = uow.repo.get(models.FriendRequest, friend_request_conflicts(cmds))
+        errors, accepted = accept_new_friend_requests(cmds, conflicts)
+        for friend_request in accepted:
+            uow.repo.add(friend_request)
+        uow.commit()
+
+    return errors
+
+
 COMMAND_HANDLERS = {
     commands.RegisterCommand: register,
     commands.SetupTwoFactorAuthCommand: setup_two_factor_auth,
@@ -205,4 +537,12 @@ COMMAND_HANDLERS = {
     commands.ResetPasswordCommand: reset_password,
     commands.FriendRequestCommand: create_friend_request,
     commands.AcceptFriendRequestCommand: accept_friend_request,
+    commands.DeclineFriendRequestCommand: decline_friend_request,
+    commands.RefreshAccessTokenCommand: refresh_access_token,
+    commands.RevokeSessionCommand: revoke_session,
+}  # type: Dict[Type[commands.Command], Callable]
+
+BATCH_COMMAND_HANDLERS = {
+    commands.RegisterCommand: register_many,
+    commands.FriendRequestCommand: create_friend_requests,
 }  # type: Dict[Type[commands.Command], Callable]
@@ -1,5 +1,4 @@
-from typing import List, Dict, Callable, Type
-from datetime import datetime
+from typing import List, Dict, Callable, Set, Type
 from user_service.domains import events, models
 from user_service.service_layer import unit_of_work
 
@@ -9,6 +8,10 @@ def create_user_profile(
     uow: unit_of_work.AbstractUnitOfWork,
 ):
     with uow:
+        # The event is delivered at least once; a redelivery finds the profile.
+        if uow.repo.exists(models.Profile, user_id=event.user_id):
+            return
+
         profile = models.Profile(
             message_id=event._id,
             **event.model_dump(),
@@ -23,20 +26,21 @@ def add_to_friend_list(
     uow: unit_of_work.AbstractUnitOfWork,
 ):
     with uow:
-        friend_request = uow.repo.get(models.FriendRequest, id=event.friend_request_id)[0]
+        # Locked and deleted in this transaction by remove_friend_request, so
+        # a redelivered event finds no request and counts the friends once.
+        friend_request = uow.repo.get_by_id(
+            models.FriendRequest, event.friend_request_id, for_update=True
+        )
+        if friend_request is None:
+            return
+
         sender_id = friend_request.sender_id
         receiver_id = friend_request.receiver_id
 
         friend = models.Friend(event._id, sender_id=sender_id, receiver_id=receiver_id)
         uow.repo.add(friend)
 
-        sender_profile = uow.repo.get(models.Profile, user_id=sender_id)[0]
-        sender_profile.friends += 1
-        sender_profile.updated_time = datetime.now()
-
-        receiver_profile = uow.repo.get(models.Profile, user_id=receiver_id)[0]
-        receiver_profile.friends += 1
-        receiver_profile.updated_time = datetime.now()
+        uow.repo.increment(models.Profile, "friends", user_id=[sender_id, receiver_id])
 
         uow.commit()
 
@@ -45,13 +49,52 @@ def remove_friend_request(
     event: events.AcceptedFriendRequestEvent, uow: unit_of_work.AbstractUnitOfWork
 ):
     with uow:
-        friend_request = uow.repo.get(models.FriendRequest, id=event.friend_request_id)[0]
+        friend_request = uow.repo.get_by_id(
+            models.FriendRequest, event.friend_request_id
+        )
+        if friend_request is None:
+            return
+
         uow.repo.remove(friend_request)
 
         uow.commit()
 
 
+def create_user_profiles(
+    registered_events: List[events.RegisteredEvent],
+    uow: unit_of_work.AbstractUnitOfWork,
+):
+    with uow:
+        existing = {
+            row["user_id"]
+            for row in uow.repo.get_fields(
+                models.Profile,
+                ("user_id",),
+                models.Profile.user_id.in_(
+                    [event.user_id for event in registered_events]
+                ),
+            )
+        }
+        for event in registered_events:
+            if event.user_id in existing:
+                continue
+            existing.add(event.user_id)
+            uow.repo.add(models.Profile(message_id=event._id, **event.model_dump()))
+
+        uow.commit()
+
+
 EVENT_HANDLERS = {
     events.RegisteredEvent: [create_user_profile],
     events.AcceptedFriendRequestEvent: [add_to_friend_list, remove_friend_request],
 }  # type: Dict[Type[events.Event], List[Callable]]
+
+BATCH_EVENT_HANDLERS = {
+    events.RegisteredEvent: [create_user_profiles],
+}  # type: Dict[Type[events.Event], List[Callable]]
+
+# Handlers for these events share one unit of work, so they commit or roll
+# back together and see each other's changes through one identity map.
+SHARED_TRANSACTION_EVENTS = {
+    events.AcceptedFriendRequestEvent,
+}  # type: Set[Type[events.Event]]
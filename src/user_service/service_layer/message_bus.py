@@ -1,5 +1,21 @@
 import logging
-from typing import Callable, Dict, List, Union, Type
+from collections import defaultdict, deque
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
+from user_service import config
 from user_service.domains import commands, events
 from user_service.service_layer import unit_of_work
 
@@ -8,44 +24,405 @@ logger = logging.getLogger(__name__)
 Message = Union[commands.Command, events.Event]
 
 
-class MessageBus:
+class EventHandlerFailed(Exception):
+    pass
+
+
+def _group_by_type(messages: Sequence[Message]) -> Dict[Type[Message], List[int]]:
+    groups = defaultdict(list)
+    for index, message in enumerate(messages):
+        groups[type(message)].append(index)
+    return groups
+
+
+class DispatchTable:
+    """Maps message types to a tuple of handlers.
+
+    Registered types are a single dict lookup. A subclass without handlers of
+    its own resolves to the nearest registered type in its MRO; the result is
+    cached the first time the subclass is seen.
+    """
+
+    def __init__(
+        self,
+        handlers: Mapping[Type[Message], Union[Callable, Iterable[Callable]]],
+    ):
+        self._handlers = {
+            message_type: (handler,) if callable(handler) else tuple(handler)
+            for message_type, handler in handlers.items()
+        }
+        self._resolved = dict(self._handlers)
+
+    def get(self, message_type: Type[Message]) -> Tuple[Callable, ...]:
+        try:
+            return self._resolved[message_type]
+        except KeyError:
+            pass
+
+        handlers = next(
+            (
+                self._handlers[base]
+                for base in message_type.__mro__
+                if base in self._handlers
+            ),
+            (),
+        )
+        self._resolved[message_type] = handlers
+        return handlers
+
+    def __contains__(self, message_type: Type[Message]) -> bool:
+        return bool(self.get(message_type))
+
+
+def _as_dispatch_table(handlers) -> DispatchTable:
+    if isinstance(handlers, DispatchTable):
+        return handlers
+    return DispatchTable(handlers or {})
+
+
+class DispatchContext:
+    """Messages still waiting to be dispatched by one ``handle`` call.
+
+    Each call gets its own context, so concurrent calls on a shared bus never
+    see each other's messages. Every message carries the depth of the cascade
+    that produced it; messages deeper than ``max_depth`` are dropped.
+    """
+
+    def __init__(self, max_depth: int):
+        self.max_depth = max_depth
+        self._queue: Deque[Tuple[Message, int]] = deque()
+
+    def push(self, messages: Iterable[Message], depth: int):
+        messages = list(messages)
+        if not messages:
+            return
+        if depth > self.max_depth:
+            logger.error(
+                "Maximum cascade depth %d exceeded, dropping %s",
+                self.max_depth,
+                messages,
+            )
+            return
+        self._queue.extend((message, depth) for message in messages)
+
+    def pop(self) -> Tuple[Message, int]:
+        return self._queue.popleft()
+
+    def __bool__(self) -> bool:
+        return bool(self._queue)
+
+
+# One step of a bus operation: a handler and the message or batch to call it
+# with. The operations below are written once as generators of steps; the
+# sync bus calls each step and the async bus awaits it, so that is all the
+# two buses differ in.
+Step = Tuple[Callable[[Any], Any], Any]
+Steps = Generator[Step, Any, Any]
+
+
+def _run(steps: Steps) -> Any:
+    """Run ``steps`` to completion, calling each one."""
+    value = error = None
+    while True:
+        try:
+            handler, arg = steps.send(value) if error is None else steps.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            value, error = handler(arg), None
+        except Exception as e:
+            error = e
+
+
+async def _run_async(steps: Steps) -> Any:
+    """Run ``steps`` to completion, awaiting each one."""
+    value = error = None
+    while True:
+        try:
+            handler, arg = steps.send(value) if error is None else steps.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            value, error = await handler(arg), None
+        except Exception as e:
+            error = e
+
+
+class _BaseMessageBus:
     def __init__(
         self,
-        uow: unit_of_work.AbstractUnitOfWork,
-        event_handlers: Dict[Type[events.Event], List[Callable]],
-        command_handlers: Dict[Type[commands.Command], Callable],
+        uow: Union[
+            unit_of_work.AbstractUnitOfWork, unit_of_work.AbstractAsyncUnitOfWork
+        ],
+        event_handlers: Union[DispatchTable, Dict[Type[events.Event], List[Callable]]],
+        command_handlers: Union[DispatchTable, Dict[Type[commands.Command], Callable]],
+        batch_event_handlers: Union[
+            DispatchTable, Dict[Type[events.Event], List[Callable]], None
+        ] = None,
+        batch_command_handlers: Union[
+            DispatchTable, Dict[Type[commands.Command], Callable], None
+        ] = None,
+        max_cascade_depth: Optional[int] = None,
+        shared_transaction_events: Iterable[Type[events.Event]] = (),
     ):
         self.uow = uow
-        self.event_handlers = event_handlers
-        self.command_handlers = command_handlers
-
-    def handle(self, message: Message):
-        self.queue = [message]
-        while self.queue:
-            message = self.queue.pop(0)
-            if isinstance(message, events.Event):
-                self.handle_event(message)
-            elif isinstance(message, commands.Command):
-                self.handle_command(message)
-            else:
-                raise Exception(f"{message} was not an Event or Command")
-
-    def handle_event(self, event: events.Event):
-        for handler in self.event_handlers[type(event)]:
+        self.event_handlers = _as_dispatch_table(event_handlers)
+        self.command_handlers = _as_dispatch_table(command_handlers)
+        self.batch_event_handlers = _as_dispatch_table(batch_event_handlers)
+        self.batch_command_handlers = _as_dispatch_table(batch_command_handlers)
+        self._dispatchers = {}
+        self.shared_transaction_events = tuple(shared_transaction_events)
+        self.max_cascade_depth = (
+            max_cascade_depth
+            if max_cascade_depth is not None
+            else config.get_message_bus_config()["max_cascade_depth"]
+        )
+
+    def _handle(self, message: Message) -> Steps:
+        result = None
+        context = DispatchContext(self.max_cascade_depth)
+        if isinstance(message, commands.Command):
+            result, new_messages = yield from self._execute_command(message)
+            context.push(new_messages, depth=1)
+        else:
+            context.push([message], depth=0)
+        yield from self._drain(context)
+        return result
+
+    def _handle_delivered(self, event: events.Event) -> Steps:
+        new_messages, succeeded = yield from self._run_event_handlers(event)
+        context = DispatchContext(self.max_cascade_depth)
+        context.push(new_messages, depth=1)
+        yield from self._drain(context)
+        if not succeeded:
+            raise EventHandlerFailed(f"Handling event {event} failed")
+
+    def _drain(self, context: DispatchContext) -> Steps:
+        while context:
+            message, depth = context.pop()
+            dispatch = self._dispatchers.get(type(message)) or self._dispatcher(message)
+            context.push((yield from dispatch(message)), depth + 1)
+
+    def _dispatcher(self, message: Message) -> Callable[[Message], Steps]:
+        if isinstance(message, events.Event):
+            dispatch = self._handle_event
+        elif isinstance(message, commands.Command):
+            dispatch = self._handle_command
+        else:
+            raise Exception(f"{message} was not an Event or Command")
+        self._dispatchers[type(message)] = dispatch
+        return dispatch
+
+    def _handle_many(self, messages: Sequence[commands.Command]) -> Steps:
+        results = [None] * len(messages)
+        new_events = []
+        for command_type, indexes in _group_by_type(messages).items():
+            batch = [messages[index] for index in indexes]
+            errors = None
+            handlers = self.batch_command_handlers.get(command_type)
+            if handlers:
+                try:
+                    logger.debug("Handling %d %s in batch", len(batch), command_type)
+                    errors = yield handlers[0], batch
+                    new_events.extend(self.uow.collect_new_events())
+                except Exception:
+                    logger.exception("Exception handling batch of %s", command_type)
+
+            if errors is None:
+                errors = []
+                for command in batch:
+                    try:
+                        yield from self._handle(command)
+                        errors.append(None)
+                    except Exception as e:
+                        errors.append(e)
+
+            for index, error in zip(indexes, errors):
+                results[index] = error
+
+        failed = yield from self._handle_events(new_events)
+        if failed:
+            # The commands themselves succeeded; their follow-up events are
+            # not retried here, so make the failures visible.
+            logger.error(
+                "Handlers failed for %d events raised by a batch: %s",
+                len(failed),
+                failed,
+            )
+        return results
+
+    def _handle_events(self, events_batch: Sequence[events.Event]) -> Steps:
+        singles = []
+        new_messages = []
+        for event_type, indexes in _group_by_type(events_batch).items():
+            batch = [events_batch[index] for index in indexes]
+            handlers = self.batch_event_handlers.get(event_type)
+            if not handlers:
+                singles.extend(batch)
+                continue
+
+            try:
+                for handler in handlers:
+                    logger.debug("Handling %d %s in batch", len(batch), event_type)
+                    yield handler, batch
+                    new_messages.extend(self.uow.collect_new_events())
+            except Exception:
+                logger.exception("Exception handling batch of %s", event_type)
+                singles.extend(batch)
+
+        failed = []
+        for event in singles:
+            try:
+                yield from self._handle_delivered(event)
+            except EventHandlerFailed:
+                failed.append(event)
+        for message in new_messages:
+            yield from self._handle(message)
+        return failed
+
+    def _handle_event(self, event: events.Event) -> Steps:
+        new_messages, _ = yield from self._run_event_handlers(event)
+        return new_messages
+
+    def _run_event_handlers(self, event: events.Event) -> Steps:
+        """Run the handlers of ``event``.
+
+        Returns the messages they raised and whether all of them succeeded.
+        """
+        if isinstance(event, self.shared_transaction_events):
+            try:
+                yield self._handle_event_in_one_transaction, event
+            except Exception:
+                logger.exception("Exception handling event %s", event)
+                return [], False
+            return list(self.uow.collect_new_events()), True
+
+        new_messages = []
+        succeeded = True
+        for handler in self.event_handlers.get(type(event)):
             try:
                 logger.debug("Handling event %s with handler %s", event, handler)
-                handler(event)
-                self.queue.extend(self.uow.collect_new_events())
+                yield handler, event
+                new_messages.extend(self.uow.collect_new_events())
             except Exception:
                 logger.exception("Exception handling event %s", event)
-                continue
+                succeeded = False
+        return new_messages, succeeded
 
-    def handle_command(self, command: commands.Command):
+    def _handle_command(self, command: commands.Command) -> Steps:
+        _, new_messages = yield from self._execute_command(command)
+        return new_messages
+
+    def _execute_command(self, command: commands.Command) -> Steps:
         logger.debug("Handling command %s", command)
         try:
-            handler = self.command_handlers[type(command)]
-            handler(command)
-            self.queue.extend(self.uow.collect_new_events())
+            handlers = self.command_handlers.get(type(command))
+            if not handlers:
+                raise KeyError(f"No handler registered for {type(command)}")
+            result = yield handlers[0], command
+            return result, list(self.uow.collect_new_events())
         except Exception:
             logger.exception("Exception handling command %s", command)
             raise
+
+
+class MessageBus(_BaseMessageBus):
+    uow: unit_of_work.AbstractUnitOfWork
+
+    def handle(self, message: Message) -> Any:
+        """Handle ``message`` and the events it cascades into.
+
+        Returns whatever the handler of a command returned, so callers get
+        e.g. the principal of a login without querying for it again.
+        """
+        return _run(self._handle(message))
+
+    def handle_delivered(self, event: events.Event):
+        """Handle ``event`` and its cascade like ``handle``.
+
+        For events that are delivered again when handling fails, such as those
+        from the outbox or a broker: raises ``EventHandlerFailed`` if any
+        handler of ``event`` itself failed, once the events raised by the
+        others have been handled.
+        """
+        _run(self._handle_delivered(event))
+
+    def handle_many(
+        self, messages: Sequence[commands.Command]
+    ) -> List[Optional[Exception]]:
+        """Handle a batch of commands and return one result per command.
+
+        Commands of the same type that have a batch handler share a single
+        transaction; the rest go through ``handle`` one at a time, as does a
+        batch whose handler fails outright. A result is ``None`` on success or
+        the exception raised for that command.
+        """
+        return _run(self._handle_many(messages))
+
+    def handle_events(self, events_batch: Sequence[events.Event]) -> List[events.Event]:
+        """Handle a batch of events and return those whose handlers failed.
+
+        Events of the same type that have a batch handler are handled
+        together; the rest, and a batch whose handler fails, are handled one
+        at a time through ``handle_delivered``.
+        """
+        return _run(self._handle_events(events_batch))
+
+    def _handle_event_in_one_transaction(self, event: events.Event):
+        with self.uow:
+            for handler in self.event_handlers.get(type(event)):
+                logger.debug("Handling event %s with handler %s", event, handler)
+                handler(event)
+            self.uow.commit()
+
+
+class AsyncMessageBus(_BaseMessageBus):
+    uow: unit_of_work.AbstractAsyncUnitOfWork
+
+    async def handle(self, message: Message) -> Any:
+        """Handle ``message`` and the events it cascades into.
+
+        Returns whatever the handler of a command returned, so callers get
+        e.g. the principal of a login without querying for it again.
+        """
+        return await _run_async(self._handle(message))
+
+    async def handle_delivered(self, event: events.Event):
+        """Handle ``event`` and its cascade like ``handle``.
+
+        For events that are delivered again when handling fails, such as those
+        from the outbox or a broker: raises ``EventHandlerFailed`` if any
+        handler of ``event`` itself failed, once the events raised by the
+        others have been handled.
+        """
+        await _run_async(self._handle_delivered(event))
+
+    async def handle_many(
+        self, messages: Sequence[commands.Command]
+    ) -> List[Optional[Exception]]:
+        """Handle a batch of commands and return one result per command.
+
+        Commands of the same type that have a batch handler share a single
+        transaction; the rest go through ``handle`` one at a time, as does a
+        batch whose handler fails outright. A result is ``None`` on success or
+        the exception raised for that command.
+        """
+        return await _run_async(self._handle_many(messages))
+
+    async def handle_events(
+        self, events_batch: Sequence[events.Event]
+    ) -> List[events.Event]:
+        """Handle a batch of events and return those whose handlers failed.
+
+        Events of the same type that have a batch handler are handled
+        together; the rest, and a batch whose handler fails, are handled one
+        at a time through ``handle_delivered``.
+        """
+        return await _run_async(self._handle_events(events_batch))
+
+    async def _handle_event_in_one_transaction(self, event: events.Event):
+        async with self.uow:
+            for handler in self.event_handlers.get(type(event)):
+                logger.debug("Handling event %s with handler %s", event, handler)
+                await handler(event)
+            await self.uow.commit()
@@ -0,0 +1,114 @@
+import asyncio
+import contextlib
+import logging
+from typing import Optional
+
+from user_service import config
+from user_service.adapters import broker as event_broker
+from user_service.adapters import outbox
+from user_service.service_layer import message_bus
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxRelay:
+    """Drains the outbox table in batches.
+
+    Events are dispatched on the bus, or published to ``broker`` when one is
+    given. The relay wakes up when ``notify`` is called after a commit that wrote to
+    the outbox, and otherwise polls every ``poll_interval`` seconds so events
+    left behind by a crash or by another process are picked up too. An event
+    is removed from the outbox in the same transaction that claimed it, once
+    its handlers have succeeded, so delivery is at least once. An event whose
+    handlers failed stays and is retried on the next drain, until it has
+    failed ``max_attempts`` times.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        bus: message_bus.AsyncMessageBus,
+        batch_size: Optional[int] = None,
+        poll_interval: Optional[float] = None,
+        broker: Optional[event_broker.AbstractBroker] = None,
+        max_attempts: Optional[int] = None,
+    ):
+        settings = config.get_outbox_config()
+        self.session_factory = session_factory
+        self.bus = bus
+        self.broker = broker
+        self.batch_size = batch_size or settings["batch_size"]
+        self.poll_interval = (
+            poll_interval if poll_interval is not None else settings["poll_interval"]
+        )
+        self.max_attempts = max_attempts or settings["max_attempts"]
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def notify(self):
+        self._wakeup.set()
+
+    async def relay_batch(self) -> int:
+        """Relay one batch and return the number of events relayed."""
+        failed_events = []
+        async with self.session_factory() as session:
+            async with session.begin():
+                claimed_events = await outbox.claim(
+                    session, self.batch_size, self.max_attempts
+                )
+                if claimed_events:
+                    logger.debug("Relaying %d outbox events", len(claimed_events))
+                    if self.broker is not None:
+                        await self.broker.publish_many(claimed_events)
+                    else:
+                        failed_events = await self.bus.handle_events(claimed_events)
+                    failed_ids = {event._id for event in failed_events}
+                    await outbox.remove(
+                        session,
+                        [
+                            event
+                            for event in claimed_events
+                            if event._id not in failed_ids
+                        ],
+                    )
+                    for id in await outbox.record_failures(
+                        session, failed_events, self.max_attempts
+                    ):
+                        logger.error(
+                            "Outbox event %s failed %d times, no longer retrying",
+                            id,
+                            self.max_attempts,
+                        )
+        return len(claimed_events) - len(failed_events)
+
+    async def drain(self) -> int:
+        """Relay until the outbox is empty or a batch had failures."""
+        relayed = 0
+        while True:
+            count = await self.relay_batch()
+            relayed += count
+            if count < self.batch_size:
+                return relayed
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.drain()
+            except Exception:
+                logger.exception("Exception relaying outbox events")
+
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
@@ -0,0 +1,97 @@
+import asyncio
+import contextlib
+import logging
+from typing import Optional
+
+from sqlalchemy import func, select, update
+
+from user_service import config
+from user_service.adapters import orm
+from user_service.service_layer import unit_of_work
+
+logger = logging.getLogger(__name__)
+
+
+def _friend_count(column):
+    return (
+        select(func.count())
+        .select_from(orm.friends)
+        .where(column == orm.profiles.c.user_id)
+        .scalar_subquery()
+    )
+
+
+async def reconcile_friend_counts(
+    uow: unit_of_work.AbstractAsyncUnitOfWork, batch_size: int = 1000
+) -> int:
+    """Recompute ``profiles.friends`` from the ``friends`` table.
+
+    Profiles are walked in ``user_id`` order, ``batch_size`` per transaction,
+    and each batch is fixed with a single ``UPDATE`` whose counts come from
+    correlated subqueries on the indexed ``sender_id`` and ``receiver_id``
+    columns. Returns the number of profiles visited.
+    """
+    visited = 0
+    after = None
+    while True:
+        async with uow:
+            query = (
+                select(orm.profiles.c.user_id)
+                .order_by(orm.profiles.c.user_id)
+                .limit(batch_size)
+            )
+            if after is not None:
+                query = query.where(orm.profiles.c.user_id > after)
+            user_ids = (await uow.session.execute(query)).scalars().all()
+            if not user_ids:
+                return visited
+
+            await uow.session.execute(
+                update(orm.profiles)
+                .where(orm.profiles.c.user_id.in_(user_ids))
+                .values(
+                    friends=_friend_count(orm.friends.c.sender_id)
+                    + _friend_count(orm.friends.c.receiver_id)
+                )
+            )
+            await uow.commit()
+
+        visited += len(user_ids)
+        after = user_ids[-1]
+
+
+class FriendCountReconciler:
+    """Runs ``reconcile_friend_counts`` every ``interval`` seconds."""
+
+    def __init__(
+        self,
+        uow: unit_of_work.AbstractAsyncUnitOfWork,
+        interval: Optional[float] = None,
+        batch_size: Optional[int] = None,
+    ):
+        settings = config.get_reconciliation_config()
+        self.uow = uow
+        self.interval = interval or settings["interval"]
+        self.batch_size = batch_size or settings["batch_size"]
+        self._task: Optional[asyncio.Task] = None
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                visited = await reconcile_friend_counts(self.uow, self.batch_size)
+                logger.info("Reconciled friend counts of %d profiles", visited)
+            except Exception:
+                logger.exception("Exception reconciling friend counts")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
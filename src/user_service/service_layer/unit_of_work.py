@@ -1,11 +1,9 @@
 from __future__ import annotations
 import abc
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.orm.session import Session
+import contextvars
+from typing import Callable, List
 
-from user_service import config
-from user_service.adapters import repository
+from user_service.adapters import outbox, repository
 
 
 class AbstractUnitOfWork(abc.ABC):
@@ -22,6 +20,8 @@ class AbstractUnitOfWork(abc.ABC):
         self._commit()
 
     def collect_new_events(self):
+        if self.repo is None:
+            return
         for model in self.repo.seen:
             while model.events:
                 yield model.events.pop(0)
@@ -39,23 +39,63 @@ class AbstractUnitOfWork(abc.ABC):
         raise NotImplementedError
 
 
-DEFAULT_SESSION_FACTORY = sessionmaker(
-    bind=create_engine(
-        config.get_mysql_uri(),
-    )
-)
+class _ContextScoped:
+    """Keeps the session, repository and nesting depth in context variables.
 
+    One unit of work instance is shared by every in-flight request on the
+    bus, so each thread and each asyncio task must only see the session it
+    opened itself.
+    """
 
-class SqlAlchemyUnitOfWork(AbstractUnitOfWork):
-    def __init__(self, session_factory=DEFAULT_SESSION_FACTORY):
+    def _init_context(self):
+        self._session = contextvars.ContextVar(f"session_{id(self)}", default=None)
+        self._repo = contextvars.ContextVar(f"repo_{id(self)}", default=None)
+        self._depth = contextvars.ContextVar(f"depth_{id(self)}", default=0)
+
+    @property
+    def session(self):
+        return self._session.get()
+
+    @property
+    def repo(self):
+        return self._repo.get()
+
+
+class SqlAlchemyUnitOfWork(_ContextScoped, AbstractUnitOfWork):
+    """Sync unit of work.
+
+    Its session and repository are scoped to the calling thread or task, so
+    one instance can serve concurrent requests. Entering it again while it is
+    already open joins the open transaction: the inner block shares its
+    session and identity map, its ``commit`` only flushes, and the outermost
+    block decides whether everything commits.
+    """
+
+    def __init__(self, session_factory):
         self.session_factory = session_factory
+        self._init_context()
 
     def __enter__(self):
-        self.session = self.session_factory()
-        self.repo = repository.SqlAlchemyRepository(self.session)
+        depth = self._depth.get()
+        if depth > 0:
+            self._depth.set(depth + 1)
+            return self
+        session = self.session_factory()
+        self._session.set(session)
+        self._repo.set(repository.SqlAlchemyRepository(session))
+        self._depth.set(1)
         return super().__enter__()
 
+    def __exit__(self, *args):
+        depth = self._depth.get() - 1
+        self._depth.set(depth)
+        if depth == 0:
+            super().__exit__(*args)
+
     def _commit(self):
+        if self._depth.get() > 1:
+            self.session.flush()
+            return
         self.session.commit()
 
     def rollback(self):
@@ -63,3 +103,95 @@ class SqlAlchemyUnitOfWork(AbstractUnitOfWork):
 
     def close(self):
         self.session.close()
+
+
+class AbstractAsyncUnitOfWork(abc.ABC):
+    repo: repository.AbstractAsyncRepository
+
+    async def __aenter__(self) -> AbstractAsyncUnitOfWork:
+        return self
+
+    async def __aexit__(self, *args):
+        await self.rollback()
+        await self.close()
+
+    async def commit(self):
+        await self._commit()
+
+    def collect_new_events(self):
+        if self.repo is None:
+            return
+        for model in self.repo.seen:
+            while model.events:
+                yield model.events.pop(0)
+
+    @abc.abstractmethod
+    async def _commit(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def rollback(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def close(self):
+        raise NotImplementedError
+
+
+class AsyncSqlAlchemyUnitOfWork(_ContextScoped, AbstractAsyncUnitOfWork):
+    """Async unit of work.
+
+    Its session and repository are scoped to the calling asyncio task. As
+    with ``SqlAlchemyUnitOfWork``, entering it again within the same task
+    joins the open transaction.
+
+    With ``use_outbox`` the events raised by the models are written to the
+    outbox table in the same transaction as the change that raised them,
+    instead of being handed back to the bus, and ``outbox_listeners`` are
+    called once that transaction commits.
+    """
+
+    def __init__(self, session_factory, use_outbox: bool = False):
+        self.session_factory = session_factory
+        self.use_outbox = use_outbox
+        self.outbox_listeners: List[Callable[[], None]] = []
+        self._init_context()
+
+    async def __aenter__(self):
+        depth = self._depth.get()
+        if depth > 0:
+            self._depth.set(depth + 1)
+            return self
+        session = self.session_factory()
+        self._session.set(session)
+        self._repo.set(repository.AsyncSqlAlchemyRepository(session))
+        self._depth.set(1)
+        return await super().__aenter__()
+
+    async def __aexit__(self, *args):
+        depth = self._depth.get() - 1
+        self._depth.set(depth)
+        if depth == 0:
+            await super().__aexit__(*args)
+
+    async def _commit(self):
+        if self._depth.get() > 1:
+            await self.session.flush()
+            return
+
+        if not self.use_outbox:
+            await self.session.commit()
+            return
+
+        new_events = list(self.collect_new_events())
+        await outbox.add(self.session, new_events)
+        await self.session.commit()
+        if new_events:
+            for listener in self.outbox_listeners:
+                listener()
+
+    async def rollback(self):
+        await self.session.rollback()
+
+    async def close(self):
+        await self.session.close()
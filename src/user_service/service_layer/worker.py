@@ -0,0 +1,94 @@
+import asyncio
+import contextlib
+import logging
+from typing import List, Optional
+
+from user_service import config
+from user_service.adapters import broker as event_broker
+from user_service.service_layer import message_bus
+
+logger = logging.getLogger(__name__)
+
+ACK_AFTER_HANDLING = "after"
+ACK_BEFORE_HANDLING = "before"
+
+
+class EventWorker:
+    """Consumes events from a broker and handles them on the bus.
+
+    ``concurrency`` consumers run side by side. With ``ack_mode="after"`` an
+    event is acked only once its handlers have succeeded, so it is redelivered
+    if one of them fails or the worker dies (at least once). With
+    ``ack_mode="before"`` it is acked on receipt (at most once). An event that
+    has failed ``max_attempts`` times is acked and dropped.
+    """
+
+    def __init__(
+        self,
+        broker: event_broker.AbstractBroker,
+        bus: message_bus.AsyncMessageBus,
+        concurrency: Optional[int] = None,
+        ack_mode: Optional[str] = None,
+        max_attempts: Optional[int] = None,
+    ):
+        settings = config.get_event_worker_config()
+        self.broker = broker
+        self.bus = bus
+        self.concurrency = concurrency or settings["concurrency"]
+        self.ack_mode = ack_mode or settings["ack_mode"]
+        self.max_attempts = max_attempts or settings["max_attempts"]
+        if self.ack_mode not in (ACK_AFTER_HANDLING, ACK_BEFORE_HANDLING):
+            raise ValueError(f"Unsupported ack mode {self.ack_mode}")
+        self._tasks: List[asyncio.Task] = []
+
+    async def process_one(self):
+        delivery = await self.broker.consume()
+        if self.ack_mode == ACK_BEFORE_HANDLING:
+            await self.broker.ack(delivery)
+
+        try:
+            await self.bus.handle_delivered(delivery.event)
+        except Exception:
+            logger.exception("Exception handling event %s", delivery.event)
+            if self.ack_mode == ACK_AFTER_HANDLING:
+                if delivery.attempts < self.max_attempts:
+                    await self.broker.nack(delivery)
+                else:
+                    logger.error("Dropping event %s", delivery.event)
+                    await self.broker.ack(delivery)
+            return
+
+        if self.ack_mode == ACK_AFTER_HANDLING:
+            await self.broker.ack(delivery)
+
+    async def consume_forever(self):
+        while True:
+            try:
+                await self.process_one()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Exception consuming events")
+                await asyncio.sleep(1)
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self.consume_forever())
+                for _ in range(self.concurrency)
+            ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._tasks = []
+
+    async def run(self):
+        self.start()
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            await self.stop()
@@ -1,15 +1,158 @@
-from typing import Type, List, Dict, Any
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Sequence
 
+from sqlalchemy import Table, select, union_all
+
+from user_service.adapters import orm
 from user_service.domains import models
 from user_service.service_layer import unit_of_work
 
+USER_COLUMNS = (
+    "id",
+    "username",
+    "email",
+    "password",
+    "two_factor_auth_enabled",
+    "locked",
+    "token_version",
+    "created_time",
+    "updated_time",
+)
+PRINCIPAL_COLUMNS = models.PRINCIPAL_FIELDS
+PROFILE_COLUMNS = (
+    "id",
+    "user_id",
+    "first_name",
+    "last_name",
+    "backup_email",
+    "gender",
+    "date_of_birth",
+    "friends",
+    "followers",
+    "created_time",
+    "updated_time",
+)
+FRIEND_REQUEST_COLUMNS = (
+    "id",
+    "sender_id",
+    "receiver_id",
+    "created_time",
+    "updated_time",
+)
+SESSION_COLUMNS = (
+    "id",
+    "device",
+    "created_time",
+    "updated_time",
+    "expires_time",
+)
+
 
-def fetch_models_from_database(
-    model_type: Type[models.BaseModel],
-    uow: unit_of_work.SqlAlchemyUnitOfWork,
-    *args,
-    **kwargs
+async def fetch_rows(
+    uow: unit_of_work.AbstractAsyncUnitOfWork,
+    table: Table,
+    columns: Sequence[str],
+    limit: Optional[int] = None,
+    **filters,
 ) -> List[Dict[str, Any]]:
-    with uow:
-        results = uow.repo.get(model_type=model_type, *args, **kwargs)
-        return [result.json for result in results] if results else []
+    """Select only ``columns`` of ``table`` as plain dicts.
+
+    Runs a Core statement, so no entities are hydrated, tracked by the
+    session's identity map or added to ``repo.seen``.
+    """
+    statement = select(*(table.c[column] for column in columns)).filter_by(**filters)
+    if limit is not None:
+        statement = statement.limit(limit)
+
+    async with uow:
+        results = await uow.session.execute(statement)
+        return [dict(row) for row in results.mappings()]
+
+
+async def fetch_user(
+    uow: unit_of_work.AbstractAsyncUnitOfWork, **filters
+) -> Optional[Dict[str, Any]]:
+    users = await fetch_rows(uow, orm.users, USER_COLUMNS, limit=1, **filters)
+    return users[0] if users else None
+
+
+async def fetch_principal(
+    uow: unit_of_work.AbstractAsyncUnitOfWork, user_id: str
+) -> Optional[Dict[str, Any]]:
+    users = await fetch_rows(uow, orm.users, PRINCIPAL_COLUMNS, limit=1, id=user_id)
+    return users[0] if users else None
+
+
+async def fetch_profile(
+    uow: unit_of_work.AbstractAsyncUnitOfWork, user_id: str
+) -> Optional[Dict[str, Any]]:
+    profiles = await fetch_rows(
+        uow, orm.profiles, PROFILE_COLUMNS, limit=1, user_id=user_id
+    )
+    return profiles[0] if profiles else None
+
+
+async def fetch_friend_requests(
+    uow: unit_of_work.AbstractAsyncUnitOfWork, **filters
+) -> List[Dict[str, Any]]:
+    return await fetch_rows(uow, orm.friend_requests, FRIEND_REQUEST_COLUMNS, **filters)
+
+
+async def fetch_sessions(
+    uow: unit_of_work.AbstractAsyncUnitOfWork, user_id: str, token_version: int
+) -> List[Dict[str, Any]]:
+    """List a user's live sessions, most recently used first.
+
+    Sessions that expired, or that were started before the user's tokens
+    were last revoked, are left out.
+    """
+    refresh_tokens = orm.refresh_tokens
+    statement = (
+        select(*(refresh_tokens.c[column] for column in SESSION_COLUMNS))
+        .where(
+            refresh_tokens.c.user_id == user_id,
+            refresh_tokens.c.token_version == token_version,
+            refresh_tokens.c.expires_time > datetime.now(),
+        )
+        .order_by(refresh_tokens.c.updated_time.desc())
+    )
+
+    async with uow:
+        results = await uow.session.execute(statement)
+        return [dict(row) for row in results.mappings()]
+
+
+async def fetch_friend_ids(
+    uow: unit_of_work.AbstractAsyncUnitOfWork,
+    user_id: str,
+    after: Optional[str] = None,
+    limit: int = 100,
+) -> List[str]:
+    """List the ids of a user's friends in ascending order, starting after ``after``.
+
+    Both directions of the friendship are read in one UNION ALL query, each
+    branch walking its (user, friend) index and stopping at ``limit`` rows.
+    """
+    friends = orm.friends
+    sent = select(friends.c.receiver_id.label("friend_id")).where(
+        friends.c.sender_id == user_id
+    )
+    received = select(friends.c.sender_id.label("friend_id")).where(
+        friends.c.receiver_id == user_id
+    )
+    if after is not None:
+        sent = sent.where(friends.c.receiver_id > after)
+        received = received.where(friends.c.sender_id > after)
+
+    branches = [
+        select(branch.order_by("friend_id").limit(limit).subquery())
+        for branch in (sent, received)
+    ]
+    friend_ids = union_all(*branches).subquery()
+    statement = (
+        select(friend_ids.c.friend_id).order_by(friend_ids.c.friend_id).limit(limit)
+    )
+
+    async with uow:
+        results = await uow.session.execute(statement)
+        return list(results.scalars())
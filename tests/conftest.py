@@ -5,11 +5,12 @@ from typing import Any, List, Generator
 import pytest
 import requests
 from sqlalchemy import text, MetaData, create_engine
-from sqlalchemy.orm import sessionmaker, clear_mappers
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from tenacity import retry, stop_after_delay
 from fastapi.testclient import TestClient
 
-from src.user_service.adapters.orm import start_mappers, metadata
+from src.user_service.adapters.orm import start_mappers, clear_mappers, metadata
 from src.user_service import config
 from user_service.entrypoints.rest.fastapi_app import app
 from tests import random_refs
@@ -37,7 +38,8 @@ def request_bodies(request) -> Generator[List[dict[str, Any]], Any, None]:
 
 @pytest.fixture()
 def client():
-    return TestClient(app)
+    with TestClient(app) as client:
+        yield client
 
 
 @pytest.fixture
@@ -52,6 +54,14 @@ def sqlite_session_factory(sqlite_db):
     yield sessionmaker(bind=sqlite_db)
 
 
+@pytest.fixture
+def aiosqlite_session_factory(tmp_path):
+    db_path = tmp_path / "test.db"
+    metadata.create_all(create_engine(f"sqlite:///{db_path}"))
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    yield async_sessionmaker(bind=engine, expire_on_commit=False)
+
+
 @pytest.fixture
 def mappers():
     start_mappers()
@@ -9,6 +9,17 @@ import random
 from datetime import datetime, timedelta, timezone
 
 
+def read_mock_email(email, timeout=5):
+    # Emails are delivered in the background, shortly after the response.
+    file_path = Path(f"mock_emails/{email}.txt")
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if file_path.exists() and file_path.read_text().strip():
+            return file_path.read_text().strip()
+        time.sleep(0.05)
+    raise AssertionError(f"No email delivered to {email}")
+
+
 @pytest.mark.usefixtures("mysql_db")
 def test_registered_successfully_returns_201(
     client,
@@ -124,9 +135,7 @@ def test_login_and_verify_enable_two_factor_auth_successfully_returns_200(
     user_id = r.json()["user_id"]
 
     email = data["email"]
-    otp_file_path = Path(f"mock_emails/{email}.txt")
-    with otp_file_path.open("r") as otp_file:
-        otp_code = otp_file.read().strip()
+    otp_code = read_mock_email(email)
 
     # act
     r = client.patch(f"/user/{user_id}/verify-enable-2fa", json={"otp_code": otp_code})
@@ -172,9 +181,7 @@ def test_login_and_verify_enable_two_factor_auth_expired_otp_code_returns_400(
     user_id = r.json()["user_id"]
 
     email = data["email"]
-    otp_file_path = Path(f"mock_emails/{email}.txt")
-    with otp_file_path.open("r") as otp_file:
-        otp_code = otp_file.read().strip()
+    otp_code = read_mock_email(email)
     time.sleep(30)
 
     # act
@@ -199,9 +206,7 @@ def test_logged_in_successfully_returns_200(
     user_id = r.json()["user_id"]
 
     email = data["email"]
-    otp_file_path = Path(f"mock_emails/{email}.txt")
-    with otp_file_path.open("r") as otp_file:
-        otp_code = otp_file.read().strip()
+    otp_code = read_mock_email(email)
 
     r = client.patch(f"/user/{user_id}/verify-enable-2fa", json={"otp_code": otp_code})
 
@@ -270,9 +275,7 @@ def test_get_user_successfully_returns_200(
     user_id = r.json()["user_id"]
 
     email = data["email"]
-    otp_file_path = Path(f"mock_emails/{email}.txt")
-    with otp_file_path.open("r") as otp_file:
-        otp_code = otp_file.read().strip()
+    otp_code = read_mock_email(email)
 
     r = client.patch(f"/user/{user_id}/verify-enable-2fa", json={"otp_code": otp_code})
     r = client.post(
@@ -305,9 +308,7 @@ def test_get_user_missing_token_returns_401(
     user_id = r.json()["user_id"]
 
     email = data["email"]
-    otp_file_path = Path(f"mock_emails/{email}.txt")
-    with otp_file_path.open("r") as otp_file:
-        otp_code = otp_file.read().strip()
+    otp_code = read_mock_email(email)
 
     r = client.patch(f"/user/{user_id}/verify-enable-2fa", json={"otp_code": otp_code})
     r = client.post(
@@ -337,9 +338,7 @@ def test_get_user_invalid_token_returns_401(
     user_id = r.json()["user_id"]
 
     email = data["email"]
-    otp_file_path = Path(f"mock_emails/{email}.txt")
-    with otp_file_path.open("r") as otp_file:
-        otp_code = otp_file.read().strip()
+    otp_code = read_mock_email(email)
 
     r = client.patch(f"/user/{user_id}/verify-enable-2fa", json={"otp_code": otp_code})
     r = client.post(
@@ -377,9 +376,7 @@ def test_get_user_unmatching_user_id_returns_401(
     user_id = r.json()["user_id"]
 
     email = data["email"]
-    otp_file_path = Path(f"mock_emails/{email}.txt")
-    with otp_file_path.open("r") as otp_file:
-        otp_code = otp_file.read().strip()
+    otp_code = read_mock_email(email)
 
     r = client.patch(f"/user/{user_id}/verify-enable-2fa", json={"otp_code": otp_code})
 
@@ -389,9 +386,7 @@ def test_get_user_unmatching_user_id_returns_401(
     )
     user2_id = r.json()["user_id"]
     email = data2["email"]
-    otp_file_path = Path(f"mock_emails/{email}.txt")
-    with otp_file_path.open("r") as otp_file:
-        otp_code = otp_file.read().strip()
+    otp_code = read_mock_email(email)
 
     r = client.patch(f"/user/{user2_id}/verify-enable-2fa", json={"otp_code": otp_code})
 
@@ -426,9 +421,7 @@ def test_reset_password_successfully_returns_200(
     )
 
     email = data["email"]
-    new_password_file_path = Path(f"mock_emails/{email}.txt")
-    with new_password_file_path.open("r") as new_password_file:
-        new_password = new_password_file.read().strip()
+    new_password = read_mock_email(email)
 
     # assert
     print(r.__dict__)
@@ -504,9 +497,7 @@ def test_add_friend_successfully_returns_201(
     user_id = r.json()["user_id"]
 
     email = data["email"]
-    otp_file_path = Path(f"mock_emails/{email}.txt")
-    with otp_file_path.open("r") as otp_file:
-        otp_code = otp_file.read().strip()
+    otp_code = read_mock_email(email)
 
     r = client.patch(f"/user/{user_id}/verify-enable-2fa", json={"otp_code": otp_code})
     r = client.post(
@@ -548,9 +539,7 @@ def test_get_friend_requests_successfully_returns_200(
     user_id = r.json()["user_id"]
 
     email = data["email"]
-    otp_file_path = Path(f"mock_emails/{email}.txt")
-    with otp_file_path.open("r") as otp_file:
-        otp_code = otp_file.read().strip()
+    otp_code = read_mock_email(email)
 
     r = client.patch(f"/user/{user_id}/verify-enable-2fa", json={"otp_code": otp_code})
     r = client.post(
@@ -567,9 +556,7 @@ def test_get_friend_requests_successfully_returns_200(
     user2_id = r.json()["user_id"]
 
     email = data2["email"]
-    otp_file_path = Path(f"mock_emails/{email}.txt")
-    with otp_file_path.open("r") as otp_file:
-        otp_code = otp_file.read().strip()
+    otp_code = read_mock_email(email)
 
     r = client.patch(f"/user/{user2_id}/verify-enable-2fa", json={"otp_code": otp_code})
     r = client.post(
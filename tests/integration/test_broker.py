@@ -0,0 +1,136 @@
+import asyncio
+
+from user_service.adapters import broker
+from user_service.domains import events
+
+
+class FakeRedis:
+    """Just enough of the Redis stream commands for RedisBroker."""
+
+    def __init__(self):
+        self.entries = []
+        self.delivered = 0
+        self.pending = {}
+        self.acked = set()
+
+    async def xgroup_create(self, stream, group, id="0", mkstream=False):
+        pass
+
+    async def xadd(self, stream, fields):
+        entry_id = f"{len(self.entries)}-0"
+        self.entries.append((entry_id, dict(fields)))
+        return entry_id
+
+    async def xreadgroup(self, group, consumer, streams, count=1, block=None):
+        if self.delivered >= len(self.entries):
+            return []
+        entry = self.entries[self.delivered]
+        self.delivered += 1
+        self.pending[entry[0]] = {"consumer": consumer, "times_delivered": 1}
+        return [(list(streams)[0], [entry])]
+
+    async def xautoclaim(
+        self, stream, group, consumer, min_idle_time, start_id="0-0", count=None
+    ):
+        for entry_id, fields in self.entries:
+            if entry_id in self.pending:
+                self.pending[entry_id]["consumer"] = consumer
+                self.pending[entry_id]["times_delivered"] += 1
+                return ["0-0", [(entry_id, fields)], []]
+        return ["0-0", [], []]
+
+    async def xpending_range(self, stream, group, min, max, count):
+        return [{"message_id": min, **self.pending[min]}]
+
+    async def xack(self, stream, group, entry_id):
+        self.pending.pop(entry_id, None)
+        self.acked.add(entry_id)
+
+
+def accepted(friend_request_id):
+    return events.AcceptedFriendRequestEvent(friend_request_id=friend_request_id)
+
+
+def test_sqlite_broker_redelivers_nacked_events_and_deletes_acked(tmp_path):
+    path = str(tmp_path / "events.db")
+    publisher = broker.SqliteBroker(path, poll_interval=0.01)
+    consumer = broker.SqliteBroker(path, poll_interval=0.01)
+    event = accepted("a")
+
+    async def run():
+        await publisher.publish(event)
+        first = await consumer.consume()
+        await consumer.nack(first)
+        second = await consumer.consume()
+        await consumer.ack(second)
+        empty = await asyncio.to_thread(consumer._claim)
+        await publisher.close()
+        await consumer.close()
+        return first, second, empty
+
+    first, second, empty = asyncio.run(run())
+
+    assert first.event.friend_request_id == "a"
+    assert first.event._id == event._id
+    assert (first.attempts, second.attempts) == (1, 2)
+    assert empty is None
+
+
+def test_sqlite_broker_hides_claimed_events_from_other_consumers(tmp_path):
+    path = str(tmp_path / "events.db")
+    first_consumer = broker.SqliteBroker(path)
+    second_consumer = broker.SqliteBroker(path)
+
+    async def run():
+        await first_consumer.publish(accepted("a"))
+        await first_consumer.consume()
+        return await asyncio.to_thread(second_consumer._claim)
+
+    assert asyncio.run(run()) is None
+
+
+def test_redis_broker_round_trips_events_through_a_stream():
+    client = FakeRedis()
+    redis_broker = broker.RedisBroker(client, claim_idle_ms=60000)
+    event = accepted("a")
+
+    async def run():
+        await redis_broker.publish(event)
+        first = await redis_broker.consume()
+        await redis_broker.nack(first)
+        second = await redis_broker.consume()
+        await redis_broker.ack(second)
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert first.event._id == event._id
+    assert second.attempts == 2
+    assert client.acked == {"0-0", "1-0"}
+
+
+def test_redis_broker_claims_entries_left_pending_by_a_dead_consumer():
+    client = FakeRedis()
+    dead = broker.RedisBroker(client, consumer="dead", claim_idle_ms=60000)
+    alive = broker.RedisBroker(client, consumer="alive", claim_idle_ms=0)
+    event = accepted("a")
+
+    async def run():
+        await dead.publish(event)
+        await dead.consume()
+        claimed = await alive.consume()
+        await alive.ack(claimed)
+        return claimed
+
+    claimed = asyncio.run(run())
+
+    assert claimed.event._id == event._id
+    assert claimed.attempts == 2
+    assert client.pending == {}
+
+
+def test_from_url_builds_brokers(tmp_path):
+    assert isinstance(broker.from_url("memory://"), broker.InMemoryBroker)
+    sqlite_broker = broker.from_url(f"sqlite:///{tmp_path / 'events.db'}")
+    assert isinstance(sqlite_broker, broker.SqliteBroker)
+    asyncio.run(sqlite_broker.close())
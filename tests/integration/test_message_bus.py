@@ -0,0 +1,506 @@
+import asyncio
+import functools
+from datetime import datetime, timedelta
+
+import pytest
+from passlib.context import CryptContext
+from sqlalchemy import event
+from sqlalchemy.dialects import mysql
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from user_service import bootstrap, views
+from user_service.adapters import password_hasher, rate_limiter
+from user_service.domains import commands, events, models
+from user_service.service_layer import message_bus, unit_of_work
+from user_service.service_layer.handlers import async_event, command
+from tests import random_refs
+
+
+def register_command(username=None, email=None):
+    return commands.RegisterCommand(
+        username=username or random_refs.random_username(),
+        email=email or random_refs.random_email(),
+        password=random_refs.random_valid_password(),
+        first_name=None,
+        last_name=None,
+        backup_email=None,
+        gender=None,
+        date_of_birth=None,
+    )
+
+
+@pytest.fixture
+def bus(mappers, aiosqlite_session_factory):
+    hasher = password_hasher.PasswordHasher(
+        CryptContext(schemes=["bcrypt"], bcrypt__rounds=4), max_workers=2
+    )
+    yield bootstrap.bootstrap(
+        start_orm=False,
+        uow=unit_of_work.AsyncSqlAlchemyUnitOfWork(aiosqlite_session_factory),
+        hasher=hasher,
+        use_async=True,
+    )
+    hasher.shutdown()
+
+
+def test_handle_many_registers_in_one_batch_and_reports_per_item(bus):
+    existing = register_command()
+    duplicate_email = register_command(email=existing.email)
+    new_commands = [register_command() for _ in range(3)]
+
+    async def run():
+        await bus.handle(existing)
+        results = await bus.handle_many([*new_commands, duplicate_email])
+        async with bus.uow:
+            users = await bus.uow.repo.get(models.User)
+            profiles = await bus.uow.repo.get(models.Profile)
+            return results, len(users), len(profiles)
+
+    results, user_count, profile_count = asyncio.run(run())
+
+    assert results[:3] == [None, None, None]
+    assert isinstance(results[3], command.EmailExisted)
+    assert user_count == 4
+    assert profile_count == 4
+
+
+def test_handle_many_logs_events_whose_handlers_failed(bus, caplog):
+    async def fail(*args):
+        raise RuntimeError("handler failed")
+
+    failing = message_bus.DispatchTable({events.RegisteredEvent: [fail]})
+    bus.event_handlers = bus.batch_event_handlers = failing
+
+    results = asyncio.run(bus.handle_many([register_command()]))
+
+    assert results == [None]
+    assert "Handlers failed for 1 events raised by a batch" in caplog.text
+
+
+def test_handle_many_rejects_duplicates_within_the_batch(bus):
+    cmd = register_command()
+    same_username = register_command(username=cmd.username)
+    friend_request = commands.FriendRequestCommand(
+        sender_id="sender", receiver_id="receiver"
+    )
+
+    results = asyncio.run(
+        bus.handle_many([cmd, friend_request, same_username, friend_request])
+    )
+
+    assert results[0] is None
+    assert results[1] is None
+    assert isinstance(results[2], command.UsernameExisted)
+    assert isinstance(results[3], command.FriendRequestExisted)
+
+
+def add_friend_request(uow):
+    async def run():
+        async with uow:
+            for user_id in ("sender", "receiver"):
+                uow.repo.add(models.Profile("message-id", user_id))
+            friend_request = models.FriendRequest("message-id", "sender", "receiver")
+            uow.repo.add(friend_request)
+            await uow.commit()
+            return friend_request.id
+
+    return run()
+
+
+async def count_rows(uow, model_type):
+    async with uow:
+        return len(await uow.repo.get(model_type))
+
+
+def test_accepted_friend_request_handlers_share_one_transaction(bus):
+    async def run():
+        friend_request_id = await add_friend_request(bus.uow)
+        await bus.handle(
+            events.AcceptedFriendRequestEvent(friend_request_id=friend_request_id)
+        )
+        async with bus.uow:
+            profiles = await bus.uow.repo.get(models.Profile)
+            friend_counts = [profile.friends for profile in profiles]
+        return (
+            await count_rows(bus.uow, models.Friend),
+            await count_rows(bus.uow, models.FriendRequest),
+            friend_counts,
+        )
+
+    friends, friend_requests, friend_counts = asyncio.run(run())
+
+    assert friends == 1
+    assert friend_requests == 0
+    assert friend_counts == [1, 1]
+
+
+def test_redelivered_accepted_friend_request_counts_friends_once(bus):
+    async def run():
+        friend_request_id = await add_friend_request(bus.uow)
+        event = events.AcceptedFriendRequestEvent(friend_request_id=friend_request_id)
+        await bus.handle_delivered(event)
+        await bus.handle_delivered(event)
+        async with bus.uow:
+            profiles = await bus.uow.repo.get(models.Profile)
+            friend_counts = [profile.friends for profile in profiles]
+        return await count_rows(bus.uow, models.Friend), friend_counts
+
+    friends, friend_counts = asyncio.run(run())
+
+    assert friends == 1
+    assert friend_counts == [1, 1]
+
+
+def test_shared_transaction_rolls_back_every_handler(
+    mappers, aiosqlite_session_factory
+):
+    uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(aiosqlite_session_factory)
+
+    async def fail(event):
+        raise RuntimeError("handler failed")
+
+    bus = message_bus.AsyncMessageBus(
+        uow=uow,
+        event_handlers={
+            events.AcceptedFriendRequestEvent: [
+                functools.partial(async_event.add_to_friend_list, uow=uow),
+                fail,
+            ]
+        },
+        command_handlers={},
+        shared_transaction_events=async_event.SHARED_TRANSACTION_EVENTS,
+    )
+
+    async def run():
+        friend_request_id = await add_friend_request(uow)
+        await bus.handle(
+            events.AcceptedFriendRequestEvent(friend_request_id=friend_request_id)
+        )
+        return await count_rows(uow, models.Friend)
+
+    assert asyncio.run(run()) == 0
+
+
+def test_register_reports_which_field_already_exists(bus):
+    existing = register_command()
+
+    async def run():
+        await bus.handle(existing)
+        with pytest.raises(command.EmailExisted):
+            await bus.handle(register_command(email=existing.email))
+        with pytest.raises(command.UsernameExisted):
+            await bus.handle(register_command(username=existing.username))
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize(
+    "message, error_type",
+    [
+        ("UNIQUE constraint failed: users.email", command.EmailExisted),
+        (
+            "(1062, \"Duplicate entry 'email' for key 'users.username'\")",
+            command.UsernameExisted,
+        ),
+        ("UNIQUE constraint failed: users.secret_token", IntegrityError),
+    ],
+)
+def test_register_translates_unique_violations_from_a_race(message, error_type):
+    error = IntegrityError("INSERT INTO users", {}, Exception(message))
+    assert isinstance(
+        command.translate_user_integrity_error(register_command(), error), error_type
+    )
+
+
+def test_login_returns_the_principal_by_username_or_email(bus):
+    cmd = register_command()
+
+    async def run():
+        await bus.handle(cmd)
+        with pytest.raises(command.TwoFactorAuthNotEnabled):
+            await bus.handle(
+                commands.LoginCommand(username=cmd.username, password=cmd.password)
+            )
+
+        async with bus.uow:
+            user = await bus.uow.repo.get_one(models.User, username=cmd.username)
+            user.enable_two_factor_auth()
+            await bus.uow.commit()
+
+        for name in (cmd.username, cmd.email):
+            principal = await bus.handle(
+                commands.LoginCommand(username=name, password=cmd.password)
+            )
+            assert principal.pop("refresh_token")
+            assert principal == {
+                "id": user.id,
+                "two_factor_auth_enabled": True,
+                "locked": False,
+                "token_version": 0,
+            }
+
+        with pytest.raises(command.IncorrectCredentials):
+            await bus.handle(
+                commands.LoginCommand(username=cmd.email, password="wrong password")
+            )
+
+    asyncio.run(run())
+
+
+def test_login_locks_the_user_after_repeated_failures(
+    mappers, aiosqlite_session_factory
+):
+    hasher = password_hasher.PasswordHasher(
+        CryptContext(schemes=["bcrypt"], bcrypt__rounds=4), max_workers=2
+    )
+    limiter = rate_limiter.LoginRateLimiter(
+        rate_limiter.InMemoryRateLimitBackend(),
+        max_failures_per_name=10,
+        lock_after_failures=2,
+    )
+    bus = bootstrap.bootstrap(
+        start_orm=False,
+        uow=unit_of_work.AsyncSqlAlchemyUnitOfWork(aiosqlite_session_factory),
+        hasher=hasher,
+        login_limiter=limiter,
+        use_async=True,
+    )
+    cmd = register_command()
+
+    def login(password):
+        return bus.handle(
+            commands.LoginCommand(username=cmd.username, password=password)
+        )
+
+    async def run():
+        await bus.handle(cmd)
+        for _ in range(2):
+            with pytest.raises(command.IncorrectCredentials):
+                await login("wrong password")
+
+        with pytest.raises(command.IncorrectCredentials):
+            await login("wrong password")
+        with pytest.raises(command.AccountLocked):
+            await login(cmd.password)
+        async with bus.uow:
+            user = await bus.uow.repo.get_one(models.User, username=cmd.username)
+            assert user.locked
+            assert user.token_version == 1
+
+    asyncio.run(run())
+    hasher.shutdown()
+
+
+def test_login_rehashes_passwords_below_the_hash_policy(
+    mappers, aiosqlite_session_factory
+):
+    uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(aiosqlite_session_factory)
+    hasher = password_hasher.PasswordHasher(
+        CryptContext(schemes=["bcrypt"], bcrypt__rounds=4), max_workers=1
+    )
+    stronger_hasher = password_hasher.PasswordHasher(
+        CryptContext(
+            schemes=["bcrypt"], bcrypt__default_rounds=5, bcrypt__min_rounds=5
+        ),
+        max_workers=1,
+    )
+    cmd = register_command()
+
+    async def password_hash():
+        async with uow:
+            user = await uow.repo.get_one(models.User, username=cmd.username)
+            return user.password
+
+    async def run():
+        await bootstrap.bootstrap(
+            start_orm=False, uow=uow, hasher=hasher, use_async=True
+        ).handle(cmd)
+        assert (await password_hash()).startswith("$2b$04$")
+
+        bus = bootstrap.bootstrap(
+            start_orm=False, uow=uow, hasher=stronger_hasher, use_async=True
+        )
+        with pytest.raises(command.TwoFactorAuthNotEnabled):
+            await bus.handle(
+                commands.LoginCommand(username=cmd.username, password=cmd.password)
+            )
+        assert (await password_hash()).startswith("$2b$05$")
+
+    asyncio.run(run())
+    hasher.shutdown()
+    stronger_hasher.shutdown()
+
+
+async def register_and_enable_two_factor_auth(bus, cmd):
+    await bus.handle(cmd)
+    async with bus.uow:
+        user = await bus.uow.repo.get_one(models.User, username=cmd.username)
+        user.enable_two_factor_auth()
+        await bus.uow.commit()
+        return user.id
+
+
+def test_refresh_tokens_rotate_and_a_replayed_token_ends_the_session(bus):
+    cmd = register_command()
+
+    async def refresh(refresh_token):
+        return await bus.handle(
+            commands.RefreshAccessTokenCommand(refresh_token=refresh_token)
+        )
+
+    async def run():
+        user_id = await register_and_enable_two_factor_auth(bus, cmd)
+        login = await bus.handle(
+            commands.LoginCommand(
+                username=cmd.username, password=cmd.password, device="phone"
+            )
+        )
+
+        refreshed = await refresh(login["refresh_token"])
+        assert refreshed["id"] == user_id
+        assert refreshed["refresh_token"] != login["refresh_token"]
+        sessions = await views.fetch_sessions(bus.uow, user_id, token_version=0)
+        assert [session["device"] for session in sessions] == ["phone"]
+
+        with pytest.raises(command.InvalidRefreshToken):
+            await refresh(login["refresh_token"])
+        with pytest.raises(command.InvalidRefreshToken):
+            await refresh(refreshed["refresh_token"])
+        assert await views.fetch_sessions(bus.uow, user_id, token_version=0) == []
+
+    asyncio.run(run())
+
+
+def test_revoking_tokens_ends_sessions(bus):
+    cmd = register_command()
+
+    async def run():
+        user_id = await register_and_enable_two_factor_auth(bus, cmd)
+        logins = [
+            await bus.handle(
+                commands.LoginCommand(username=cmd.username, password=cmd.password)
+            )
+            for _ in range(2)
+        ]
+        session_id = logins[0]["refresh_token"].partition(".")[0]
+
+        with pytest.raises(command.SessionNotFound):
+            await bus.handle(
+                commands.RevokeSessionCommand(user_id="someone", session_id=session_id)
+            )
+        await bus.handle(
+            commands.RevokeSessionCommand(user_id=user_id, session_id=session_id)
+        )
+        with pytest.raises(command.InvalidRefreshToken):
+            await bus.handle(
+                commands.RefreshAccessTokenCommand(
+                    refresh_token=logins[0]["refresh_token"]
+                )
+            )
+
+        async with bus.uow:
+            user = await bus.uow.repo.get_by_id(models.User, user_id)
+            user.revoke_tokens()
+            await bus.uow.commit()
+        with pytest.raises(command.InvalidRefreshToken):
+            await bus.handle(
+                commands.RefreshAccessTokenCommand(
+                    refresh_token=logins[1]["refresh_token"]
+                )
+            )
+
+    asyncio.run(run())
+
+
+def test_refresh_locks_the_session_row(bus):
+    cmd = register_command()
+    statements = []
+
+    def record(state):
+        if state.is_select:
+            statements.append(str(state.statement.compile(dialect=mysql.dialect())))
+
+    async def run():
+        await register_and_enable_two_factor_auth(bus, cmd)
+        login = await bus.handle(
+            commands.LoginCommand(username=cmd.username, password=cmd.password)
+        )
+        event.listen(Session, "do_orm_execute", record)
+        try:
+            await bus.handle(
+                commands.RefreshAccessTokenCommand(refresh_token=login["refresh_token"])
+            )
+        finally:
+            event.remove(Session, "do_orm_execute", record)
+
+    asyncio.run(run())
+
+    assert "FROM refresh_tokens" in statements[0]
+    assert statements[0].endswith("FOR UPDATE")
+
+
+def test_login_purges_sessions_that_can_no_longer_be_refreshed(bus):
+    cmd = register_command()
+
+    async def login():
+        principal = await bus.handle(
+            commands.LoginCommand(username=cmd.username, password=cmd.password)
+        )
+        return principal["refresh_token"].partition(".")[0]
+
+    async def session_ids(user_id):
+        async with bus.uow:
+            sessions = await bus.uow.repo.get(models.RefreshToken, user_id=user_id)
+            return {session.id for session in sessions}
+
+    async def run():
+        user_id = await register_and_enable_two_factor_auth(bus, cmd)
+        expired_id, live_id = await login(), await login()
+        async with bus.uow:
+            expired = await bus.uow.repo.get_by_id(models.RefreshToken, expired_id)
+            expired.expires_time = datetime.now() - timedelta(seconds=1)
+            await bus.uow.commit()
+
+        third_id = await login()
+        assert await session_ids(user_id) == {live_id, third_id}
+
+        async with bus.uow:
+            user = await bus.uow.repo.get_by_id(models.User, user_id)
+            user.revoke_tokens()
+            await bus.uow.commit()
+
+        fourth_id = await login()
+        assert await session_ids(user_id) == {fourth_id}
+
+    asyncio.run(run())
+
+
+def test_passwords_are_hashed_outside_the_unit_of_work(
+    mappers, aiosqlite_session_factory
+):
+    uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(aiosqlite_session_factory)
+    in_transaction = []
+
+    class RecordingHasher(password_hasher.PasswordHasher):
+        async def hash(self, secret):
+            in_transaction.append(uow.session.in_transaction())
+            return await super().hash(secret)
+
+    hasher = RecordingHasher(
+        CryptContext(schemes=["bcrypt"], bcrypt__rounds=4), max_workers=1
+    )
+    bus = bootstrap.bootstrap(start_orm=False, uow=uow, hasher=hasher, use_async=True)
+    cmd = register_command()
+
+    async def run():
+        await bus.handle(cmd)
+        await bus.handle(
+            commands.ResetPasswordCommand(email=cmd.email, username=cmd.username)
+        )
+        await bus.handle_many([register_command()])
+
+    asyncio.run(run())
+    hasher.shutdown()
+
+    assert in_transaction == [False, False, False]
@@ -0,0 +1,39 @@
+from sqlalchemy import create_engine, inspect
+
+from user_service.adapters import orm
+
+
+def test_create_missing_indexes_adds_indexes_to_existing_tables():
+    engine = create_engine("sqlite://")
+    orm.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for table in (orm.friends, orm.friend_requests):
+            for index in table.indexes:
+                index.drop(conn)
+
+    with engine.begin() as conn:
+        orm.create_missing_indexes(conn)
+
+    inspector = inspect(engine)
+    for table in (orm.friends, orm.friend_requests):
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        assert {index.name for index in table.indexes} <= existing
+
+
+def test_create_missing_columns_adds_columns_to_existing_tables():
+    engine = create_engine("sqlite://")
+    orm.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "INSERT INTO users (id, username, email) VALUES ('user-id', 'name', 'mail')"
+        )
+        conn.exec_driver_sql("ALTER TABLE users DROP COLUMN token_version")
+
+    with engine.begin() as conn:
+        orm.create_missing_columns(conn)
+
+    with engine.connect() as conn:
+        token_version = conn.exec_driver_sql(
+            "SELECT token_version FROM users WHERE id = 'user-id'"
+        ).scalar_one()
+    assert token_version == 0
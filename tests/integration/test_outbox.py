@@ -0,0 +1,201 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+from user_service import bootstrap
+from user_service.adapters import orm, outbox
+from user_service.domains import events, models
+from user_service.service_layer import message_bus, outbox_relay, unit_of_work
+from user_service.service_layer.handlers import async_event
+
+
+def add_user_with_event(uow, commit=True):
+    async def run():
+        async with uow:
+            user = models.User(
+                "message-id", "username", "email", "hashed-password", "secret-token"
+            )
+            user.events.append(
+                events.RegisteredEvent(
+                    user_id=user.id,
+                    first_name="first",
+                    last_name=None,
+                    backup_email=None,
+                    gender=None,
+                    date_of_birth=None,
+                )
+            )
+            uow.repo.add(user)
+            if commit:
+                await uow.commit()
+            return user.id
+
+    return run()
+
+
+async def outbox_rows(session_factory):
+    async with session_factory() as session:
+        return (await session.execute(select(orm.outbox))).all()
+
+
+@pytest.mark.usefixtures("mappers")
+def test_events_are_written_to_outbox_in_the_same_transaction(
+    aiosqlite_session_factory,
+):
+    uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(
+        aiosqlite_session_factory, use_outbox=True
+    )
+    notified = []
+    uow.outbox_listeners.append(lambda: notified.append(True))
+
+    async def run():
+        await add_user_with_event(uow, commit=False)
+        rolled_back = await outbox_rows(aiosqlite_session_factory)
+        await add_user_with_event(uow)
+        return rolled_back, await outbox_rows(aiosqlite_session_factory)
+
+    rolled_back, rows = asyncio.run(run())
+
+    assert rolled_back == []
+    assert [row.event_type for row in rows] == ["RegisteredEvent"]
+    assert notified == [True]
+
+
+@pytest.mark.usefixtures("mappers")
+def test_relay_dispatches_outbox_events_and_removes_them(aiosqlite_session_factory):
+    uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(
+        aiosqlite_session_factory, use_outbox=True
+    )
+    bus = bootstrap.bootstrap(start_orm=False, uow=uow, use_async=True)
+    relay = outbox_relay.OutboxRelay(aiosqlite_session_factory, bus, batch_size=10)
+
+    async def run():
+        user_id = await add_user_with_event(uow)
+        relayed = await relay.drain()
+        async with uow:
+            profiles = await uow.repo.get(models.Profile, user_id=user_id)
+            first_names = [profile.first_name for profile in profiles]
+        return relayed, first_names, await outbox_rows(aiosqlite_session_factory)
+
+    relayed, first_names, rows = asyncio.run(run())
+
+    assert relayed == 1
+    assert first_names == ["first"]
+    assert rows == []
+
+
+@pytest.mark.usefixtures("mappers")
+def test_relay_keeps_events_whose_handlers_failed_and_retries_them(
+    aiosqlite_session_factory,
+):
+    uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(
+        aiosqlite_session_factory, use_outbox=True
+    )
+    failures = [RuntimeError("database went away")]
+
+    async def flaky_create_user_profile(event, uow):
+        if failures:
+            raise failures.pop()
+        await async_event.create_user_profile(event, uow)
+
+    bus = message_bus.AsyncMessageBus(
+        uow=uow,
+        event_handlers={
+            events.RegisteredEvent: [
+                bootstrap.inject_dependencies(flaky_create_user_profile, {"uow": uow})
+            ]
+        },
+        command_handlers={},
+    )
+    relay = outbox_relay.OutboxRelay(aiosqlite_session_factory, bus, batch_size=10)
+
+    async def run():
+        user_id = await add_user_with_event(uow)
+        first_drain = await relay.drain()
+        kept = await outbox_rows(aiosqlite_session_factory)
+        second_drain = await relay.drain()
+        async with uow:
+            profiles = await uow.repo.get(models.Profile, user_id=user_id)
+        return (
+            first_drain,
+            kept,
+            second_drain,
+            len(profiles),
+            await outbox_rows(aiosqlite_session_factory),
+        )
+
+    first_drain, kept, second_drain, profiles, rows = asyncio.run(run())
+
+    assert first_drain == 0
+    assert [row.attempts for row in kept] == [1]
+    assert second_drain == 1
+    assert profiles == 1
+    assert rows == []
+
+
+@pytest.mark.usefixtures("mappers")
+def test_relay_stops_claiming_events_after_max_attempts(aiosqlite_session_factory):
+    uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(
+        aiosqlite_session_factory, use_outbox=True
+    )
+
+    async def failing_handler(event):
+        raise RuntimeError("handler failed")
+
+    bus = message_bus.AsyncMessageBus(
+        uow=uow,
+        event_handlers={events.RegisteredEvent: [failing_handler]},
+        command_handlers={},
+    )
+    relay = outbox_relay.OutboxRelay(
+        aiosqlite_session_factory, bus, batch_size=10, max_attempts=2
+    )
+
+    async def run():
+        await add_user_with_event(uow)
+        for _ in range(3):
+            await relay.drain()
+        return await outbox_rows(aiosqlite_session_factory)
+
+    rows = asyncio.run(run())
+
+    assert [row.attempts for row in rows] == [2]
+
+
+@pytest.mark.usefixtures("mappers")
+def test_redelivered_registered_event_does_not_add_another_profile(
+    aiosqlite_session_factory, monkeypatch
+):
+    uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(
+        aiosqlite_session_factory, use_outbox=True
+    )
+    bus = bootstrap.bootstrap(start_orm=False, uow=uow, use_async=True)
+    relay = outbox_relay.OutboxRelay(aiosqlite_session_factory, bus, batch_size=10)
+    remove = outbox.remove
+
+    async def fail_once(session, claimed_events):
+        monkeypatch.setattr(outbox, "remove", remove)
+        raise RuntimeError("relay died after the handlers committed")
+
+    monkeypatch.setattr(outbox, "remove", fail_once)
+
+    async def run():
+        user_id = await add_user_with_event(uow)
+        with pytest.raises(RuntimeError):
+            await relay.relay_batch()
+        redelivered = await outbox_rows(aiosqlite_session_factory)
+        await relay.relay_batch()
+        async with uow:
+            profiles = await uow.repo.get(models.Profile, user_id=user_id)
+        return (
+            len(redelivered),
+            len(profiles),
+            await outbox_rows(aiosqlite_session_factory),
+        )
+
+    redelivered, profiles, rows = asyncio.run(run())
+
+    assert redelivered == 1
+    assert profiles == 1
+    assert rows == []
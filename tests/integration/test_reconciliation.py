@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+from sqlalchemy import insert
+
+from user_service.adapters import orm
+from user_service.domains import models
+from user_service.service_layer import reconciliation, unit_of_work
+
+
+def add_profiles(uow, user_ids):
+    async def run():
+        async with uow:
+            for user_id in user_ids:
+                uow.repo.add(models.Profile("message-id", user_id))
+            await uow.commit()
+
+    return run()
+
+
+async def friend_counts(uow):
+    async with uow:
+        profiles = await uow.repo.get(models.Profile)
+        return {profile.user_id: profile.friends for profile in profiles}
+
+
+@pytest.mark.usefixtures("mappers")
+def test_increment_updates_matching_rows_in_the_database(aiosqlite_session_factory):
+    uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(aiosqlite_session_factory)
+
+    async def increment(user_ids):
+        async with uow:
+            await uow.repo.increment(models.Profile, "friends", user_id=user_ids)
+            await uow.commit()
+
+    async def run():
+        await add_profiles(uow, ["a", "b", "c"])
+        await asyncio.gather(increment(["a", "b"]), increment(["a"]))
+        return await friend_counts(uow)
+
+    assert asyncio.run(run()) == {"a": 2, "b": 1, "c": 0}
+
+
+@pytest.mark.usefixtures("mappers")
+def test_reconcile_friend_counts_recomputes_from_friends(aiosqlite_session_factory):
+    uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(aiosqlite_session_factory)
+
+    async def run():
+        await add_profiles(uow, ["a", "b", "c"])
+        async with uow:
+            await uow.repo.increment(models.Profile, "friends", amount=5, user_id="c")
+            await uow.session.execute(
+                insert(orm.friends),
+                [
+                    {"id": "1", "sender_id": "a", "receiver_id": "b"},
+                    {"id": "2", "sender_id": "c", "receiver_id": "a"},
+                ],
+            )
+            await uow.commit()
+
+        visited = await reconciliation.reconcile_friend_counts(uow, batch_size=2)
+        return visited, await friend_counts(uow)
+
+    visited, counts = asyncio.run(run())
+
+    assert visited == 3
+    assert counts == {"a": 2, "b": 1, "c": 1}
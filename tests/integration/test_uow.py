@@ -1,2 +1,130 @@
+import asyncio
+import concurrent.futures
+import threading
+
 import pytest
 from user_service.domains import models
+from user_service.service_layer import unit_of_work
+from tests import random_refs
+
+
+def insert_user(uow):
+    async def run():
+        async with uow:
+            user = models.User(
+                "message-id",
+                random_refs.random_username(),
+                random_refs.random_email(),
+                "hashed-password",
+                "secret-token",
+            )
+            uow.repo.add(user)
+            await uow.commit()
+            return user.id
+
+    return run()
+
+
+@pytest.mark.usefixtures("mappers")
+def test_async_uow_commits_work(aiosqlite_session_factory):
+    uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(aiosqlite_session_factory)
+
+    async def run():
+        user_id = await insert_user(uow)
+        async with uow:
+            users = await uow.repo.get(models.User, id=user_id)
+            return user_id, [user.id for user in users]
+
+    user_id, user_ids = asyncio.run(run())
+    assert user_ids == [user_id]
+
+
+@pytest.mark.usefixtures("mappers")
+def test_async_uow_rolls_back_uncommitted_work(aiosqlite_session_factory):
+    uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(aiosqlite_session_factory)
+
+    async def run():
+        async with uow:
+            uow.repo.add(models.User("message-id", "name", "mail", "pw", "token"))
+
+        async with uow:
+            return await uow.repo.get(models.User, username="name")
+
+    assert asyncio.run(run()) == []
+
+
+@pytest.mark.usefixtures("mappers")
+def test_async_uow_isolates_concurrent_tasks(aiosqlite_session_factory):
+    uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(aiosqlite_session_factory)
+
+    async def open_session():
+        async with uow:
+            session = uow.session
+            await asyncio.sleep(0)
+            assert uow.session is session
+            return session
+
+    async def run():
+        return await asyncio.gather(open_session(), open_session())
+
+    first, second = asyncio.run(run())
+    assert first is not second
+
+
+@pytest.mark.usefixtures("mappers")
+def test_sync_uow_isolates_concurrent_threads(sqlite_session_factory):
+    uow = unit_of_work.SqlAlchemyUnitOfWork(sqlite_session_factory)
+    both_open = threading.Barrier(2)
+
+    def open_session():
+        with uow:
+            session = uow.session
+            both_open.wait()
+            with uow:
+                assert uow.session is session
+            assert uow.session is session
+            return session
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        first, second = executor.map(lambda _: open_session(), range(2))
+
+    assert first is not second
+    assert uow.session is None
+
+
+@pytest.mark.usefixtures("mappers")
+def test_nested_async_uow_joins_the_outer_transaction(aiosqlite_session_factory):
+    uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(aiosqlite_session_factory)
+
+    async def run():
+        async with uow:
+            outer_session = uow.session
+            async with uow:
+                assert uow.session is outer_session
+                uow.repo.add(models.User("message-id", "name", "mail", "pw", "token"))
+                await uow.commit()
+
+        async with uow:
+            return await uow.repo.get(models.User, username="name")
+
+    assert asyncio.run(run()) == []
+
+
+@pytest.mark.usefixtures("mappers")
+def test_repository_lookups(aiosqlite_session_factory):
+    uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(aiosqlite_session_factory)
+
+    async def run():
+        user_id = await insert_user(uow)
+        async with uow:
+            user = await uow.repo.get_by_id(models.User, user_id)
+            same_user = await uow.repo.get_by_id(models.User, user_id)
+            return (
+                user is same_user,
+                (await uow.repo.get_one(models.User, username=user.username)) is user,
+                await uow.repo.exists(models.User, email=user.email),
+                await uow.repo.exists(models.User, email="missing"),
+                await uow.repo.get_by_id(models.User, "missing"),
+            )
+
+    assert asyncio.run(run()) == (True, True, True, False, None)
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+from sqlalchemy import insert
+
+from user_service import views
+from user_service.adapters import orm
+from user_service.service_layer import unit_of_work
+
+
+def add_friends(session_factory, pairs):
+    async def run():
+        async with session_factory() as session:
+            await session.execute(
+                insert(orm.friends),
+                [
+                    {
+                        "id": f"{sender_id}-{receiver_id}",
+                        "sender_id": sender_id,
+                        "receiver_id": receiver_id,
+                    }
+                    for sender_id, receiver_id in pairs
+                ],
+            )
+            await session.commit()
+
+    asyncio.run(run())
+
+
+def fetch_friend_ids(uow, user_id, **kwargs):
+    return asyncio.run(views.fetch_friend_ids(uow, user_id, **kwargs))
+
+
+@pytest.mark.usefixtures("mappers")
+def test_fetch_friend_ids_pages_through_both_directions(aiosqlite_session_factory):
+    add_friends(
+        aiosqlite_session_factory,
+        [("u", "d"), ("b", "u"), ("u", "a"), ("c", "u"), ("x", "y")],
+    )
+    uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(aiosqlite_session_factory)
+
+    assert fetch_friend_ids(uow, "u") == ["a", "b", "c", "d"]
+    assert fetch_friend_ids(uow, "u", limit=3) == ["a", "b", "c"]
+    assert fetch_friend_ids(uow, "u", after="b", limit=3) == ["c", "d"]
+    assert fetch_friend_ids(uow, "y") == ["x"]
+
+
+@pytest.mark.usefixtures("mappers")
+def test_fetch_user_returns_only_projected_columns(aiosqlite_session_factory):
+    uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(aiosqlite_session_factory)
+
+    async def run():
+        async with aiosqlite_session_factory() as session:
+            await session.execute(
+                insert(orm.users),
+                {
+                    "id": "user-id",
+                    "username": "name",
+                    "email": "mail",
+                    "password": "hashed",
+                    "secret_token": "secret",
+                },
+            )
+            await session.commit()
+        return (
+            await views.fetch_user(uow, username="name"),
+            await views.fetch_principal(uow, "user-id"),
+        )
+
+    user, principal = asyncio.run(run())
+    assert set(user) == set(views.USER_COLUMNS)
+    assert user["id"] == "user-id"
+    assert set(principal) == set(views.PRINCIPAL_COLUMNS)
+    assert "password" not in principal and "email" not in principal
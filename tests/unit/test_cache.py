@@ -0,0 +1,53 @@
+from user_service.adapters import cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_get_returns_cached_value_and_counts_hits_and_misses():
+    principals = cache.TTLCache(maxsize=10, ttl=30)
+
+    assert principals.get("user-id") is None
+    principals.set("user-id", {"id": "user-id", "locked": False})
+
+    assert principals.get("user-id") == {"id": "user-id", "locked": False}
+    assert principals.metrics() == {"size": 1, "hits": 1, "misses": 1}
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    principals = cache.TTLCache(maxsize=10, ttl=30, clock=clock)
+    principals.set("user-id", {"id": "user-id"})
+
+    clock.now = 29
+    assert principals.get("user-id") is not None
+    clock.now = 30
+    assert principals.get("user-id") is None
+    assert len(principals) == 0
+
+
+def test_least_recently_used_entry_is_evicted_first():
+    principals = cache.TTLCache(maxsize=2, ttl=30)
+    principals.set("a", 1)
+    principals.set("b", 2)
+    principals.get("a")
+    principals.set("c", 3)
+
+    assert principals.get("b") is None
+    assert principals.get("a") == 1
+    assert principals.get("c") == 3
+
+
+def test_invalidate_removes_entry():
+    principals = cache.TTLCache(maxsize=10, ttl=30)
+    principals.set("user-id", {"id": "user-id"})
+
+    principals.invalidate("user-id")
+    principals.invalidate("missing-id")
+
+    assert principals.get("user-id") is None
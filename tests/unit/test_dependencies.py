@@ -0,0 +1,75 @@
+from datetime import timedelta
+
+import jwt
+import pytest
+from fastapi import HTTPException
+
+from user_service.adapters import cache, signing_keys
+from user_service.entrypoints.rest import dependencies
+
+PRINCIPAL = {
+    "id": "user-id",
+    "locked": False,
+    "two_factor_auth_enabled": True,
+    "token_version": 3,
+}
+
+KEY_SET = signing_keys.SigningKeySet([signing_keys.SigningKey.generate()])
+
+
+def test_access_tokens_carry_the_principal_claims():
+    token = dependencies.create_access_token(
+        dependencies.principal_claims(PRINCIPAL), KEY_SET
+    )
+    claims = dependencies.decode_access_token(token, cache.TTLCache(10, 900), KEY_SET)
+
+    assert claims["sub"] == "user-id"
+    assert claims["locked"] is False
+    assert claims["2fa"] is True
+    assert claims["ver"] == 3
+
+
+def test_verified_tokens_are_cached_by_digest(monkeypatch):
+    token_cache = cache.TTLCache(10, 900)
+    token = dependencies.create_access_token(
+        dependencies.principal_claims(PRINCIPAL), KEY_SET
+    )
+    decode = jwt.decode
+    decoded = []
+    monkeypatch.setattr(
+        jwt,
+        "decode",
+        lambda *args, **kwargs: decoded.append(1) or decode(*args, **kwargs),
+    )
+
+    first = dependencies.decode_access_token(token, token_cache, KEY_SET)
+    second = dependencies.decode_access_token(token, token_cache, KEY_SET)
+
+    assert first == second
+    assert len(decoded) == 1
+    assert len(token_cache) == 1
+
+
+def test_invalid_and_expired_tokens_are_rejected_and_not_cached():
+    token_cache = cache.TTLCache(10, 900)
+    expired = dependencies.create_access_token(
+        dependencies.principal_claims(PRINCIPAL), KEY_SET, timedelta(seconds=-1)
+    )
+
+    assert dependencies.decode_access_token(expired, token_cache, KEY_SET) is None
+    assert dependencies.decode_access_token("not-a-token", token_cache, KEY_SET) is None
+    assert len(token_cache) == 0
+
+
+def test_batch_partners_need_a_configured_api_key(monkeypatch):
+    monkeypatch.setenv("BATCH_API_KEYS", "partner-key, other-key")
+
+    assert dependencies.get_batch_partner("other-key") == "other-key"
+    for api_key in (None, "", "wrong-key"):
+        with pytest.raises(HTTPException) as e:
+            dependencies.get_batch_partner(api_key)
+        assert e.value.status_code == 401
+
+    monkeypatch.delenv("BATCH_API_KEYS")
+    with pytest.raises(HTTPException):
+        dependencies.get_batch_partner("partner-key")
@@ -0,0 +1,105 @@
+import asyncio
+
+from user_service.domains import commands, events
+from user_service.service_layer import message_bus
+
+
+class FakeUnitOfWork:
+    def __init__(self):
+        self.new_events = []
+
+    def collect_new_events(self):
+        while self.new_events:
+            yield self.new_events.pop(0)
+
+
+class Pinged(events.Event):
+    hops: int
+
+
+class Ping(commands.Command):
+    hops: int
+
+
+def test_cascade_stops_at_max_depth():
+    uow = FakeUnitOfWork()
+    handled = []
+
+    def handle_ping(message):
+        handled.append(message.hops)
+        uow.new_events.append(Pinged(hops=message.hops + 1))
+
+    bus = message_bus.MessageBus(
+        uow=uow,
+        event_handlers={Pinged: [handle_ping]},
+        command_handlers={Ping: handle_ping},
+        max_cascade_depth=3,
+    )
+
+    bus.handle(Ping(hops=0))
+
+    assert handled == [0, 1, 2, 3]
+
+
+def test_concurrent_handle_calls_keep_their_own_queue():
+    handled = []
+
+    class TaskUnitOfWork:
+        def __init__(self):
+            self.new_events = {}
+
+        def collect_new_events(self):
+            return self.new_events.pop(asyncio.current_task(), [])
+
+    uow = TaskUnitOfWork()
+
+    async def handle_ping(message):
+        await asyncio.sleep(0)
+        handled.append(message.hops)
+        if message.hops % 10 < 2:
+            uow.new_events[asyncio.current_task()] = [Pinged(hops=message.hops + 1)]
+
+    bus = message_bus.AsyncMessageBus(
+        uow=uow,
+        event_handlers={Pinged: [handle_ping]},
+        command_handlers={Ping: handle_ping},
+    )
+
+    async def run():
+        await asyncio.gather(bus.handle(Ping(hops=0)), bus.handle(Ping(hops=10)))
+
+    asyncio.run(run())
+
+    assert sorted(handled) == [0, 1, 2, 10, 11, 12]
+
+
+class PingedTwice(Pinged):
+    pass
+
+
+def test_dispatch_table_resolves_subclasses_through_the_mro():
+    def handle_pinged(message):
+        pass
+
+    def handle_ping(message):
+        pass
+
+    table = message_bus.DispatchTable({Pinged: [handle_pinged], Ping: handle_ping})
+
+    assert table.get(Pinged) == (handle_pinged,)
+    assert table.get(PingedTwice) == (handle_pinged,)
+    assert table.get(Ping) == (handle_ping,)
+    assert table.get(events.Event) == ()
+
+
+def test_subclassed_event_reaches_base_class_handlers():
+    handled = []
+    bus = message_bus.MessageBus(
+        uow=FakeUnitOfWork(),
+        event_handlers={Pinged: [lambda message: handled.append(type(message))]},
+        command_handlers={},
+    )
+
+    bus.handle(PingedTwice(hops=0))
+
+    assert handled == [PingedTwice]
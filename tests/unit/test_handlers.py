@@ -1,16 +1,36 @@
 import pytest
-from typing import Type
-from flask_bcrypt import Bcrypt
+from typing import Any, Dict, List, Optional, Sequence, Type
+from passlib.context import CryptContext
+from sqlalchemy.sql import operators
 from user_service import bootstrap
-import pyotp
-import time
-from user_service.adapters import repository
+from user_service.adapters import mailer, password_hasher, repository
 from user_service.service_layer import unit_of_work
-from user_service.domains import models, commands
-from user_service.service_layer.handlers import event
+from user_service.domains import models, commands, events
+from user_service.service_layer.handlers import command
 from tests import random_refs
 
-bcrypt = Bcrypt()
+
+def matches(model: models.BaseModel, criterion) -> bool:
+    """Evaluate the comparisons and ``or_``/``and_`` criteria the handlers use."""
+    clauses = getattr(criterion, "clauses", None)
+    if clauses is not None:
+        results = [matches(model, clause) for clause in clauses]
+        return any(results) if criterion.operator is operators.or_ else all(results)
+    value = getattr(model, criterion.left.key)
+    if criterion.operator is operators.in_op:
+        return value in criterion.right.value
+    return criterion.operator(value, criterion.right.value)
+
+
+def matches_filters(model: models.BaseModel, **kwargs) -> bool:
+    return all(
+        (
+            getattr(model, key) in value
+            if isinstance(value, (list, tuple, set))
+            else getattr(model, key) == value
+        )
+        for key, value in kwargs.items()
+    )
 
 
 class FakeRepository(repository.AbstractRepository):
@@ -21,18 +41,51 @@ class FakeRepository(repository.AbstractRepository):
     def _add(self, model):
         self._models.add(model)
 
+    def _remove(self, model):
+        self._models.discard(model)
+
     def _get(
         self,
-        model: Type[models.BaseModel],
+        model_type: Type[models.BaseModel],
         *args,
         **kwargs,
-    ) -> Type[models.BaseModel]:
-        for m in self._models:
-            if isinstance(m, model) and all(
-                getattr(m, key) == value for key, value in kwargs.items()
-            ):
-                return m
-        return None
+    ) -> List[models.BaseModel]:
+        return [
+            m
+            for m in self._models
+            if isinstance(m, model_type)
+            and all(matches(m, criterion) for criterion in args)
+            and matches_filters(m, **kwargs)
+        ]
+
+    def _get_by_id(
+        self, model_type, id, for_update=False
+    ) -> Optional[models.BaseModel]:
+        return self._get_one(model_type, id=id)
+
+    def _delete(self, model_type, *args, **kwargs):
+        for m in self._get(model_type, *args, **kwargs):
+            self._models.discard(m)
+
+    def _get_one(self, model_type, *args, **kwargs) -> Optional[models.BaseModel]:
+        results = self._get(model_type, *args, **kwargs)
+        return results[0] if results else None
+
+    def _exists(self, model_type, *args, **kwargs) -> bool:
+        return bool(self._get(model_type, *args, **kwargs))
+
+    def _get_fields(
+        self, model_type, fields: Sequence[str], *args, limit=None, **kwargs
+    ) -> List[Dict[str, Any]]:
+        rows = [
+            {field: getattr(m, field) for field in fields}
+            for m in self._get(model_type, *args, **kwargs)
+        ]
+        return rows[:limit]
+
+    def _increment(self, model_type, field, amount, **kwargs):
+        for m in self._get(model_type, **kwargs):
+            setattr(m, field, getattr(m, field) + amount)
 
 
 class FakeUnitOfWork(unit_of_work.AbstractUnitOfWork):
@@ -50,197 +103,272 @@ class FakeUnitOfWork(unit_of_work.AbstractUnitOfWork):
         pass
 
 
-def bootstrap_test_app():
+class FakeMailer(mailer.AbstractMailer):
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, address: str, content: str):
+        self.send_sync(address, content)
+
+    def send_sync(self, address: str, content: str):
+        self.sent.append((address, content))
+
+
+hasher = password_hasher.PasswordHasher(
+    CryptContext(schemes=["bcrypt"], bcrypt__rounds=4), max_workers=1
+)
+
+
+@pytest.fixture
+def email_sender():
+    return FakeMailer()
+
+
+@pytest.fixture
+def bus(mappers, email_sender):
     return bootstrap.bootstrap(
         start_orm=False,
         uow=FakeUnitOfWork,
+        hasher=hasher,
+        email_sender=email_sender,
     )
 
 
+def random_register_data():
+    return {
+        "username": random_refs.random_username(),
+        "email": random_refs.random_email(),
+        "password": random_refs.random_valid_password(),
+        "first_name": None,
+        "last_name": None,
+        "backup_email": random_refs.random_email(),
+        "gender": None,
+        "date_of_birth": None,
+    }
+
+
+@pytest.fixture
+def data():
+    return random_register_data()
+
+
+@pytest.fixture
+def data2():
+    return random_register_data()
+
+
+def register_with_2fa(bus, email_sender, data) -> models.User:
+    bus.handle(commands.RegisterCommand(**data))
+    user = bus.uow.repo.get_one(models.User, email=data["email"])
+
+    bus.handle(commands.SetupTwoFactorAuthCommand(user_id=user.id))
+    _, otp_code = email_sender.sent[-1]
+    bus.handle(commands.VerifyTwoFactorAuthCommand(user_id=user.id, otp_code=otp_code))
+    return user
+
+
 class TestRegister:
-    def test_register(self, data):
-        bus = bootstrap_test_app()
+    def test_register(self, bus, data):
         bus.handle(commands.RegisterCommand(**data))
-        user = bus.uow.repo.get(models.User, email=data["email"])
+        user = bus.uow.repo.get_one(models.User, email=data["email"])
 
         assert user is not None
         assert user.username == data["username"]
         assert user.email == data["email"]
-        assert bcrypt.check_password_hash(user.password, data["password"])
+        assert hasher.verify_sync(data["password"], user.password)
 
-        profile = bus.uow.repo.get(models.Profile, user_id=user.id)
+        profile = bus.uow.repo.get_one(models.Profile, user_id=user.id)
         assert profile.backup_email == data["backup_email"]
         assert profile.gender == data["gender"]
         assert profile.date_of_birth == data["date_of_birth"]
 
-    def test_email_already_existed(self, data, data2):
-        bus = bootstrap_test_app()
+    def test_email_already_existed(self, bus, data, data2):
         bus.handle(commands.RegisterCommand(**data))
 
         data2["email"] = data["email"]
         with pytest.raises(
-            event.EmailExisted, match=f"Email {data2['email']} already existed"
+            command.EmailExisted, match=f"Email {data2['email']} already existed"
         ):
             bus.handle(commands.RegisterCommand(**data2))
 
-
-class TestEnableAndVerify2FA:
-    def test_enable_and_verify_2fa(self, data):
-        bus = bootstrap_test_app()
+    def test_username_already_existed(self, bus, data, data2):
         bus.handle(commands.RegisterCommand(**data))
 
-        results = bus.handle(commands.EnableTwoFactorAuthCommand(data["email"]))
-        otp_code = results[0]
-        assert otp_code is not None
-
-        bus.handle(commands.VerifyEnableTwoFactorAuthCommand(data["email"], otp_code))
-        user = bus.uow.repo.get(models.User, email=data["email"])
-
-        assert user.two_factor_auth_enabled == True
-
-    def test_enable_2fa_email_does_not_exist(self, data):
-        bus = bootstrap_test_app()
-        with pytest.raises(event.IncorrectCredentials, match="Email does not exist"):
-            bus.handle(commands.EnableTwoFactorAuthCommand(data["email"]))
+        data2["username"] = data["username"]
+        with pytest.raises(
+            command.UsernameExisted,
+            match=f"Username {data2['username']} already existed",
+        ):
+            bus.handle(commands.RegisterCommand(**data2))
 
-    def test_verify_2fa_email_does_not_exist(self, data):
-        bus = bootstrap_test_app()
+    def test_redelivered_registered_event_adds_one_profile(self, bus, data):
+        bus.handle(commands.RegisterCommand(**data))
+        user = bus.uow.repo.get_one(models.User, email=data["email"])
+        event = events.RegisteredEvent(
+            user_id=user.id,
+            first_name=None,
+            last_name=None,
+            backup_email=None,
+            gender=None,
+            date_of_birth=None,
+        )
 
-        otp_code = pyotp.TOTP(pyotp.random_base32()).now()
-        with pytest.raises(event.IncorrectCredentials, match="Email does not exist"):
-            bus.handle(
-                commands.VerifyEnableTwoFactorAuthCommand(data["email"], otp_code)
-            )
+        bus.handle(event)
+        bus.handle_events([event])
 
-    def test_verify_2fa_incorrect_code(self, data):
-        bus = bootstrap_test_app()
-        bus.handle(commands.RegisterCommand(**data))
+        assert len(bus.uow.repo.get(models.Profile, user_id=user.id)) == 1
 
-        otp_code = pyotp.TOTP(pyotp.random_base32()).now()
-        with pytest.raises(event.InvalidOTP, match="Invalid OTP code"):
-            bus.handle(
-                commands.VerifyEnableTwoFactorAuthCommand(data["email"], otp_code)
-            )
 
-        user = bus.uow.repo.get(models.User, email=data["email"])
+class TestSetupAndVerify2FA:
+    def test_setup_and_verify_2fa(self, bus, email_sender, data):
+        user = register_with_2fa(bus, email_sender, data)
 
-        assert user.two_factor_auth_enabled == False
+        assert email_sender.sent[-1][0] == data["email"]
+        assert user.two_factor_auth_enabled == True
 
-    def test_verify_2fa_expired_code(self, data):
-        bus = bootstrap_test_app()
+    def test_verify_2fa_incorrect_code(self, bus, email_sender, data):
         bus.handle(commands.RegisterCommand(**data))
+        user = bus.uow.repo.get_one(models.User, email=data["email"])
 
-        results = bus.handle(commands.EnableTwoFactorAuthCommand(data["email"]))
-        otp_code = results[0]
-
-        time.sleep(30)
-        with pytest.raises(event.InvalidOTP, match="Invalid OTP code"):
+        bus.handle(commands.SetupTwoFactorAuthCommand(user_id=user.id))
+        _, otp_code = email_sender.sent[-1]
+        incorrect_code = str((int(otp_code) + 1) % 1000000).zfill(6)
+        with pytest.raises(command.InvalidOTP, match="Invalid OTP code"):
             bus.handle(
-                commands.VerifyEnableTwoFactorAuthCommand(data["email"], otp_code)
+                commands.VerifyTwoFactorAuthCommand(
+                    user_id=user.id, otp_code=incorrect_code
+                )
             )
 
-        user = bus.uow.repo.get(models.User, email=data["email"])
-
         assert user.two_factor_auth_enabled == False
 
 
 class TestLogin:
-    def test_login(self, data):
-        bus = bootstrap_test_app()
-        bus.handle(commands.RegisterCommand(**data))
+    def test_login(self, bus, email_sender, data):
+        user = register_with_2fa(bus, email_sender, data)
 
-        results = bus.handle(commands.EnableTwoFactorAuthCommand(data["email"]))
-        otp_code = results[0]
+        principal = bus.handle(
+            commands.LoginCommand(username=data["username"], password=data["password"])
+        )
 
-        bus.handle(commands.VerifyEnableTwoFactorAuthCommand(data["email"], otp_code))
+        assert principal["id"] == user.id
+        assert principal["refresh_token"] is not None
+        assert bus.uow.repo.exists(models.RefreshToken, user_id=user.id)
 
-        results = bus.handle(commands.LoginCommand(data["email"], data["password"]))
+    def test_login_with_email(self, bus, email_sender, data):
+        user = register_with_2fa(bus, email_sender, data)
 
-        token = results[0]
-        assert token is not None
+        principal = bus.handle(
+            commands.LoginCommand(username=data["email"], password=data["password"])
+        )
 
-    def test_incorrect_email(self):
-        bus = bootstrap_test_app()
+        assert principal["id"] == user.id
 
+    def test_two_factor_auth_not_enabled(self, bus, data):
+        bus.handle(commands.RegisterCommand(**data))
+
+        with pytest.raises(command.TwoFactorAuthNotEnabled):
+            bus.handle(
+                commands.LoginCommand(
+                    username=data["username"], password=data["password"]
+                )
+            )
+
+    def test_incorrect_username(self, bus):
         with pytest.raises(
-            event.IncorrectCredentials, match="Incorrect email or password"
+            command.IncorrectCredentials, match="Incorrect username or password"
         ):
             bus.handle(
                 commands.LoginCommand(
-                    random_refs.random_email(), random_refs.random_valid_password()
+                    username=random_refs.random_username(),
+                    password=random_refs.random_valid_password(),
                 )
             )
 
-    def test_incorrect_password(self, data):
-        bus = bootstrap_test_app()
-
+    def test_incorrect_password(self, bus, data):
         bus.handle(commands.RegisterCommand(**data))
 
         with pytest.raises(
-            event.IncorrectCredentials, match="Incorrect email or password"
+            command.IncorrectCredentials, match="Incorrect username or password"
         ):
             bus.handle(
                 commands.LoginCommand(
-                    data["email"], random_refs.random_valid_password()
+                    username=data["username"],
+                    password=random_refs.random_valid_password(),
                 )
             )
 
 
-class TestGetUser:
-    def test_get_user(self, data):
-        bus = bootstrap_test_app()
-
-        bus.handle(commands.RegisterCommand(**data))
-        results = bus.handle(commands.EnableTwoFactorAuthCommand(data["email"]))
-        otp_code = results[0]
-
-        bus.handle(commands.VerifyEnableTwoFactorAuthCommand(data["email"], otp_code))
-
-        results = bus.handle(commands.LoginCommand(data["email"], data["password"]))
-        user_id, token = results[0]
-        user = bus.uow.repo.get(models.User, email=data["email"])
-
-        results = bus.handle(commands.GetUserCommand(user_id, token))
-
-        user_info = results[0]
-        assert user_info == {"username": user.username, "email": user.email}
-
-
 class TestResetPassword:
-    def test_reset_password(self, data):
-        bus = bootstrap_test_app()
-
+    def test_reset_password(self, bus, email_sender, data):
         bus.handle(commands.RegisterCommand(**data))
-        results = bus.handle(
-            commands.ResetPasswordCommand(data["email"], data["username"])
+        bus.handle(
+            commands.ResetPasswordCommand(
+                email=data["email"], username=data["username"]
+            )
         )
 
-        new_password = results[0]
-        user = bus.uow.repo.get(models.User, email=data["email"])
-
-        assert bcrypt.check_password_hash(user.password, new_password)
+        address, new_password = email_sender.sent[-1]
+        user = bus.uow.repo.get_one(models.User, email=data["email"])
 
-    def test_incorrect_email(self):
-        bus = bootstrap_test_app()
+        assert address == data["email"]
+        assert hasher.verify_sync(new_password, user.password)
+        assert user.token_version == 1
 
+    def test_incorrect_email(self, bus):
         with pytest.raises(
-            event.IncorrectCredentials, match="Incorrect email or username"
+            command.IncorrectCredentials, match="Incorrect email or username"
         ):
             bus.handle(
                 commands.ResetPasswordCommand(
-                    random_refs.random_email(), random_refs.random_username()
+                    email=random_refs.random_email(),
+                    username=random_refs.random_username(),
                 )
             )
 
-    def test_incorrect_username(self, data):
-        bus = bootstrap_test_app()
+    def test_incorrect_username(self, bus, data):
         bus.handle(commands.RegisterCommand(**data))
 
         with pytest.raises(
-            event.IncorrectCredentials, match="Incorrect email or username"
+            command.IncorrectCredentials, match="Incorrect email or username"
         ):
             bus.handle(
                 commands.ResetPasswordCommand(
-                    data["email"], random_refs.random_username()
+                    email=data["email"], username=random_refs.random_username()
                 )
             )
+
+
+class TestFriendRequest:
+    def test_accept_friend_request(self, bus, data, data2):
+        bus.handle(commands.RegisterCommand(**data))
+        bus.handle(commands.RegisterCommand(**data2))
+        sender = bus.uow.repo.get_one(models.User, email=data["email"])
+        receiver = bus.uow.repo.get_one(models.User, email=data2["email"])
+
+        bus.handle(
+            commands.FriendRequestCommand(sender_id=sender.id, receiver_id=receiver.id)
+        )
+        friend_request = bus.uow.repo.get_one(models.FriendRequest, sender_id=sender.id)
+        bus.handle(
+            commands.AcceptFriendRequestCommand(
+                friend_request={
+                    "id": friend_request.id,
+                    "sender_id": sender.id,
+                    "receiver_id": receiver.id,
+                }
+            )
+        )
+
+        profiles = bus.uow.repo.get(models.Profile, user_id=[sender.id, receiver.id])
+        assert [profile.friends for profile in profiles] == [1, 1]
+        assert bus.uow.repo.exists(
+            models.Friend, sender_id=sender.id, receiver_id=receiver.id
+        )
+        assert bus.uow.repo.get_by_id(models.FriendRequest, friend_request.id) is None
+
+        bus.handle_delivered(
+            events.AcceptedFriendRequestEvent(friend_request_id=friend_request.id)
+        )
+
+        assert [profile.friends for profile in profiles] == [1, 1]
@@ -0,0 +1,42 @@
+import asyncio
+
+from user_service.adapters import mailer
+
+
+def test_messages_are_written_in_the_background(tmp_path):
+    file_mailer = mailer.FileMailer(str(tmp_path), flush_interval=0)
+
+    async def run():
+        await file_mailer.send("alice@example.com", "123456")
+        await file_mailer.send("bob@example.com", "654321")
+        await file_mailer.send("alice@example.com", "New password")
+        assert not (tmp_path / "alice@example.com.txt").exists()
+        await file_mailer.close()
+
+    asyncio.run(run())
+
+    assert (tmp_path / "alice@example.com.txt").read_text() == "123456\nNew password\n"
+    assert (tmp_path / "bob@example.com.txt").read_text() == "654321\n"
+
+
+def test_batches_are_limited_in_size(tmp_path):
+    file_mailer = mailer.FileMailer(str(tmp_path), batch_size=2, flush_interval=0)
+    batches = []
+    write = file_mailer._write
+    file_mailer._write = lambda messages: batches.append(messages) or write(messages)
+
+    async def run():
+        for code in range(5):
+            await file_mailer.send("alice@example.com", code)
+        await file_mailer.close()
+
+    asyncio.run(run())
+
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert (tmp_path / "alice@example.com.txt").read_text() == "0\n1\n2\n3\n4\n"
+
+
+def test_send_sync_writes_immediately(tmp_path):
+    mailer.FileMailer(str(tmp_path)).send_sync("alice@example.com", "123456")
+
+    assert (tmp_path / "alice@example.com.txt").read_text() == "123456\n"
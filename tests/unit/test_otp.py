@@ -0,0 +1,30 @@
+import pyotp
+
+from user_service.adapters import otp
+
+
+def test_totp_instances_are_cached_per_secret():
+    service = otp.OTPService(maxsize=10)
+    secret = pyotp.random_base32()
+
+    assert service._totp(secret) is service._totp(secret)
+    assert service.now(secret) == pyotp.TOTP(secret).now()
+
+
+def test_a_code_only_verifies_once():
+    service = otp.OTPService(maxsize=10)
+    secret = pyotp.random_base32()
+    code = service.now(secret)
+
+    assert service.verify(secret, code)
+    assert not service.verify(secret, code)
+
+
+def test_wrong_codes_are_not_remembered():
+    service = otp.OTPService(maxsize=10)
+    secret = pyotp.random_base32()
+    code = service.now(secret)
+    wrong_code = f"{(int(code) + 1) % 1000000:06d}"
+
+    assert not service.verify(secret, wrong_code)
+    assert service.verify(secret, code)
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+
+import pytest
+from passlib.context import CryptContext
+from passlib.registry import get_crypt_handler
+
+from user_service.adapters import password_hasher
+
+
+def fast_context():
+    return CryptContext(schemes=["bcrypt"], bcrypt__rounds=4)
+
+
+class TestPasswordHasher:
+    def test_hash_and_verify(self):
+        hasher = password_hasher.PasswordHasher(context=fast_context(), max_workers=2)
+
+        async def run():
+            hashed = await hasher.hash("Secret123!")
+            return (
+                await hasher.verify("Secret123!", hashed),
+                await hasher.verify("Wrong123!", hashed),
+            )
+
+        assert asyncio.run(run()) == (True, False)
+        hasher.shutdown()
+
+    def test_saturated_pool_rejects_jobs(self):
+        hasher = password_hasher.PasswordHasher(
+            context=fast_context(), max_workers=1, max_pending=0
+        )
+        release = threading.Event()
+        blocked = hasher._submit(release.wait)
+
+        with pytest.raises(password_hasher.PasswordHasherSaturated):
+            hasher.hash_sync("Secret123!")
+
+        release.set()
+        blocked.result()
+        hasher.shutdown()
+
+    def test_blocking_calls_are_refused_on_an_event_loop(self):
+        hasher = password_hasher.PasswordHasher(context=fast_context(), max_workers=1)
+
+        async def run():
+            with pytest.raises(RuntimeError):
+                hasher.hash_sync("Secret123!")
+            with pytest.raises(RuntimeError):
+                hasher.verify_sync("Secret123!", hasher.context.hash("Secret123!"))
+
+        asyncio.run(run())
+        assert hasher.verify_sync("Secret123!", hasher.hash_sync("Secret123!"))
+        hasher.shutdown()
+
+
+def hash_settings(**kwargs):
+    settings = dict(
+        scheme="bcrypt",
+        rounds=None,
+        target_ms=None,
+        min_rounds=4,
+        max_rounds=6,
+        argon2_memory_cost=1024,
+        argon2_time_cost=1,
+        argon2_parallelism=1,
+    )
+    settings.update(kwargs)
+    return settings
+
+
+class TestHashPolicy:
+    def test_calibration_is_clamped_to_the_allowed_rounds(self):
+        assert password_hasher.calibrate_bcrypt_rounds(0, 5, 7, sample_rounds=4) == 5
+        assert password_hasher.calibrate_bcrypt_rounds(60, 5, 7, sample_rounds=4) == 7
+
+    def test_weaker_hashes_are_rehashed_on_verify(self):
+        hasher = password_hasher.PasswordHasher(
+            context=password_hasher.make_context(hash_settings(rounds=5)),
+            max_workers=1,
+        )
+        weak = fast_context().hash("Secret123!")
+        strong = CryptContext(schemes=["bcrypt"], bcrypt__rounds=6).hash("Secret123!")
+
+        verified, new_hash = hasher.verify_and_update_sync("Secret123!", weak)
+        assert verified and new_hash.startswith("$2b$05$")
+        assert hasher.verify_and_update_sync("Secret123!", strong) == (True, None)
+        assert hasher.verify_and_update_sync("Wrong123!", weak) == (False, None)
+        hasher.shutdown()
+
+    def test_argon2_policy_keeps_bcrypt_hashes_verifiable(self):
+        pytest.importorskip("argon2")
+        context = password_hasher.make_context(hash_settings(scheme="argon2"))
+
+        assert context.default_scheme() == "argon2"
+        assert context.needs_update(fast_context().hash("Secret123!"))
+
+    def test_unknown_scheme_is_rejected(self):
+        with pytest.raises(ValueError):
+            password_hasher.make_context(hash_settings(scheme="md5_crypt"))
+
+    def test_scheme_without_a_backend_is_rejected(self, monkeypatch):
+        argon2 = get_crypt_handler("argon2")
+        monkeypatch.setattr(argon2, "has_backend", lambda *args: False)
+
+        with pytest.raises(ValueError, match="install the argon2 extra"):
+            password_hasher.make_context(hash_settings(scheme="argon2"))
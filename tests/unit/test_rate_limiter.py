@@ -0,0 +1,173 @@
+import asyncio
+
+import pytest
+
+from user_service import bootstrap
+from user_service.adapters import rate_limiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    """Just enough of the Redis sorted set commands and MULTI pipelines."""
+
+    def __init__(self):
+        self.sets = {}
+        self.round_trips = 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def delete(self, key):
+        self.round_trips += 1
+        self.sets.pop(key, None)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def zremrangebyscore(self, key, min, max):
+        def run(sets):
+            members = sets.get(key, {})
+            for member, score in list(members.items()):
+                if min <= score <= max:
+                    del members[member]
+
+        self.commands.append(run)
+
+    def zadd(self, key, mapping):
+        self.commands.append(lambda sets: sets.setdefault(key, {}).update(mapping))
+
+    def expire(self, key, seconds):
+        self.commands.append(lambda sets: True)
+
+    def zcard(self, key):
+        self.commands.append(lambda sets: len(sets.get(key, {})))
+
+    async def execute(self):
+        self.client.round_trips += 1
+        return [command(self.client.sets) for command in self.commands]
+
+
+def make_limiter(clock, **kwargs):
+    settings = dict(
+        window=60,
+        max_attempts_per_ip=3,
+        max_failures_per_name=2,
+        lock_after_failures=3,
+        lock_window=3600,
+    )
+    settings.update(kwargs)
+    return rate_limiter.LoginRateLimiter(
+        rate_limiter.InMemoryRateLimitBackend(clock=clock), **settings
+    )
+
+
+def test_hits_slide_out_of_the_window():
+    clock = FakeClock()
+    backend = rate_limiter.InMemoryRateLimitBackend(clock=clock)
+
+    assert backend.hit_sync("key", window=10) == 1
+    clock.now = 5
+    assert backend.hit_sync("key", window=10) == 2
+    clock.now = 10
+    assert backend.count_sync("key", window=10) == 1
+    clock.now = 15
+    assert backend.count_sync("key", window=10) == 0
+
+
+def test_backend_evicts_least_recently_hit_keys():
+    backend = rate_limiter.InMemoryRateLimitBackend(maxsize=2)
+    for key in ("a", "b", "c"):
+        backend.hit_sync(key, window=60)
+
+    assert backend.count_sync("a", window=60) == 0
+    assert backend.count_sync("c", window=60) == 1
+
+
+def test_check_rejects_an_ip_over_its_attempts():
+    limiter = make_limiter(FakeClock())
+
+    async def run():
+        for name in ("a", "b", "c"):
+            await limiter.check(name, "10.0.0.1")
+        with pytest.raises(rate_limiter.TooManyAttempts):
+            await limiter.check("d", "10.0.0.1")
+        await limiter.check("d", "10.0.0.2")
+
+    asyncio.run(run())
+
+
+def test_check_rejects_a_name_over_its_failures_until_the_window_passes():
+    clock = FakeClock()
+    limiter = make_limiter(clock)
+
+    async def run():
+        await limiter.record_failure("Alice")
+        await limiter.record_failure("alice")
+        with pytest.raises(rate_limiter.TooManyAttempts) as e:
+            await limiter.check("alice")
+        assert e.value.retry_after == 60
+
+        clock.now = 60
+        await limiter.check("alice")
+
+    asyncio.run(run())
+
+
+def test_record_failure_reports_when_to_lock_and_success_resets():
+    limiter = make_limiter(FakeClock())
+
+    async def run():
+        assert not await limiter.record_failure("alice", "user-id")
+        assert not await limiter.record_failure("alice", "user-id")
+        await limiter.record_success("alice", "user-id")
+        assert not await limiter.record_failure("alice", "user-id")
+        assert not await limiter.record_failure("alice", "user-id")
+        assert await limiter.record_failure("alice", "user-id")
+
+    asyncio.run(run())
+
+
+def test_locking_can_be_disabled():
+    limiter = make_limiter(FakeClock(), lock_after_failures=0)
+
+    assert not any(limiter.record_failure_sync("alice", "user-id") for _ in range(10))
+
+
+def test_redis_backend_counts_each_hit_in_one_round_trip():
+    client = FakeRedis()
+    backend = rate_limiter.RedisRateLimitBackend(client)
+
+    async def run():
+        hits = [await backend.hit("key", window=60) for _ in range(3)]
+        return hits, await backend.count("key", window=60)
+
+    hits, count = asyncio.run(run())
+
+    assert hits == [1, 2, 3]
+    assert count == 3
+    assert client.round_trips == 4
+
+
+def test_sync_bus_refuses_an_async_only_backend():
+    limiter = rate_limiter.LoginRateLimiter(
+        rate_limiter.RedisRateLimitBackend(FakeRedis())
+    )
+
+    with pytest.raises(ValueError, match="RedisRateLimitBackend is async only"):
+        bootstrap.bootstrap(start_orm=False, uow=object(), login_limiter=limiter)
@@ -0,0 +1,41 @@
+import json
+from datetime import datetime
+
+from user_service.entrypoints.rest import responses
+from user_service.entrypoints.schemas import friend_schemas
+
+FRIEND_REQUESTS = [
+    {
+        "id": f"request-{i}",
+        "sender_id": f"sender-{i}",
+        "receiver_id": "receiver",
+        "created_time": datetime(2024, 1, 2, 3, 4, 5, i),
+        "updated_time": datetime(2024, 1, 2, 3, 4, 5),
+    }
+    for i in range(3)
+]
+
+
+def test_trusted_responses_match_the_validated_response_model(monkeypatch):
+    monkeypatch.setattr(responses, "VALIDATE_TRUSTED", False)
+
+    response = responses.trusted_response(
+        friend_schemas.FriendRequestsResponse, friend_requests=FRIEND_REQUESTS
+    )
+
+    assert isinstance(response, responses.DefaultResponse)
+    assert json.loads(response.body) == json.loads(
+        friend_schemas.FriendRequestsResponse(
+            friend_requests=FRIEND_REQUESTS
+        ).model_dump_json()
+    )
+
+
+def test_trusted_responses_are_validated_when_configured(monkeypatch):
+    monkeypatch.setattr(responses, "VALIDATE_TRUSTED", True)
+
+    response = responses.trusted_response(
+        friend_schemas.FriendRequestsResponse, friend_requests=FRIEND_REQUESTS
+    )
+
+    assert isinstance(response, friend_schemas.FriendRequestsResponse)
@@ -0,0 +1,109 @@
+import base64
+import json
+from datetime import timedelta
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+
+from user_service.adapters import signing_keys
+
+
+def public_pem(key: signing_keys.SigningKey) -> bytes:
+    return key.public_key.public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+
+
+@pytest.mark.parametrize("algorithm", ["EdDSA", "ES256"])
+def test_tokens_carry_the_kid_and_verify_against_the_published_jwk(algorithm):
+    key = signing_keys.SigningKey.generate(algorithm)
+    key_set = signing_keys.SigningKeySet([key], issuer="user-service")
+
+    token = key_set.encode({"sub": "user-id"}, timedelta(minutes=1))
+
+    assert jwt.get_unverified_header(token)["kid"] == key.kid
+    (jwk,) = json.loads(key_set.jwks)["keys"]
+    assert "d" not in jwk
+    claims = jwt.decode(
+        token,
+        jwt.PyJWK(jwk).key,
+        algorithms=[jwk["alg"]],
+        issuer="user-service",
+    )
+    assert claims["sub"] == "user-id"
+
+
+def test_kid_is_stable_across_loads():
+    key = signing_keys.SigningKey.generate()
+
+    assert signing_keys.SigningKey.from_pem(public_pem(key)).kid == key.kid
+
+
+def test_rotated_out_keys_still_verify_but_no_longer_sign():
+    old_key = signing_keys.SigningKey.generate("ES256")
+    new_key = signing_keys.SigningKey.generate()
+    old_set = signing_keys.SigningKeySet([old_key])
+    rotated_set = signing_keys.SigningKeySet(
+        [new_key, signing_keys.SigningKey.from_pem(public_pem(old_key))]
+    )
+
+    old_token = old_set.encode({"sub": "user-id"}, timedelta(minutes=1))
+    new_token = rotated_set.encode({"sub": "user-id"}, timedelta(minutes=1))
+
+    assert rotated_set.decode(old_token)["sub"] == "user-id"
+    assert jwt.get_unverified_header(new_token)["kid"] == new_key.kid
+    assert old_set.decode(new_token) is None
+    assert [jwk["kid"] for jwk in json.loads(rotated_set.jwks)["keys"]] == [
+        new_key.kid,
+        old_key.kid,
+    ]
+
+
+def test_tokens_from_other_issuers_or_without_a_kid_are_rejected():
+    key = signing_keys.SigningKey.generate()
+    key_set = signing_keys.SigningKeySet([key], issuer="user-service")
+    other_issuer = signing_keys.SigningKeySet([key], issuer="someone-else")
+
+    foreign = other_issuer.encode({"sub": "user-id"}, timedelta(minutes=1))
+    unkeyed = jwt.encode({"sub": "user-id"}, "s" * 32, algorithm="HS256")
+
+    assert key_set.decode(foreign) is None
+    assert key_set.decode(unkeyed) is None
+
+
+def test_a_public_key_cannot_be_the_signing_key():
+    key = signing_keys.SigningKey.from_pem(
+        public_pem(signing_keys.SigningKey.generate())
+    )
+
+    with pytest.raises(ValueError):
+        signing_keys.SigningKeySet([key])
+
+
+def test_tokens_with_a_kid_that_is_not_a_string_are_rejected():
+    key = signing_keys.SigningKey.generate()
+    key_set = signing_keys.SigningKeySet([key])
+    signed = key_set.encode({"sub": "user-id"}, timedelta(minutes=1))
+    # PyJWT refuses to encode such a header, so swap it into a signed token.
+    header = base64.urlsafe_b64encode(
+        json.dumps({"alg": key.algorithm, "kid": [key.kid]}).encode()
+    ).rstrip(b"=")
+    token = ".".join([header.decode(), *signed.split(".")[1:]])
+
+    assert key_set.decode(token) is None
+
+
+def test_without_signing_keys_startup_fails_unless_ephemeral_keys_are_allowed(
+    monkeypatch,
+):
+    monkeypatch.delenv("JWT_SIGNING_KEYS", raising=False)
+    monkeypatch.delenv("JWT_ALLOW_EPHEMERAL_KEY", raising=False)
+
+    with pytest.raises(ValueError, match="JWT_SIGNING_KEYS is not set"):
+        signing_keys.SigningKeySet.from_config()
+
+    monkeypatch.setenv("JWT_ALLOW_EPHEMERAL_KEY", "true")
+    key_set = signing_keys.SigningKeySet.from_config()
+
+    assert key_set.active.private_key is not None
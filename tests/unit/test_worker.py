@@ -0,0 +1,98 @@
+import asyncio
+
+from user_service.adapters import broker
+from user_service.domains import events
+from user_service.service_layer import message_bus, worker
+
+
+class FakeUnitOfWork:
+    def collect_new_events(self):
+        return []
+
+
+class AcceptingHandler:
+    """Handles friend request events on a real bus, failing the first times."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.handled = []
+
+    async def __call__(self, event):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("handler failed")
+        self.handled.append(event.friend_request_id)
+
+
+def make_bus(failures=0):
+    handler = AcceptingHandler(failures)
+    bus = message_bus.AsyncMessageBus(
+        uow=FakeUnitOfWork(),
+        event_handlers={events.AcceptedFriendRequestEvent: [handler]},
+        command_handlers={},
+    )
+    return bus, handler
+
+
+def accepted(friend_request_id):
+    return events.AcceptedFriendRequestEvent(friend_request_id=friend_request_id)
+
+
+def test_worker_acks_handled_events():
+    in_memory = broker.InMemoryBroker()
+    bus, handler = make_bus()
+    event_worker = worker.EventWorker(in_memory, bus, concurrency=2)
+
+    async def run():
+        await in_memory.publish_many([accepted("a"), accepted("b")])
+        await event_worker.process_one()
+        await event_worker.process_one()
+
+    asyncio.run(run())
+
+    assert sorted(handler.handled) == ["a", "b"]
+
+
+def test_worker_redelivers_failed_events_until_max_attempts():
+    in_memory = broker.InMemoryBroker()
+    bus, handler = make_bus(failures=1)
+    event_worker = worker.EventWorker(in_memory, bus, concurrency=1, max_attempts=3)
+
+    async def run():
+        await in_memory.publish(accepted("a"))
+        await event_worker.process_one()
+        await event_worker.process_one()
+
+    asyncio.run(run())
+
+    assert handler.handled == ["a"]
+
+
+def test_worker_drops_event_after_max_attempts():
+    in_memory = broker.InMemoryBroker()
+    bus, handler = make_bus(failures=5)
+    event_worker = worker.EventWorker(in_memory, bus, concurrency=1, max_attempts=2)
+
+    async def run():
+        await in_memory.publish(accepted("a"))
+        await event_worker.process_one()
+        await event_worker.process_one()
+        return in_memory._queue.qsize()
+
+    assert asyncio.run(run()) == 0
+    assert handler.handled == []
+
+
+def test_ack_before_handling_does_not_redeliver():
+    in_memory = broker.InMemoryBroker()
+    bus, _ = make_bus(failures=1)
+    event_worker = worker.EventWorker(
+        in_memory, bus, concurrency=1, ack_mode=worker.ACK_BEFORE_HANDLING
+    )
+
+    async def run():
+        await in_memory.publish(accepted("a"))
+        await event_worker.process_one()
+        return in_memory._queue.qsize()
+
+    assert asyncio.run(run()) == 0